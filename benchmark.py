@@ -0,0 +1,951 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import tracemalloc
+
+import numpy as np
+
+import instrument
+import processing
+import ransac
+import simulate
+import utils
+
+from lidar import LidarModel, get_default_model, get_rig_models
+
+from constants import *
+
+
+# Sensor azimuth steps (degrees), cones per square meter of the crop
+# rectangle and range noise (meters) of the synthetic frames
+RESOLUTIONS = (0.072, 0.036, 0.018)
+CONE_DENSITIES = (0.05, 0.2)
+NOISE_LEVELS = (0.0003, 0.03)
+
+REPETITIONS = 30
+
+BASELINE_FILE = "benchmark_baseline.json"
+OUTPUT_FILE = "benchmark.json"
+
+# A stage regresses when its median (or peak memory) grows by more than the
+# relative tolerance and by more than the absolute floor (timer noise and the
+# few allocations of the small stages)
+REGRESSION_TOLERANCE = 0.25
+REGRESSION_FLOOR_MS = 0.05
+REGRESSION_FLOOR_KIB = 16.0
+
+# Ground of the simulated laps: planes ax + by + cz + d = 0 in rows, the
+# ground is their upper envelope (see simulate.ground_heights)
+SURFACES = {
+    "flat": None,
+    "ramp": np.array([[0.0, 0.0, 1.0, 0.0], [0.0, -0.05, 1.0, 0.75]]),
+    "valley": np.array(
+        [[0.0, 0.0, 1.0, 0.0], [0.04, 0.0, 1.0, 0.8], [0.0, -0.03, 1.0, 0.9]]
+    )
+}
+
+# Center line indexes between two frames of a lap
+LAP_STEP = 10
+
+# Largest horizontal distance between a detection and its cone
+MATCH_DISTANCE = 0.3
+
+DETECTION_MODES = ("ransac", "scanline")
+
+# Stages recorded by instrument during processing (sample, planes and score
+# are the parts of ransac.find_floor), then the whole call
+STAGES = ("crop", "ransac", "sample", "planes", "score", "dbscan", "centroids", "processing")
+
+
+def place_cones(density: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Scatter cones uniformly over the crop rectangle.
+
+    Args:
+        density (float): cones per square meter.
+        rng (np.random.Generator): source of the positions.
+
+    Returns:
+        np.ndarray: cones with 2D coordinates in rows.
+    """
+
+    area = (MAXIMUM_X - MINIMUM_X) * (MAXIMUM_Y - MINIMUM_Y)
+    count = max(1, round(density * area))
+
+    return np.column_stack((
+        rng.uniform(MINIMUM_X + 1.0, MAXIMUM_X, count),
+        rng.uniform(MINIMUM_Y, MAXIMUM_Y, count)
+    ))
+
+
+def make_frame(
+    resolution: float, density: float, noise: float, seed: int = 0
+) -> tuple:
+    """
+    Simulate a frame of the benchmark grid.
+
+    Args:
+        resolution (float): azimuth step of the sensor in degrees.
+        density (float): cones per square meter.
+        noise (float): standard deviation of the range noise.
+        seed (int, optional): seed of the cones and of the noise. Defaults to 0.
+
+    Returns:
+        tuple: point cloud in LiDAR frame and the simulated cones.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    model = LidarModel(
+        angular_resolution=np.deg2rad(resolution), distance_uncertainty=noise
+    )
+
+    cones = place_cones(density, rng)
+    point_cloud = simulate.generate_point_cloud(np.zeros(4), cones, rng, model)
+
+    # Sensor captures are not ordered like the simulator output
+    rng.shuffle(point_cloud)
+
+    return point_cloud, cones
+
+
+def summarize_times(times: list) -> dict:
+    """
+    Args:
+        times (list): latencies in milliseconds.
+
+    Returns:
+        dict: {"median_ms", "p95_ms"}.
+    """
+
+    return {
+        "median_ms": float(np.median(times)),
+        "p95_ms": float(np.percentile(times, 95))
+    }
+
+
+def time_processing(
+    point_cloud: np.ndarray, repetitions: int,
+    mode: str = "ransac", backend: str = CLUSTER_BACKEND
+) -> tuple:
+    """
+    Time processing.processing over many repetitions, with the split of
+    every stage taken from the instrument frame records, then measure the
+    peak memory of every stage in one more call traced by tracemalloc (the
+    tracing slows the calls down too much to time them).
+
+    Args:
+        point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+        repetitions (int): number of timed calls.
+
+        mode (str, optional): detection mode. Defaults to "ransac".
+        backend (str, optional): clustering engine. Defaults to CLUSTER_BACKEND.
+
+    Returns:
+        tuple: {"median_ms", "p95_ms", "peak_kib"} of each stage of STAGES
+            and the counters of the last call.
+    """
+
+    def run() -> np.ndarray:
+        # Same hypotheses on every repetition
+        np.random.seed(0)
+        return processing.processing(point_cloud, mode, backend=backend)
+
+    run()   # Warm up caches and lazy imports
+
+    sink = instrument.MemorySink()
+    instrument.enable(sink)
+
+    try:
+        for _ in range(repetitions):
+            with instrument.frame():
+                run()
+    finally:
+        instrument.disable()
+
+    records = [record for record in sink.records if "total_ms" in record]
+
+    stages = {
+        name: summarize_times([record["stages"].get(name, 0.0) for record in records])
+        for name in STAGES[:-1]
+    }
+    stages["processing"] = summarize_times([record["total_ms"] for record in records])
+
+    sink = instrument.MemorySink()
+    instrument.enable(sink, memory=True)
+    tracemalloc.start()
+
+    try:
+        with instrument.frame(), instrument.stage("processing"):
+            run()
+    finally:
+        tracemalloc.stop()
+        instrument.disable()
+
+    peaks = sink.records[-1]["peak_kib"]
+
+    for (name, timing) in stages.items():
+        timing["peak_kib"] = peaks.get(name, 0.0)
+
+    return stages, records[-1]["counters"]
+
+
+def bench_scenario(
+    resolution: float, density: float, noise: float,
+    repetitions: int = REPETITIONS, backend: str = CLUSTER_BACKEND
+) -> dict:
+    """
+    Time the detection (RANSAC mode) and each of its stages on one
+    synthetic frame.
+
+    Args:
+        resolution (float): azimuth step of the sensor in degrees.
+        density (float): cones per square meter.
+        noise (float): standard deviation of the range noise.
+
+        repetitions (int, optional): timed calls. Defaults to REPETITIONS.
+        backend (str, optional): clustering engine. Defaults to CLUSTER_BACKEND.
+
+    Returns:
+        dict: description of the scenario and the timings of each stage.
+    """
+
+    point_cloud, cones = make_frame(resolution, density, noise)
+
+    stages, counters = time_processing(point_cloud, repetitions, "ransac", backend)
+
+    return {
+        "name": f"res{resolution:g}_cones{density:g}_noise{noise:g}",
+        "resolution_deg": resolution,
+        "cone_density": density,
+        "noise": noise,
+        "points": len(point_cloud),
+        "cropped": counters.get("cropped", 0),
+        "off_ground": counters.get("off_ground", 0),
+        "cones": len(cones),
+        "clusters": counters.get("clusters", 0),
+        "stages": stages
+    }
+
+
+def run_benchmark(
+    resolutions: tuple = RESOLUTIONS, densities: tuple = CONE_DENSITIES,
+    noise_levels: tuple = NOISE_LEVELS, repetitions: int = REPETITIONS,
+    backend: str = CLUSTER_BACKEND
+) -> dict:
+    """
+    Time the detection stages over the whole grid of synthetic frames.
+
+    Args:
+        resolutions (tuple, optional): azimuth steps in degrees. Defaults to RESOLUTIONS.
+        densities (tuple, optional): cones per square meter. Defaults to CONE_DENSITIES.
+        noise_levels (tuple, optional): range noise levels. Defaults to NOISE_LEVELS.
+
+        repetitions (int, optional): timed calls per stage. Defaults to REPETITIONS.
+        backend (str, optional): clustering engine. Defaults to CLUSTER_BACKEND.
+
+    Returns:
+        dict: {"environment", "settings", "scenarios"} ready to be stored as JSON.
+    """
+
+    scenarios = [
+        bench_scenario(resolution, density, noise, repetitions, backend)
+        for (resolution, density, noise)
+        in itertools.product(resolutions, densities, noise_levels)
+    ]
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S")
+        },
+        "settings": {
+            "repetitions": repetitions,
+            "backend": backend,
+            "ransac_mode": RANSAC_MODE,
+            "num_planes": NUM_PLANES,
+            "downsample_size": DOWNSAMPLE_SIZE
+        },
+        "scenarios": scenarios
+    }
+
+
+def compare(
+    results: dict, baseline: dict,
+    tolerance: float = REGRESSION_TOLERANCE, floor_ms: float = REGRESSION_FLOOR_MS,
+    floor_kib: float = REGRESSION_FLOOR_KIB
+) -> list:
+    """
+    Find the stages that got slower, or that use more memory, than in the baseline.
+    Scenarios and stages missing from the baseline are not compared.
+
+    Args:
+        results (dict): returned by run_benchmark.
+        baseline (dict): previous results.
+
+        tolerance (float, optional): allowed relative growth.
+            Defaults to REGRESSION_TOLERANCE.
+
+        floor_ms (float, optional): time growth always allowed.
+            Defaults to REGRESSION_FLOOR_MS.
+
+        floor_kib (float, optional): memory growth always allowed.
+            Defaults to REGRESSION_FLOOR_KIB.
+
+    Returns:
+        list: regressions {"scenario", "stage", "metric", "baseline", "current"}.
+    """
+
+    reference = {scenario["name"]: scenario for scenario in baseline["scenarios"]}
+    regressions = []
+
+    for scenario in results["scenarios"]:
+        if scenario["name"] not in reference:
+            continue
+
+        old_stages = reference[scenario["name"]]["stages"]
+
+        for (stage, current) in scenario["stages"].items():
+            if stage not in old_stages:
+                continue
+
+            old = old_stages[stage]
+
+            for metric in ("median_ms", "peak_kib"):
+                if metric not in old or metric not in current:
+                    continue
+
+                limit = old[metric] * (1 + tolerance)
+
+                if metric == "median_ms":
+                    limit = max(limit, old[metric] + floor_ms)
+                else:
+                    limit = max(limit, old[metric] + floor_kib)
+
+                if current[metric] > limit:
+                    regressions.append({
+                        "scenario": scenario["name"],
+                        "stage": stage,
+                        "metric": metric,
+                        "baseline": old[metric],
+                        "current": current[metric]
+                    })
+
+    return regressions
+
+
+def lap_frames(surface: np.ndarray = None, step: int = LAP_STEP, seed: int = 0):
+    """
+    Simulate a lap of the track over the given ground.
+
+    Args:
+        surface (np.ndarray, optional): ground planes. Defaults to None (flat).
+        step (int, optional): center line indexes between two frames.
+            Defaults to LAP_STEP.
+        seed (int, optional): base seed of the per frame noise. Defaults to 0.
+
+    Yields:
+        tuple: range image of the frame and its cones (in LiDAR frame) in rows.
+    """
+
+    model = get_default_model()
+    track = utils.load_track()
+
+    for index in range(0, len(track["center_line"]) - 1, step):
+        pose = utils.get_vehicle_pose(track, index)
+        cones = utils.query_cones(track, pose)
+
+        image = simulate.generate_range_image(
+            pose, cones, np.random.default_rng([seed, index]), model, surface
+        )
+
+        # Same sensor placement as the simulator
+        lidar = simulate.get_lidar_pose(pose, model, surface)
+
+        bases = np.column_stack((cones, simulate.ground_heights(cones, surface)))
+
+        cos = np.cos(lidar[3])
+        sin = np.sin(lidar[3])
+
+        rotmat = np.array(
+            [[cos, -sin, 0],
+             [sin,  cos, 0],
+             [  0,    0, 1]]
+        )
+
+        yield image, (bases - lidar[:3]) @ rotmat
+
+
+def rig_frames(
+    surface: np.ndarray = None, step: int = LAP_STEP, seed: int = 0, models: tuple = None
+):
+    """
+    Simulate a lap of the track seen by a multi LiDAR rig over the given ground.
+
+    Args:
+        surface (np.ndarray, optional): ground planes. Defaults to None (flat).
+        step (int, optional): center line indexes between two frames.
+            Defaults to LAP_STEP.
+        seed (int, optional): base seed of the per frame noise. Defaults to 0.
+        models (tuple, optional): sensor profile of each sensor, with its
+            extrinsics. Defaults to lidar.get_rig_models().
+
+    Yields:
+        tuple: point cloud of each sensor (in its LiDAR frame) and the
+            cones of the frame (in vehicle frame) in rows.
+    """
+
+    models = get_rig_models() if models is None else models
+    track = utils.load_track()
+
+    for index in range(0, len(track["center_line"]) - 1, step):
+        pose = utils.get_vehicle_pose(track, index)
+
+        cones = np.unique(
+            np.concatenate([utils.query_cones(track, pose, model) for model in models]), axis=0
+        )
+
+        point_clouds = simulate.generate_sensor_frames(
+            pose, cones, models, np.random.default_rng([seed, index]), surface
+        )
+
+        vehicle = np.array(pose[:3], dtype=float)
+        vehicle[2] = simulate.ground_heights(vehicle[np.newaxis, :2], surface)[0]
+
+        bases = np.column_stack((cones, simulate.ground_heights(cones, surface)))
+
+        cos = np.cos(pose[3])
+        sin = np.sin(pose[3])
+
+        rotmat = np.array(
+            [[cos, -sin, 0],
+             [sin,  cos, 0],
+             [  0,    0, 1]]
+        )
+
+        yield point_clouds, (bases - vehicle) @ rotmat
+
+
+def score_detections(centroids: np.ndarray, cones: np.ndarray) -> tuple:
+    """
+    Match the detections with the cones inside of the crop rectangle.
+
+    Args:
+        centroids (np.ndarray): detected cones in LiDAR frame.
+        cones (np.ndarray): every cone of the frame in LiDAR frame.
+
+    Returns:
+        tuple: number of cones inside of the crop rectangle, of those
+            detected, of detections far from every cone and the summed
+            horizontal error of the detected cones.
+    """
+
+    visible = ransac.crop_mask(cones)
+
+    if len(centroids) == 0 or len(cones) == 0:
+        return int(visible.sum()), 0, len(centroids), 0.0
+
+    deltas = centroids[:, np.newaxis, :2] - cones[np.newaxis, :, :2]
+    squared = np.einsum("ijk,ijk->ij", deltas, deltas)
+    close = squared <= MATCH_DISTANCE**2
+
+    detected = close.any(axis=0) & visible
+
+    return (
+        int(visible.sum()),
+        int(detected.sum()),
+        int((~close.any(axis=1)).sum()),
+        float(np.sqrt(squared.min(axis=0)[detected]).sum())
+    )
+
+
+def bench_modes(
+    surfaces: dict = SURFACES, modes: tuple = DETECTION_MODES, step: int = LAP_STEP
+) -> dict:
+    """
+    Compare the detection modes over simulated laps. The RANSAC mode gets the
+    shuffled flat cloud, the scan-line mode the range image of the same frame.
+
+    Args:
+        surfaces (dict, optional): ground of each lap. Defaults to SURFACES.
+        modes (tuple, optional): detection modes. Defaults to DETECTION_MODES.
+        step (int, optional): center line indexes between two frames.
+            Defaults to LAP_STEP.
+
+    Returns:
+        dict: {surface: {mode: {"frames", "median_ms", "p95_ms", "recall",
+            "false_positives", "centroid_error"}}} with the mean horizontal
+            error of the detected cones in meters.
+    """
+
+    results = {}
+
+    for (name, surface) in surfaces.items():
+        np.random.seed(0)
+        rng = np.random.default_rng(0)
+
+        times = {mode: [] for mode in modes}
+        scores = {mode: np.zeros(4) for mode in modes}
+
+        for (image, cones) in lap_frames(surface, step):
+            inputs = {"ransac": image.points(), "scanline": image}
+            rng.shuffle(inputs["ransac"])
+
+            for mode in modes:
+                start = time.perf_counter()
+                centroids = processing.processing(inputs[mode], mode)
+                times[mode].append(time.perf_counter() - start)
+
+                scores[mode] += score_detections(centroids, cones)
+
+        results[name] = {
+            mode: {
+                "frames": len(times[mode]),
+                "median_ms": 1e3 * float(np.median(times[mode])),
+                "p95_ms": 1e3 * float(np.percentile(times[mode], 95)),
+                "recall": scores[mode][1] / max(1, scores[mode][0]),
+                "false_positives": int(scores[mode][2]),
+                "centroid_error": scores[mode][3] / max(1, scores[mode][1])
+            }
+            for mode in modes
+        }
+
+    return results
+
+
+def print_modes(results: dict) -> None:
+    """
+    Print the latency and the detection quality of each mode on each lap.
+
+    Args:
+        results (dict): returned by bench_modes.
+    """
+
+    for (surface, modes) in results.items():
+        print("%s lap:" % surface)
+
+        for (mode, result) in modes.items():
+            print(
+                "  %-9s median %8.2f ms  p95 %8.2f ms  recall %5.1f%%  %d false positives"
+                "  error %5.2f cm"
+                % (mode, result["median_ms"], result["p95_ms"], 100 * result["recall"],
+                   result["false_positives"], 100 * result["centroid_error"])
+            )
+
+
+def bench_batch(
+    surfaces: dict = SURFACES, step: int = LAP_STEP,
+    batch_size: int = BATCH_FRAMES, repetitions: int = 3
+) -> dict:
+    """
+    Compare the amortized latency of processing_batch with one processing
+    call per frame over the frames of simulated laps (RANSAC mode). Both
+    paths start from the same random state, so they must agree.
+
+    Args:
+        surfaces (dict, optional): ground of each lap. Defaults to SURFACES.
+        step (int, optional): center line indexes between two frames.
+            Defaults to LAP_STEP.
+        batch_size (int, optional): frames per batch. Defaults to BATCH_FRAMES.
+        repetitions (int, optional): runs of each path. Defaults to 3.
+
+    Returns:
+        dict: {"frames", "batch_size", "single_ms", "batch_ms", "speedup",
+            "identical"} with the median time per frame of each path.
+    """
+
+    rng = np.random.default_rng(0)
+    frames = []
+
+    for surface in surfaces.values():
+        for (image, _) in lap_frames(surface, step):
+            points = image.points()
+            rng.shuffle(points)
+            frames.append(points)
+
+    def single() -> list:
+        return [processing.processing(frame, "ransac") for frame in frames]
+
+    def batch() -> list:
+        return processing.processing_batch(frames, batch_size)
+
+    times = {"single": [], "batch": []}
+    outputs = {}
+
+    # Warm up the imports and caches of both paths
+    single(), batch()
+
+    for _ in range(repetitions):
+        for (name, run) in (("single", single), ("batch", batch)):
+            np.random.seed(0)
+
+            start = time.perf_counter()
+            outputs[name] = run()
+            times[name].append((time.perf_counter() - start) / len(frames))
+
+    single_ms = 1e3 * float(np.median(times["single"]))
+    batch_ms = 1e3 * float(np.median(times["batch"]))
+
+    return {
+        "frames": len(frames),
+        "batch_size": batch_size,
+        "single_ms": single_ms,
+        "batch_ms": batch_ms,
+        "speedup": single_ms / batch_ms,
+        "identical": all(
+            np.array_equal(first, second)
+            for (first, second) in zip(outputs["single"], outputs["batch"])
+        )
+    }
+
+
+def print_batch(result: dict) -> None:
+    """
+    Print the amortized latency of the single frame and batched paths.
+
+    Args:
+        result (dict): returned by bench_batch.
+    """
+
+    print(
+        "%d frames, batches of %d: single %.2f ms/frame, batch %.2f ms/frame "
+        "(%.2fx), %s centroids"
+        % (result["frames"], result["batch_size"], result["single_ms"], result["batch_ms"],
+           result["speedup"], "identical" if result["identical"] else "DIFFERENT")
+    )
+
+
+def bench_floor(surfaces: dict = SURFACES, step: int = LAP_STEP) -> dict:
+    """
+    Replay each simulated lap in order with and without tracking the floor
+    plane between frames (ransac.FloorEstimator), RANSAC mode.
+
+    Args:
+        surfaces (dict, optional): ground of each lap. Defaults to SURFACES.
+        step (int, optional): center line indexes between two frames.
+            Defaults to LAP_STEP.
+
+    Returns:
+        dict: for each lap, {"floor", "stateless", "tracked"} with the
+            statistics of the tracker and, for each path, the
+            {"median_ms", "p95_ms", "recall", "false_positives",
+            "centroid_error"} of the lap.
+    """
+
+    results = {}
+
+    for (name, surface) in surfaces.items():
+        rng = np.random.default_rng(0)
+        frames = []
+
+        for (image, cones) in lap_frames(surface, step):
+            points = image.points()
+            rng.shuffle(points)
+            frames.append((points, cones))
+
+        estimator = ransac.FloorEstimator()
+        paths = {"stateless": None, "tracked": estimator}
+
+        # Warm up the imports and caches
+        processing.processing(frames[0][0], "ransac")
+
+        results[name] = {}
+
+        for (path, tracker) in paths.items():
+            np.random.seed(0)
+
+            times = []
+            scores = np.zeros(4)
+
+            for (points, cones) in frames:
+                start = time.perf_counter()
+                centroids = processing.processing(points, "ransac", estimator=tracker)
+                times.append(time.perf_counter() - start)
+
+                scores += score_detections(centroids, cones)
+
+            results[name][path] = {
+                "median_ms": 1e3 * float(np.median(times)),
+                "p95_ms": 1e3 * float(np.percentile(times, 95)),
+                "recall": scores[1] / max(1, scores[0]),
+                "false_positives": scores[2] / len(frames),
+                "centroid_error": scores[3] / max(1, scores[1])
+            }
+
+        results[name]["floor"] = estimator.statistics()
+
+    return results
+
+
+def print_floor(results: dict) -> None:
+    """
+    Print the hit rate of the floor tracking and the latency and the
+    detection quality with and without it on each lap.
+
+    Args:
+        results (dict): returned by bench_floor.
+    """
+
+    for (surface, result) in results.items():
+        floor = result["floor"]
+
+        print(
+            "%s lap: %d/%d warm hits (%.0f%%), warm %.2f ms, full RANSAC %.2f ms, %.1f ms saved"
+            % (surface, floor["warm_hits"], floor["frames"], 100 * floor["hit_rate"],
+               floor["warm_ms"], floor["full_ms"], floor["saved_ms"])
+        )
+
+        for path in ("stateless", "tracked"):
+            timing = result[path]
+
+            print(
+                "  %-9s median %8.2f ms  p95 %8.2f ms  recall %5.1f%%  %5.2f false positives/frame"
+                "  error %5.2f cm"
+                % (path, timing["median_ms"], timing["p95_ms"], 100 * timing["recall"],
+                   timing["false_positives"], 100 * timing["centroid_error"])
+            )
+
+
+def bench_fusion(
+    surfaces: dict = SURFACES, step: int = LAP_STEP,
+    workers: int = FUSION_WORKERS, repetitions: int = 3
+) -> dict:
+    """
+    Compare processing_fused with one processing call per sensor over the
+    frames of simulated laps seen by the multi LiDAR rig (RANSAC mode). The
+    centroids of the separate path are moved to the vehicle frame, so both
+    paths are scored against the same cones.
+
+    Args:
+        surfaces (dict, optional): ground of each lap. Defaults to SURFACES.
+        step (int, optional): center line indexes between two frames.
+            Defaults to LAP_STEP.
+        workers (int, optional): threads of the parallel fused path.
+            Defaults to FUSION_WORKERS.
+        repetitions (int, optional): runs of each path. Defaults to 3.
+
+    Returns:
+        dict: {"frames", "sensors", "workers", "paths"} with the
+            {"median_ms", "p95_ms", "recall", "false_positives",
+            "centroid_error"} of the "separate", "fused" (one thread)
+            and "parallel" paths.
+    """
+
+    models = get_rig_models()
+
+    rng = np.random.default_rng(0)
+    frames = []
+
+    for surface in surfaces.values():
+        for (point_clouds, cones) in rig_frames(surface, step, models=models):
+            for points in point_clouds:
+                rng.shuffle(points)
+
+            frames.append((point_clouds, cones))
+
+    def separate(point_clouds: list) -> np.ndarray:
+        centroids = [processing.processing(points, "ransac") for points in point_clouds]
+        return processing.to_vehicle_frame(centroids, models)[0]
+
+    paths = {
+        "separate": separate,
+        "fused": lambda point_clouds: processing.processing_fused(point_clouds, models, 1),
+        "parallel": lambda point_clouds: processing.processing_fused(point_clouds, models, workers)
+    }
+
+    results = {}
+
+    for (name, run) in paths.items():
+        # Warm up the imports, caches and threads of the path
+        run(frames[0][0])
+
+        times = []
+        scores = np.zeros(4)
+
+        for repetition in range(repetitions):
+            np.random.seed(0)
+
+            for (point_clouds, cones) in frames:
+                start = time.perf_counter()
+                centroids = run(point_clouds)
+                times.append(time.perf_counter() - start)
+
+                if repetition == 0:
+                    scores += score_detections(centroids, cones)
+
+        results[name] = {
+            "median_ms": 1e3 * float(np.median(times)),
+            "p95_ms": 1e3 * float(np.percentile(times, 95)),
+            "recall": scores[1] / max(1, scores[0]),
+            "false_positives": scores[2] / len(frames),
+            "centroid_error": scores[3] / max(1, scores[1])
+        }
+
+    return {"frames": len(frames), "sensors": len(models), "workers": workers, "paths": results}
+
+
+def print_fusion(result: dict) -> None:
+    """
+    Print the latency and the detection quality of the fused and the
+    per sensor paths.
+
+    Args:
+        result (dict): returned by bench_fusion.
+    """
+
+    print(
+        "%d frames of %d sensors, %d threads:"
+        % (result["frames"], result["sensors"], result["workers"])
+    )
+
+    for (name, path) in result["paths"].items():
+        print(
+            "  %-9s median %8.2f ms  p95 %8.2f ms  recall %5.1f%%  %5.2f false positives/frame"
+            "  error %5.2f cm"
+            % (name, path["median_ms"], path["p95_ms"], 100 * path["recall"],
+               path["false_positives"], 100 * path["centroid_error"])
+        )
+
+
+def print_results(results: dict) -> None:
+    """
+    Print the median and p95 latency of every stage of every scenario.
+
+    Args:
+        results (dict): returned by run_benchmark.
+    """
+
+    for scenario in results["scenarios"]:
+        print(
+            "%s: %d points, %d cropped, %d off ground, %d clusters"
+            % (scenario["name"], scenario["points"], scenario["cropped"],
+               scenario["off_ground"], scenario["clusters"])
+        )
+
+        for (stage, timing) in scenario["stages"].items():
+            peak = "  peak %9.1f KiB" % timing["peak_kib"] if "peak_kib" in timing else ""
+
+            print(
+                "  %-16s median %8.3f ms  p95 %8.3f ms%s"
+                % (stage, timing["median_ms"], timing["p95_ms"], peak)
+            )
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Time the detection stages on synthetic frames."
+    )
+    parser.add_argument("--repetitions", type=int, default=REPETITIONS)
+    parser.add_argument("--backend", default=CLUSTER_BACKEND)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument(
+        "--save-baseline", action="store_true",
+        help="store the results as the new baseline"
+    )
+    parser.add_argument(
+        "--quick", action="store_true",
+        help="only the coarsest sensor and 5 repetitions"
+    )
+    parser.add_argument(
+        "--modes", action="store_true",
+        help="compare the detection modes over simulated laps instead"
+    )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="compare processing_batch with one call per frame instead"
+    )
+    parser.add_argument(
+        "--floor", action="store_true",
+        help="replay the laps with and without tracking the floor plane instead"
+    )
+    parser.add_argument(
+        "--fusion", action="store_true",
+        help="compare processing_fused with one call per sensor of the rig instead"
+    )
+    args = parser.parse_args(argv)
+
+    if args.floor:
+        results = bench_floor()
+        print_floor(results)
+
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+        return 0
+
+    if args.fusion:
+        result = bench_fusion()
+        print_fusion(result)
+
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+        return 0
+
+    if args.batch:
+        result = bench_batch()
+        print_batch(result)
+
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+        return 0
+
+    if args.modes:
+        results = bench_modes()
+        print_modes(results)
+
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+        return 0
+
+    if args.quick:
+        results = run_benchmark(RESOLUTIONS[:1], repetitions=5, backend=args.backend)
+    else:
+        results = run_benchmark(repetitions=args.repetitions, backend=args.backend)
+
+    print_results(results)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+
+        print("Baseline stored in %s." % args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline in %s, run with --save-baseline to create it." % args.baseline)
+        return 0
+
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+
+    for regression in regressions:
+        print(
+            "REGRESSION %s / %s: %s %.3f -> %.3f"
+            % (regression["scenario"], regression["stage"], regression["metric"],
+               regression["baseline"], regression["current"])
+        )
+
+    if not regressions:
+        print("No regression against %s." % args.baseline)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
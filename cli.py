@@ -0,0 +1,445 @@
+import os
+import sys
+import json
+import time
+import socket
+import getpass
+import argparse
+import tempfile
+import statistics
+import subprocess
+import socketserver
+
+# Only the standard library is imported here, every command imports the
+# modules it needs, so a client of the daemon starts as fast as the interpreter
+
+# Unix socket where the daemon accepts frame paths, one per user so a
+# shared temporary directory does not mix the daemons of several users
+DAEMON_SOCKET = os.path.join(
+    tempfile.gettempdir(),
+    "lidar-detect-%s.sock" % (os.getuid() if hasattr(os, "getuid") else getpass.getuser())
+)
+
+# Seconds a client waits for the daemon socket to show up
+DAEMON_START_TIMEOUT = 30.0
+
+
+def detect_file(
+    path: str, destination: str = None, mode: str = None, extension: str = ".txt"
+):
+    """
+    Detect the cones of a point cloud file.
+
+    Args:
+        path (str): CSV, TXT or binary point cloud.
+        destination (str, optional): directory where the centroids will be
+            stored. Defaults to None (nothing is written).
+        mode (str, optional): detection mode. Defaults to DETECTION_MODE.
+        extension (str, optional): ".txt" or pclbin.BINARY_EXTENSION for
+            the centroid file. Defaults to ".txt".
+
+    Returns:
+        np.ndarray: 3D coordinates of cone's centroid in LiDAR frame.
+    """
+
+    import pclbin
+    import pipeline
+
+    from processing import processing
+
+    point_cloud = pclbin.read_points(path)
+    centroids = processing(point_cloud) if mode is None else processing(point_cloud, mode)
+
+    if destination is not None:
+        if not os.path.exists(destination):
+            os.makedirs(destination, exist_ok=True)
+
+        pipeline.write_centroids(pipeline.centroids_path(path, destination, extension), centroids)
+
+    return centroids
+
+
+def expand_paths(sources: list) -> list:
+    """
+    Frame files of some files, directories or glob patterns.
+
+    Args:
+        sources (list): paths given on the command line.
+
+    Returns:
+        list: point cloud paths, in frame order within each source.
+    """
+
+    paths = []
+
+    for source in sources:
+        if os.path.isfile(source):
+            paths.append(source)
+            continue
+
+        import pipeline
+
+        paths.extend(pipeline.list_frames(source))
+
+    return paths
+
+
+def warm_up() -> float:
+    """
+    Import the detection modules and run every detection mode once on a
+    simulated frame, so the sensor tables, the grid offsets and the first
+    call costs of numpy are paid before the first real frame.
+
+    Returns:
+        float: seconds spent.
+    """
+
+    start = time.perf_counter()
+
+    import numpy as np
+
+    import simulate
+
+    from processing import processing
+
+    from constants import MINIMUM_X, MAXIMUM_X
+
+    rng = np.random.default_rng(0)
+
+    # Two rows of cones ahead of the sensor
+    xs = np.tile(np.linspace(MINIMUM_X + 2.0, MAXIMUM_X - 1.0, 4), 2)
+    cones = np.column_stack((xs, np.repeat([1.5, -1.5], 4)))
+
+    point_cloud = simulate.generate_point_cloud(np.zeros(4), cones, rng)
+    rng.shuffle(point_cloud)
+
+    for mode in ("ransac", "scanline"):
+        processing(point_cloud, mode)
+
+    return time.perf_counter() - start
+
+
+class DetectionHandler(socketserver.StreamRequestHandler):
+    """
+    Serve one client of the daemon: every request is a JSON line
+    {"paths", "destination", "mode", "extension"} answered by one JSON line
+    per frame {"path", "centroids", "ms"} (or {"path", "error"}) and a last
+    line {"frames", "ms"}. {"command": "shutdown"} stops the daemon.
+    """
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            request = json.loads(line)
+
+            if request.get("command") == "shutdown":
+                self.server.running = False
+                self.reply({"shutdown": True})
+                return
+
+            start = time.perf_counter()
+            paths = request.get("paths", [])
+
+            for path in paths:
+                frame_start = time.perf_counter()
+
+                try:
+                    centroids = detect_file(
+                        path, request.get("destination"), request.get("mode"),
+                        request.get("extension", ".txt")
+                    )
+                except Exception as error:
+                    self.reply({"path": path, "error": f"{type(error).__name__}: {error}"})
+                    continue
+
+                self.reply({
+                    "path": path,
+                    "centroids": centroids.tolist(),
+                    "ms": 1e3 * (time.perf_counter() - frame_start)
+                })
+
+            self.reply({"frames": len(paths), "ms": 1e3 * (time.perf_counter() - start)})
+
+    def reply(self, message: dict) -> None:
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+
+def serve(socket_path: str = DAEMON_SOCKET, warm: bool = True) -> None:
+    """
+    Run the detection daemon until a client asks it to shut down. The
+    clients are served one after the other, in a single warm process.
+
+    Args:
+        socket_path (str, optional): Unix socket of the daemon. Defaults to DAEMON_SOCKET.
+        warm (bool, optional): run warm_up before listening. Defaults to True.
+    """
+
+    if warm:
+        print("Warmed up in %.2f s." % warm_up(), flush=True)
+
+    if os.path.exists(socket_path):
+        if is_listening(socket_path):
+            raise RuntimeError(f"a daemon already listens on {socket_path}")
+
+        os.remove(socket_path)
+
+    with socketserver.UnixStreamServer(socket_path, DetectionHandler) as server:
+        server.running = True
+        print(f"Listening on {socket_path}.", flush=True)
+
+        try:
+            while server.running:
+                server.handle_request()
+        finally:
+            os.remove(socket_path)
+
+
+def is_listening(socket_path: str) -> bool:
+    """
+    Check whether a daemon accepts connections on a Unix socket.
+
+    Args:
+        socket_path (str): Unix socket of the daemon.
+
+    Returns:
+        bool: True if a connection succeeds.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+
+    return True
+
+
+def request(message: dict, socket_path: str = DAEMON_SOCKET):
+    """
+    Send a request to the daemon and yield its replies.
+
+    Args:
+        message (dict): request (see DetectionHandler).
+        socket_path (str, optional): Unix socket of the daemon. Defaults to DAEMON_SOCKET.
+
+    Yields:
+        dict: each reply, up to the last one of the request.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+
+        with sock.makefile("rwb") as stream:
+            stream.write((json.dumps(message) + "\n").encode())
+            stream.flush()
+
+            for line in stream:
+                reply = json.loads(line)
+                yield reply
+
+                if "frames" in reply or "shutdown" in reply:
+                    return
+
+
+def wait_for_daemon(socket_path: str, timeout: float = DAEMON_START_TIMEOUT) -> None:
+    """
+    Block until the daemon accepts connections.
+
+    Args:
+        socket_path (str): Unix socket of the daemon.
+        timeout (float, optional): seconds. Defaults to DAEMON_START_TIMEOUT.
+    """
+
+    deadline = time.perf_counter() + timeout
+
+    while not is_listening(socket_path):
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"no daemon on {socket_path} after {timeout} s")
+
+        time.sleep(0.01)
+
+
+def measure_startup(paths: list, repetitions: int = 5) -> dict:
+    """
+    Compare detecting some frames in a new process with asking a warm daemon.
+
+    Args:
+        paths (list): point cloud files detected by each run.
+        repetitions (int, optional): runs of each way. Defaults to 5.
+
+    Returns:
+        dict: {"frames", "cold_ms", "warm_client_ms", "warm_request_ms",
+            "daemon_start_ms"} with the median wall time of: a new
+            "cli.py detect" process, a new "cli.py detect --connect"
+            process and a request sent from this process, plus the time
+            the daemon needed to start listening.
+    """
+
+    command = [sys.executable, os.path.abspath(__file__), "detect"]
+
+    def timed(arguments: list) -> float:
+        start = time.perf_counter()
+        subprocess.run(command + arguments + paths, check=True, stdout=subprocess.DEVNULL)
+
+        return 1e3 * (time.perf_counter() - start)
+
+    cold = [timed([]) for _ in range(repetitions)]
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "daemon.sock")
+
+    start = time.perf_counter()
+    daemon = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--socket", socket_path],
+        stdout=subprocess.DEVNULL
+    )
+
+    try:
+        wait_for_daemon(socket_path)
+        daemon_start = 1e3 * (time.perf_counter() - start)
+
+        client = [timed(["--connect", socket_path]) for _ in range(repetitions)]
+        requests = []
+
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            list(request({"paths": [os.path.abspath(path) for path in paths]}, socket_path))
+            requests.append(1e3 * (time.perf_counter() - start))
+
+        list(request({"command": "shutdown"}, socket_path))
+        daemon.wait(DAEMON_START_TIMEOUT)
+    finally:
+        if daemon.poll() is None:
+            daemon.kill()
+
+    return {
+        "frames": len(paths),
+        "cold_ms": statistics.median(cold),
+        "warm_client_ms": statistics.median(client),
+        "warm_request_ms": statistics.median(requests),
+        "daemon_start_ms": daemon_start
+    }
+
+
+def run_detect(args: argparse.Namespace) -> int:
+    paths = expand_paths(args.sources)
+
+    if args.connect is not None:
+        message = {
+            "paths": [os.path.abspath(path) for path in paths],
+            "destination": None if args.output is None else os.path.abspath(args.output),
+            "mode": args.mode,
+            "extension": args.extension
+        }
+
+        failed = 0
+
+        for reply in request(message, args.connect):
+            if "error" in reply:
+                print(f"{reply['path']}: {reply['error']}", file=sys.stderr)
+                failed += 1
+            elif "path" in reply:
+                print("%s: %d cones" % (reply["path"], len(reply["centroids"])))
+
+        return 1 if failed else 0
+
+    for path in paths:
+        centroids = detect_file(path, args.output, args.mode, args.extension)
+        print("%s: %d cones" % (path, len(centroids)))
+
+    return 0
+
+
+def run_simulate(args: argparse.Namespace) -> int:
+    import mainpcl
+
+    mainpcl.main(
+        args.start, args.stop, args.output, workers=args.workers, seed=args.seed,
+        extension=args.extension, organized=args.organized, track_cache=args.track_cache
+    )
+
+    return 0
+
+
+def run_convert(args: argparse.Namespace) -> int:
+    import pclbin
+
+    converted = pclbin.convert_directory(args.source, args.destination)
+    print("Converted %d point clouds." % converted)
+
+    return 0
+
+
+def run_serve(args: argparse.Namespace) -> int:
+    serve(args.socket, warm=not args.cold)
+
+    return 0
+
+
+def run_stop(args: argparse.Namespace) -> int:
+    list(request({"command": "shutdown"}, args.socket))
+
+    return 0
+
+
+def run_startup(args: argparse.Namespace) -> int:
+    result = measure_startup(expand_paths(args.sources), args.repetitions)
+
+    print(
+        "%d frames: cold process %.1f ms, warm client process %.1f ms, "
+        "warm request %.1f ms (daemon ready in %.1f ms)"
+        % (result["frames"], result["cold_ms"], result["warm_client_ms"],
+           result["warm_request_ms"], result["daemon_start_ms"])
+    )
+
+    return 0
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Detect cones in LiDAR point clouds.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    detect = commands.add_parser("detect", help="detect the cones of point cloud files")
+    detect.add_argument("sources", nargs="+", help="files, directories or glob patterns")
+    detect.add_argument("--output", default=None, help="directory of the centroid files")
+    detect.add_argument("--mode", default=None, help="ransac or scanline")
+    detect.add_argument("--extension", default=".txt", help="centroid files extension")
+    detect.add_argument("--connect", default=None, metavar="SOCKET", help="send the frames to a daemon")
+    detect.set_defaults(run=run_detect)
+
+    simulate = commands.add_parser("simulate", help="generate point clouds along the track")
+    simulate.add_argument("start", type=int, help="first center line index")
+    simulate.add_argument("stop", type=int, help="last center line index (below start: until the end)")
+    simulate.add_argument("--output", default="pcls")
+    simulate.add_argument("--workers", type=int, default=1)
+    simulate.add_argument("--seed", type=int, default=0)
+    simulate.add_argument("--extension", default=".csv")
+    simulate.add_argument("--organized", action="store_true", help="store range images")
+    simulate.add_argument("--track-cache", default=None)
+    simulate.set_defaults(run=run_simulate)
+
+    convert = commands.add_parser("convert", help="convert text point clouds to the binary format")
+    convert.add_argument("source")
+    convert.add_argument("destination", nargs="?", default=None)
+    convert.set_defaults(run=run_convert)
+
+    daemon = commands.add_parser("serve", help="keep the detection warm behind a Unix socket")
+    daemon.add_argument("--socket", default=DAEMON_SOCKET)
+    daemon.add_argument("--cold", action="store_true", help="skip the warm up")
+    daemon.set_defaults(run=run_serve)
+
+    stop = commands.add_parser("stop", help="shut the daemon down")
+    stop.add_argument("--socket", default=DAEMON_SOCKET)
+    stop.set_defaults(run=run_stop)
+
+    startup = commands.add_parser("startup", help="measure cold against warm detection")
+    startup.add_argument("sources", nargs="+", help="files, directories or glob patterns")
+    startup.add_argument("--repetitions", type=int, default=5)
+    startup.set_defaults(run=run_startup)
+
+    args = parser.parse_args(argv)
+
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+import numpy as np
+
+import voxel
+
+from constants import *
+
+
+# Candidate pairs of points compared at once by the grid engine
+PAIR_BLOCK_SIZE = 1 << 20
+
+# Points of each cell tried first when checking if two dense cells touch
+CONTACT_SAMPLE_SIZE = 8
+
+# Cells are a bit smaller than eps / sqrt(3), so any two points of the same
+# cell are neighbours even after rounding
+CELL_SHRINK = 1 - 1e-9
+
+# Offsets of a grid cell to the cells that may hold neighbours (eps is a bit
+# less than twice the cell side), the cell itself in the middle
+NEIGHBOUR_OFFSETS = np.stack(
+    np.meshgrid(*3 * [np.arange(-2, 3)], indexing="ij"), axis=-1
+).reshape((-1, 3))
+
+CENTER_OFFSET = len(NEIGHBOUR_OFFSETS) // 2
+
+
+def hash_points(points: np.ndarray, side: float) -> dict:
+    """
+    Hash the points into a grid of cubic cells.
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+        side (float): side of the cells.
+
+    Returns:
+        dict: grid {"order", "keys", "starts", "counts", "offsets"} where the
+            points sorted by "order" are stored cell after cell.
+    """
+
+    cells = np.floor(points / side).astype(np.int64)
+    cells -= cells.min(axis=0) - 2   # Keep a free border for the offsets
+
+    dims = cells.max(axis=0) + 3
+
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    order = np.argsort(keys, kind="stable")
+    unique_keys, starts, counts = np.unique(
+        keys[order], return_index=True, return_counts=True
+    )
+
+    offsets = (
+        NEIGHBOUR_OFFSETS[:, 0] * dims[1] + NEIGHBOUR_OFFSETS[:, 1]
+    ) * dims[2] + NEIGHBOUR_OFFSETS[:, 2]
+
+    return {
+        "order": order,
+        "keys": unique_keys,
+        "starts": starts,
+        "counts": counts,
+        "offsets": offsets
+    }
+
+
+def match_cells(grid: dict, cells: np.ndarray, offsets: np.ndarray) -> tuple:
+    """
+    Match the given cells with their occupied cells at the given offsets.
+
+    Args:
+        grid (dict): grid built by hash_points.
+        cells (np.ndarray): indexes of the cells.
+        offsets (np.ndarray): key offsets of the wanted neighbour cells.
+
+    Returns:
+        tuple: indexes of the first and of the second cell of each pair.
+    """
+
+    keys = grid["keys"]
+
+    wanted = (keys[cells][:, np.newaxis] + offsets).reshape(-1)
+    found = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+
+    matched = keys[found] == wanted
+
+    return np.repeat(cells, len(offsets))[matched], found[matched]
+
+
+def expand_cell_pairs(
+    grid: dict, cell_a: np.ndarray, cell_b: np.ndarray, limit: int = None
+):
+    """
+    Expand pairs of cells into all the pairs of their points,
+    a bounded block of candidates at a time.
+
+    Args:
+        grid (dict): grid built by hash_points.
+        cell_a (np.ndarray): indexes of the first cell of each pair.
+        cell_b (np.ndarray): indexes of the second cell of each pair.
+        limit (int, optional): only the first points of each cell are used.
+            Defaults to None (all points).
+
+    Yields:
+        tuple: indexes (in grid order) of the first and of the second point
+            of each candidate pair, and the pair of cells it comes from.
+    """
+
+    counts = grid["counts"] if limit is None else np.minimum(grid["counts"], limit)
+
+    sizes = counts[cell_a] * counts[cell_b]
+    bounds = np.searchsorted(
+        np.cumsum(sizes), np.arange(1, sizes.sum() // PAIR_BLOCK_SIZE + 1) * PAIR_BLOCK_SIZE
+    )
+
+    for block in np.split(np.arange(len(sizes)), np.unique(bounds + 1)):
+        block_sizes = sizes[block]
+
+        pair = np.repeat(block, block_sizes)
+        local = np.arange(len(pair)) - np.repeat(
+            np.cumsum(block_sizes) - block_sizes, block_sizes
+        )
+
+        width = counts[cell_b[pair]]
+
+        first = grid["starts"][cell_a[pair]] + local // width
+        second = grid["starts"][cell_b[pair]] + local % width
+
+        yield first, second, pair
+
+
+def connected_components(
+    num_nodes: int, edges_a: np.ndarray, edges_b: np.ndarray
+) -> np.ndarray:
+    """
+    Connected components of an undirected graph: the roots of the two ends of
+    every edge are hooked to the lower one, then every node jumps straight to
+    its root, until no edge joins two roots.
+
+    Args:
+        num_nodes (int): number of nodes.
+        edges_a (np.ndarray): first node of each edge.
+        edges_b (np.ndarray): second node of each edge.
+
+    Returns:
+        np.ndarray: lowest node index of the component of each node.
+    """
+
+    component = np.arange(num_nodes)
+
+    while True:
+        roots_a = component[edges_a]
+        roots_b = component[edges_b]
+
+        updated = component.copy()
+        np.minimum.at(updated, roots_a, roots_b)
+        np.minimum.at(updated, roots_b, roots_a)
+
+        # Parents are never above their children, so the jumps end at the roots
+        while True:
+            jumped = updated[updated]
+
+            if np.array_equal(jumped, updated):
+                break
+
+            updated = jumped
+
+        if np.array_equal(updated, component):
+            return component
+
+        component = updated
+
+
+def grid_dbscan(
+    points: np.ndarray, eps: float = MAX_DISTANCE, min_samples: int = MIN_SAMPLES
+) -> np.ndarray:
+    """
+    DBSCAN over a voxel hash. Labels core, border and noise points exactly
+    as sklearn does, including the numbering of the clusters.
+
+    Every cell fits inside the eps neighbourhood of its points, so a cell with
+    min_samples points only holds core points that are all connected. Distances
+    are only computed around the sparse cells and between dense cells.
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+        eps (float, optional): neighbourhood radius. Defaults to MAX_DISTANCE.
+        min_samples (int, optional): neighbours (self included) of a core point.
+            Defaults to MIN_SAMPLES.
+
+    Returns:
+        np.ndarray: cluster label of each point, -1 for noise.
+    """
+
+    labels = np.full(len(points), -1)
+
+    if len(points) == 0:
+        return labels
+
+    grid = hash_points(points, CELL_SHRINK * eps / np.sqrt(3))
+
+    order = grid["order"]
+    ordered = points[order]
+
+    cell_of = np.repeat(np.arange(len(grid["keys"])), grid["counts"])
+    dense = grid["counts"] >= min_samples
+
+    around = np.delete(grid["offsets"], CENTER_OFFSET)
+
+    # Complete neighbourhoods of the points of sparse cells
+    firsts, seconds = [], []
+
+    cell_a, cell_b = match_cells(grid, np.flatnonzero(~dense), around)
+
+    for (first, second, _) in expand_cell_pairs(grid, cell_a, cell_b):
+        deltas = ordered[first] - ordered[second]
+        close = np.einsum("ij,ij->i", deltas, deltas) <= eps**2
+
+        firsts.append(first[close])
+        seconds.append(second[close])
+
+    first = np.concatenate(firsts)
+    second = np.concatenate(seconds)
+
+    neighbours = grid["counts"][cell_of] + np.bincount(first, minlength=len(points))
+    core = dense[cell_of] | (neighbours >= min_samples)
+
+    linked = core[first] & core[second]
+
+    # Core points of the same cell are linked to the first one of the cell
+    core_points = np.flatnonzero(core)
+    core_cells, first_core = np.unique(cell_of[core_points], return_index=True)
+
+    representative = np.full(len(grid["keys"]), -1)
+    representative[core_cells] = core_points[first_core]
+
+    edges_a = [core_points, first[linked]]
+    edges_b = [representative[cell_of[core_points]], second[linked]]
+
+    # Dense cells touch when any pair of their points is close, tried on a sample first
+    dense_a, dense_b = match_cells(
+        grid, np.flatnonzero(dense), grid["offsets"][CENTER_OFFSET + 1:]
+    )
+    dense_pairs = np.flatnonzero(dense[dense_b])
+    dense_a, dense_b = dense_a[dense_pairs], dense_b[dense_pairs]
+
+    touching = np.zeros(len(dense_a), dtype=bool)
+
+    for limit in (CONTACT_SAMPLE_SIZE, None):
+        pending = np.flatnonzero(~touching)
+
+        for (point_a, point_b, pair) in expand_cell_pairs(
+            grid, dense_a[pending], dense_b[pending], limit
+        ):
+            deltas = ordered[point_a] - ordered[point_b]
+            close = np.einsum("ij,ij->i", deltas, deltas) <= eps**2
+
+            touching[pending[pair[close]]] = True
+
+    edges_a.append(representative[dense_a[touching]])
+    edges_b.append(representative[dense_b[touching]])
+
+    # Connected components, identified by the lowest original index
+    component = connected_components(
+        len(points), order[np.concatenate(edges_a)], order[np.concatenate(edges_b)]
+    )
+
+    # Clusters are numbered in the order their lowest core point appears
+    core = core[np.argsort(order)]   # Back to the original order
+
+    roots = np.unique(component[core])
+    labels[core] = np.searchsorted(roots, component[core])
+
+    # Border points join the first cluster that reaches them, either
+    # through a close point or through a core point of their own cell
+    first = order[np.concatenate(firsts)]
+    second = order[np.concatenate(seconds)]
+
+    border = core[second] & ~core[first]
+
+    reached = np.full(len(points), len(roots))
+    np.minimum.at(reached, first[border], labels[second[border]])
+
+    own = representative[cell_of]
+    shared = ~core[order] & (own >= 0)
+
+    np.minimum.at(reached, order[shared], labels[order[own[shared]]])
+
+    joined = ~core & (reached < len(roots))
+    labels[joined] = reached[joined]
+
+    return labels
+
+
+def sklearn_dbscan(
+    points: np.ndarray, eps: float = MAX_DISTANCE, min_samples: int = MIN_SAMPLES
+) -> np.ndarray:
+    """
+    DBSCAN of scikit-learn (KD-tree).
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+        eps (float, optional): neighbourhood radius. Defaults to MAX_DISTANCE.
+        min_samples (int, optional): neighbours (self included) of a core point.
+            Defaults to MIN_SAMPLES.
+
+    Returns:
+        np.ndarray: cluster label of each point, -1 for noise.
+    """
+
+    from sklearn.cluster import DBSCAN
+
+    return DBSCAN(eps=eps, min_samples=min_samples).fit(points).labels_
+
+
+def cuml_dbscan(
+    points: np.ndarray, eps: float = MAX_DISTANCE, min_samples: int = MIN_SAMPLES
+) -> np.ndarray:
+    """
+    DBSCAN of RAPIDS cuML (GPU).
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+        eps (float, optional): neighbourhood radius. Defaults to MAX_DISTANCE.
+        min_samples (int, optional): neighbours (self included) of a core point.
+            Defaults to MIN_SAMPLES.
+
+    Returns:
+        np.ndarray: cluster label of each point, -1 for noise.
+    """
+
+    from cuml.cluster import DBSCAN
+
+    labels = DBSCAN(eps=eps, min_samples=min_samples).fit(points).labels_
+
+    return np.asarray(labels)
+
+
+BACKENDS = {
+    "grid": grid_dbscan,
+    "sklearn": sklearn_dbscan,
+    "cuml": cuml_dbscan
+}
+
+
+def select_backend(num_points: int, backend: str = CLUSTER_BACKEND) -> str:
+    """
+    Choose the clustering engine. The "auto" backend uses the grid engine for
+    the usual few hundred off-ground points and sklearn for larger clouds.
+
+    Args:
+        num_points (int): number of points that will be clustered.
+        backend (str, optional): "auto", "grid", "sklearn" or "cuml".
+            Defaults to CLUSTER_BACKEND.
+
+    Returns:
+        str: name of the chosen engine.
+    """
+
+    if backend == "auto":
+        return "grid" if num_points <= GRID_BACKEND_MAX_POINTS else "sklearn"
+
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown clustering backend {backend!r}")
+
+    return backend
+
+
+def dbscan(
+    points: np.ndarray, eps: float = MAX_DISTANCE,
+    min_samples: int = MIN_SAMPLES, backend: str = CLUSTER_BACKEND,
+    leaf_size: float = CLUSTER_LEAF_SIZE
+) -> np.ndarray:
+    """
+    Cluster the points with the selected DBSCAN engine.
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+        eps (float, optional): neighbourhood radius. Defaults to MAX_DISTANCE.
+        min_samples (int, optional): neighbours (self included) of a core point.
+            Defaults to MIN_SAMPLES.
+
+        backend (str, optional): "auto", "grid", "sklearn" or "cuml".
+            Defaults to CLUSTER_BACKEND.
+
+        leaf_size (float, optional): voxel side, every point gets the label
+            of its voxel representative. Defaults to CLUSTER_LEAF_SIZE
+            (0 clusters every point).
+
+    Returns:
+        np.ndarray: cluster label of each point, -1 for noise.
+    """
+
+    if leaf_size > 0:
+        representatives, inverse = voxel.voxel_downsample(points, leaf_size)
+        return dbscan(representatives, eps, min_samples, backend, 0.0)[inverse]
+
+    engine = BACKENDS[select_backend(len(points), backend)]
+
+    return engine(points, eps, min_samples)
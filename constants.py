@@ -1,3 +1,6 @@
+from constantspcl import CONE_RADIUS, CONE_HEIGHT
+
+
 #===============================================#
 #                                               #
 #             Crop rectangle related            #
@@ -23,6 +26,64 @@ DOWNSAMPLE_SIZE = 3000
 
 DIST2PLANE_THRESHOLD = 0.06
 
+# Voxel side of the RANSAC sample (one point per voxel, so the sample does not
+# depend on the order of the points), 0 takes the first DOWNSAMPLE_SIZE rows
+RANSAC_LEAF_SIZE = 0.05
+
+# Random points voxelized at most, bounds the cost of the sample on dense clouds
+RANSAC_PRESAMPLE_SIZE = 12000
+
+# "fixed" scores every hypothesis, "adaptive" stops once the inlier ratio
+# makes more hypotheses pointless, "preemptive" drops weak hypotheses
+# after scoring them on a small subset of points
+RANSAC_MODE = "adaptive"
+
+# Hypotheses scored at once (bounds the distance matrix)
+RANSAC_BLOCK_SIZE = 32
+
+# Probability of drawing at least one all-inlier hypothesis (adaptive)
+RANSAC_CONFIDENCE = 0.99
+
+# Points used to rank the hypotheses and share of them kept (preemptive)
+PREEMPTIVE_SUBSET_SIZE = 256
+PREEMPTIVE_KEEP_RATIO = 0.1
+
+
+#===============================================#
+#                                               #
+#             Floor tracking related            #
+#                                               #
+#===============================================#
+
+# Points used to check the previous floor plane on a new frame
+WARM_SAMPLE_SIZE = 512
+
+# Minimum inlier ratio of the previous plane to skip the full RANSAC
+WARM_INLIER_RATIO = 0.8
+
+
+#===============================================#
+#                                               #
+#               Scan-line related               #
+#                                               #
+#===============================================#
+
+# "ransac" (floor plane + DBSCAN) or "scanline" (ground segmentation and
+# clustering over the range image, see scanline.py)
+DETECTION_MODE = "ransac"
+
+# Steepest ground in degrees, and largest change of slope in degrees
+# between two consecutive ground points of the same azimuth
+GROUND_MAX_SLOPE = 10.0
+GROUND_MAX_SLOPE_CHANGE = 3.0
+
+# Height error always accepted for a ground point (noise and bumps)
+GROUND_MAX_STEP = 0.03
+
+# Half width in degrees of the azimuth window where the lowest point of a
+# ring is taken as ground (wider than a cone seen from the nearest ring)
+GROUND_WINDOW_ANGLE = 3.0
+
 
 #===============================================#
 #                                               #
@@ -32,3 +93,72 @@ DIST2PLANE_THRESHOLD = 0.06
 
 MIN_SAMPLES = 5
 MAX_DISTANCE = 0.3
+
+# "auto", "grid", "sklearn" or "cuml" (see clustering.py)
+CLUSTER_BACKEND = "auto"
+
+# Largest cloud clustered by the grid engine when the backend is "auto"
+GRID_BACKEND_MAX_POINTS = 2000
+
+# Voxel side of the clustered points (every voxel is clustered as a single
+# point, so MIN_SAMPLES counts voxels), 0 clusters every point
+CLUSTER_LEAF_SIZE = 0.0
+
+
+#===============================================#
+#                                               #
+#           Batch processing related            #
+#                                               #
+#===============================================#
+
+# Frames whose RANSAC hypotheses are scored together by processing_batch
+BATCH_FRAMES = 16
+
+# Shift along x between the frames clustered together, longer than the crop
+# rectangle plus the DBSCAN radius so that no cluster spans two frames
+FRAME_SPACING = MAXIMUM_X - MINIMUM_X + 2 * MAX_DISTANCE
+
+
+#===============================================#
+#                                               #
+#               Multi LiDAR fusion              #
+#                                               #
+#===============================================#
+
+# Threads cropping and removing the floor of the sensors of a rig in
+# processing_fused (1 runs the sensors one after the other)
+FUSION_WORKERS = 2
+
+
+#===============================================#
+#                                               #
+#            Voxel downsample related           #
+#                                               #
+#===============================================#
+
+# Representative of each voxel: "first" point or "centroid"
+VOXEL_MODE = "first"
+
+
+#===============================================#
+#                                               #
+#             Cluster filter related            #
+#                                               #
+#===============================================#
+
+# Margin over the cone dimensions accepted for a cluster
+CLUSTER_SIZE_TOLERANCE = 0.1
+
+
+#===============================================#
+#                                               #
+#                 Point labels                  #
+#                                               #
+#===============================================#
+
+# Label of each original point returned by processing, the cones are
+# numbered from 0 in the order of the centroids
+LABEL_NOISE = -1      # Off the floor but in no cluster
+LABEL_REJECTED = -2   # In a cluster that does not look like a cone
+LABEL_FLOOR = -3
+LABEL_CROPPED = -4    # Outside of the crop rectangle
@@ -37,6 +37,31 @@ CHANNEL_ANGLE_IN_RAD = np.array(
 DISTANCE_UNCERTAINTY = 0.0003   #0.03
 
 
+#===============================================#
+#                                               #
+#                Multi LiDAR rig                #
+#                                               #
+#===============================================#
+
+# Sensors of the fusion mode: two LiDARs on the front corners of the
+# vehicle, each one turned outwards. Position in vehicle frame in rows
+# and yaw in vehicle frame, same profile as the single LiDAR otherwise
+RIG_DISPLACEMENTS = np.array([[0.5, 0.45, 1.1], [0.5, -0.45, 1.1]])
+RIG_ORIENTATIONS = np.deg2rad([20.0, -20.0])
+
+
+#===============================================#
+#                                               #
+#              Point cloud format               #
+#                                               #
+#===============================================#
+
+# Floating point type of the frames from the loaders to the centroids. The
+# float32 resolution (2e-6 m at 20 m) is far below DISTANCE_UNCERTAINTY,
+# np.float64 restores the double precision pipeline
+POINT_DTYPE = np.float32
+
+
 #===============================================#
 #                                               #
 #           Optimize scan parameters            #
@@ -48,3 +73,14 @@ MIN_TAN_VALUE = np.abs(np.tan(CHANNEL_ANGLE_IN_RAD[0]))
 MAX_DISTANCE_TO_SCAN = (
     CONE_RADIUS + LIDAR_DISPLACEMENT[2] / MIN_TAN_VALUE
 )
+
+# Azimuth sectors of the per frame cone index (each beam only tests
+# the cones whose silhouette can cover its sector)
+NUM_AZIMUTH_SECTORS = 4096
+
+# Side of the cells of the track cone grid (a range query only visits
+# the cells around the LiDAR)
+TRACK_CELL_SIZE = MAX_DISTANCE_TO_SCAN
+
+# Poses whose visible cones are looked up at once by simulate.generate_frames
+FRAME_QUERY_SIZE = 64
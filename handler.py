@@ -1,76 +1,81 @@
 #!/usr/bin/env python3
 
+import numpy as np
+
+import instrument
+import pclbin
+
 class Handler:
 
-	def __init__ (self, path_in, path_out):
+	def __init__ (self, path_in, path_out, verbose=False):
 
 		self.path = path_in
-		self.pclIn = open(path_in,"r")
-		self.pclOut = open(path_out,"a")
+		self.pathOut = path_out
+		self.verbose = verbose
+		self.skipped = 0
 
-	def txtToList(self):
+		# Binary point clouds are memory-mapped instead of read as text
+		self.binaryIn = pclbin.is_binary(path_in)
+		self.binaryOut = pclbin.is_binary(path_out)
 
-		pcl = []
-		skipped = []
-		
-		if self.path.endswith('t'):
+		self.pclIn = None if self.binaryIn else open(path_in,"r")
+		self.pclOut = None if self.binaryOut else open(path_out,"a")
 
-			for x in self.pclIn:
+	def iterChunks(self, chunkSize=pclbin.TEXT_CHUNK_SIZE):
 
-				r = x.replace("\n","").replace("    "," ").replace("   "," ").replace("  "," ").replace(" \n","")
-				r = r.split(" ")
-				print(r)
-				if "" in r:
-					r.remove("")
+		# Stream the point cloud as (N, 3) arrays of at most chunkSize points
+		if self.binaryIn:
 
-				if (len(r) == 3):
+			points = pclbin.read_binary(self.path)
 
-					pcl.append([float(r[0]),float(r[1]),float(r[2])])
+			for start in range(0, len(points), chunkSize):
 
-				elif(len(r) == 4):
+				yield points[start:start + chunkSize, :3]
 
-					pcl.append([float(r[0]),float(r[1]),float(r[2])])
+			return
 
-				else:
+		self.skipped = 0
 
-					skipped.append(r)
+		if not self.path.endswith('t'):
+			next(self.pclIn, None)
 
-		else:
-			next(self.pclIn)
+		for (points, skipped) in pclbin.iter_text(self.pclIn, chunkSize):
+
+			self.skipped += skipped
 
-			for x in self.pclIn:
+			yield points
 
-				r = x.replace("\n","").replace(" \n","").replace(","," ")
-				r = r.split(" ")
-				print(r)
-				if "" in r:
-					r.remove("")
+	def txtToList(self):
+
+		with instrument.stage("load"):
+
+			if self.binaryIn:
 
-				if (len(r) == 3):
+				self.pclList = pclbin.as_points(pclbin.read_binary(self.path))
 
-					pcl.append([float(r[0]),float(r[1]),float(r[2])])
+			else:
 
-				elif(len(r) == 4):
+				chunks = [pclbin.as_points(points) for points in self.iterChunks()]
 
-					pcl.append([float(r[0]),float(r[1]),float(r[2])])
+				self.pclList = np.concatenate(chunks) if chunks else np.empty((0, 3), pclbin.POINT_DTYPE)
 
-				else:
+		instrument.count("loaded", len(self.pclList))
 
-					skipped.append(r)
+		if self.verbose and not self.binaryIn:
+			print("Skipped %d lines." %self.skipped)
 
-		print("Skipped %d lines." %len(skipped))
+	def listToTxt(self, pcl, chunkSize=pclbin.TEXT_CHUNK_SIZE):
 
-		self.pclList = pcl
+		if self.verbose:
+			print("writing new pcl")
 
-	def listToTxt(self, pcl):
+		if self.binaryOut:
 
-		print("writing new pcl")
+			pclbin.write_binary(self.pathOut, pcl)
+
+		else:
 
-		for x in pcl:
+			pclbin.write_text(self.pclOut, pcl, chunkSize)
 
-			towrite = str(x).replace("[","").replace("]","").replace(" ","").replace(","," ")
-			self.pclOut.write(towrite)
-			self.pclOut.write("\n")
-		
-		print("Done")
-	
\ No newline at end of file
+		if self.verbose:
+			print("Done")
@@ -1,9 +1,9 @@
 import numpy as np
-import pandas as pd
 
-from matplotlib import pyplot as plt
+import instrument
+import pclbin
 
-from constantspcl import SCAN_FIELD_WIDTH, MAX_DISTANCE_TO_SCAN
+from lidar import LidarModel, get_default_model
 
 
 POINT_COLOR = "#0065D9"
@@ -20,6 +20,8 @@ def draw2D(point_cloud: np.ndarray) -> None:
         point_cloud (np.ndarray): simulated LiDAR measurement.
     """
 
+    from matplotlib import pyplot as plt
+
     ax = plt.axes()
 
     ax.axis("off")
@@ -43,6 +45,8 @@ def draw3D(point_cloud: np.ndarray) -> None:
         point_cloud (np.ndarray): simulated LiDAR measurement.
     """
 
+    from matplotlib import pyplot as plt
+
     ax = plt.axes(projection="3d")
 
     ax.axis("off")
@@ -63,15 +67,20 @@ def draw3D(point_cloud: np.ndarray) -> None:
     plt.show()
 
 
-def draw_lidar_view(track: dict, pose: np.ndarray) -> None:
+def draw_lidar_view(track: dict, pose: np.ndarray, model: LidarModel = None) -> None:
     """
     Draw the track top view marking the LiDAR field of view.
 
     Args:
         track (dict): dict that represents the track {"cones", "center_line"}.
         pose (np.ndarray): vehicle pose in global frame [x, y, z, yaw].
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
     """
 
+    from matplotlib import pyplot as plt
+
+    model = get_default_model() if model is None else model
+
     ax = plt.axes()
 
     ax.axis("off")
@@ -79,8 +88,8 @@ def draw_lidar_view(track: dict, pose: np.ndarray) -> None:
 
     direction = np.array([np.cos(pose[3]), np.sin(pose[3])])
 
-    cos = np.cos(0.5 * SCAN_FIELD_WIDTH)
-    sin = np.sin(0.5 * SCAN_FIELD_WIDTH)
+    cos = np.cos(0.5 * model.scan_field_width)
+    sin = np.sin(0.5 * model.scan_field_width)
 
     rotmat = np.array(
         [[ cos, -sin],
@@ -103,7 +112,7 @@ def draw_lidar_view(track: dict, pose: np.ndarray) -> None:
     angle = np.linspace(theta_A, theta_B, 48)[:, np.newaxis]
     vectors = np.concatenate((np.cos(angle), np.sin(angle)), axis=1)
 
-    fov = pose[:2] + MAX_DISTANCE_TO_SCAN * vectors
+    fov = pose[:2] + model.max_distance_to_scan * vectors
     fov = np.concatenate(
         (pose[:2].reshape((1, 2)), fov, pose[:2].reshape((1, 2))), axis=0
     )
@@ -129,30 +138,51 @@ def draw_lidar_view(track: dict, pose: np.ndarray) -> None:
 
 def read_point_cloud(filename: str) -> np.ndarray:
     """
-    Read point cloud coordinates from a CSV file.
+    Read point cloud coordinates from a CSV or binary (memory-mapped) file.
 
     Args:
-        filename (str): name of the CSV file that will be read.
+        filename (str): name of the CSV or binary file that will be read.
 
     Returns:
-        np.ndarray: 3D coordinates in LiDAR frame.
+        np.ndarray: 3D coordinates in LiDAR frame (see pclbin.as_points).
     """
 
-    df = pd.read_csv(filename)
+    with instrument.stage("load"):
+        if pclbin.is_binary(filename):
+            point_cloud = pclbin.as_points(pclbin.read_binary(filename))
+        else:
+            import pandas as pd
+
+            point_cloud = pclbin.as_points(
+                pd.read_csv(filename, dtype=pclbin.POINT_DTYPE).to_numpy()
+            )
 
-    return df.to_numpy()
+    instrument.count("loaded", len(point_cloud))
+
+    return point_cloud
 
 
 def write_point_cloud(filename: str, point_cloud: np.ndarray) -> None:
     """
-    Generate a CSV file by point cloud coordinates.
+    Generate a CSV or binary file by point cloud coordinates. The binary format
+    is used when the name ends with pclbin.BINARY_EXTENSION, otherwise the
+    ".csv" extension is appended when missing.
 
     Args:
-        filename (str): name of the CSV file that will be created.
+        filename (str): name of the file that will be created.
         point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
     """
 
+    if pclbin.is_binary(filename):
+        pclbin.write_binary(filename, point_cloud)
+        return
+
+    if not filename.endswith(".csv"):
+        filename = f"{filename}.csv"
+
+    import pandas as pd
+
     df = pd.DataFrame(point_cloud, columns=["x", "y", "z"])
 
-    df.to_csv(f"{filename}.csv", index=False)
+    df.to_csv(filename, index=False)
 
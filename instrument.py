@@ -0,0 +1,503 @@
+import json
+import time
+import bisect
+import threading
+import tracemalloc
+
+
+# Upper bounds in milliseconds of the latency histogram buckets
+# (the last bucket holds everything slower)
+HISTOGRAM_BOUNDS_MS = (
+    0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0
+)
+
+
+class MemorySink:
+    """
+    Keep every record in a list.
+    """
+
+    def __init__(self) -> None:
+        self.records = []
+
+    def emit(self, record: dict) -> None:
+        self.records.append(record)
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesSink:
+    """
+    Append every record as a JSON line to a file.
+    """
+
+    def __init__(self, filename: str) -> None:
+        """
+        Args:
+            filename (str): name of the file, created or appended to.
+        """
+
+        self.file = open(filename, "a")
+
+    def emit(self, record: dict) -> None:
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class CallbackSink:
+    """
+    Pass every record to a function.
+    """
+
+    def __init__(self, function) -> None:
+        """
+        Args:
+            function: called with each record.
+        """
+
+        self.function = function
+
+    def emit(self, record: dict) -> None:
+        self.function(record)
+
+    def close(self) -> None:
+        pass
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets.
+    """
+
+    def __init__(self, bounds: tuple = HISTOGRAM_BOUNDS_MS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the bucket that holds the given percentile.
+
+        Args:
+            q (float): percentile between 0 and 100.
+
+        Returns:
+            float: the percentile, rounded up to a bucket bound
+                (the maximum for the last bucket).
+        """
+
+        if self.count == 0:
+            return 0.0
+
+        rank = q / 100 * self.count
+        seen = 0
+
+        for (bound, count) in zip(self.bounds, self.counts):
+            seen += count
+
+            if seen >= rank:
+                return min(bound, self.maximum)
+
+        return self.maximum
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            dict: {"count", "mean", "p50", "p95", "max", "buckets"}.
+        """
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.maximum,
+            "buckets": dict(zip(
+                [str(bound) for bound in self.bounds] + ["inf"], self.counts
+            ))
+        }
+
+
+class NullStage:
+    """
+    Stage timer used while the instrumentation is disabled.
+    """
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exception) -> bool:
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    """
+    Stage timer: measures the time spent inside a with block.
+    """
+
+    __slots__ = ("owner", "name", "start")
+
+    def __init__(self, owner: "Instrumentation", name: str) -> None:
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exception) -> bool:
+        self.owner.add_time(self.name, 1e3 * (time.perf_counter() - self.start))
+        return False
+
+
+class MemoryStage(Stage):
+    """
+    Stage timer that also records the peak of the memory traced by
+    tracemalloc inside the with block, above the memory in use when it began.
+    The peak of a nested stage also counts for the stages around it.
+    """
+
+    __slots__ = ("base", "peak")
+
+    def __enter__(self) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        stack = self.owner.memory_stack()
+
+        # The peak so far belongs to the enclosing stage before it is reset
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+
+        tracemalloc.reset_peak()
+        stack.append(self)
+
+        self.base = current
+        self.peak = current
+
+        super().__enter__()
+
+    def __exit__(self, *exception) -> bool:
+        super().__exit__(*exception)
+
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+
+        stack = self.owner.memory_stack()
+        stack.pop()
+
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, self.peak)
+
+        self.owner.add_peak(self.name, (self.peak - self.base) / 1024)
+
+        return False
+
+
+class Instrumentation:
+    """
+    Per frame stage timers, point counters and latency histograms.
+
+    Hooks are a with block (stage) or a call (count) that return at once while
+    the instrumentation is disabled. The measures of a frame are gathered in
+    a record, current for the thread that works on the frame, and handed to
+    the sinks when the frame is finished. Measures taken outside of a frame
+    are handed to the sinks right away.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.memory = False
+        self.sinks = []
+
+        self.histograms = {}
+        self.totals = {}
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def enable(self, *sinks, memory: bool = False) -> None:
+        """
+        Start measuring and send the records to the given sinks.
+
+        Args:
+            sinks: objects with emit(record) and close().
+            memory (bool, optional): also record the peak memory of every
+                stage in KiB ("peak_kib"), while tracemalloc is tracing.
+                Slows every stage down. Defaults to False.
+        """
+
+        self.sinks = list(sinks)
+        self.memory = memory
+        self.enabled = True
+
+    def disable(self) -> None:
+        """
+        Stop measuring and close the sinks.
+        """
+
+        self.enabled = False
+
+        for sink in self.sinks:
+            sink.close()
+
+        self.sinks = []
+
+    def reset(self) -> None:
+        """
+        Forget the histograms and the counter totals.
+        """
+
+        with self.lock:
+            self.histograms = {}
+            self.totals = {}
+
+    def stage(self, name: str):
+        """
+        Time a block of code.
+
+        Args:
+            name (str): name of the stage.
+
+        Returns:
+            context manager that measures the block.
+        """
+
+        if not self.enabled:
+            return NULL_STAGE
+
+        if self.memory:
+            return MemoryStage(self, name)
+
+        return Stage(self, name)
+
+    def count(self, name: str, value: int) -> None:
+        """
+        Record a counter, like the number of points left by a stage.
+
+        Args:
+            name (str): name of the counter.
+            value (int): counted value.
+        """
+
+        if not self.enabled:
+            return
+
+        record = getattr(self.local, "record", None)
+
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0) + value
+
+        if record is None:
+            self.emit({"counters": {name: value}})
+        else:
+            record["counters"][name] = record["counters"].get(name, 0) + value
+
+    def add_time(self, name: str, elapsed_ms: float) -> None:
+        """
+        Record the latency of a stage.
+
+        Args:
+            name (str): name of the stage.
+            elapsed_ms (float): latency in milliseconds.
+        """
+
+        record = getattr(self.local, "record", None)
+
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+
+            self.histograms[name].add(elapsed_ms)
+
+        if record is None:
+            self.emit({"stages": {name: elapsed_ms}})
+        else:
+            record["stages"][name] = record["stages"].get(name, 0.0) + elapsed_ms
+
+    def add_peak(self, name: str, peak_kib: float) -> None:
+        """
+        Record the peak memory of a stage (the largest one of a frame).
+
+        Args:
+            name (str): name of the stage.
+            peak_kib (float): peak above the memory in use when it began, in KiB.
+        """
+
+        record = getattr(self.local, "record", None)
+
+        if record is None:
+            self.emit({"peak_kib": {name: peak_kib}})
+        else:
+            peaks = record.setdefault("peak_kib", {})
+            peaks[name] = max(peaks.get(name, 0.0), peak_kib)
+
+    def memory_stack(self) -> list:
+        """
+        Returns:
+            list: memory stages open in this thread, innermost last.
+        """
+
+        if not hasattr(self.local, "memory_stack"):
+            self.local.memory_stack = []
+
+        return self.local.memory_stack
+
+    def start_frame(self, **info) -> dict:
+        """
+        Open the record of a new frame.
+
+        Args:
+            info: description of the frame, like its path or index.
+
+        Returns:
+            dict: the record, None while disabled.
+        """
+
+        if not self.enabled:
+            return None
+
+        return {
+            "frame": info,
+            "start": time.time(),
+            "started": time.perf_counter(),
+            "stages": {},
+            "counters": {}
+        }
+
+    def attach(self, record: dict):
+        """
+        Make a frame record current for this thread inside a with block,
+        so the same frame can be worked on by several threads in turn.
+
+        Args:
+            record (dict): returned by start_frame (None does nothing).
+
+        Returns:
+            context manager.
+        """
+
+        if record is None:
+            return NULL_STAGE
+
+        return Attached(self, record)
+
+    def finish_frame(self, record: dict) -> None:
+        """
+        Close the record of a frame and hand it to the sinks.
+
+        Args:
+            record (dict): returned by start_frame (None does nothing).
+        """
+
+        if record is None:
+            return
+
+        record["total_ms"] = 1e3 * (time.perf_counter() - record.pop("started"))
+
+        with self.lock:
+            if "frame" not in self.histograms:
+                self.histograms["frame"] = Histogram()
+
+            self.histograms["frame"].add(record["total_ms"])
+
+        self.emit(record)
+
+    def frame(self, **info):
+        """
+        Measure a whole frame handled by this thread inside a with block.
+
+        Args:
+            info: description of the frame, like its path or index.
+
+        Returns:
+            context manager.
+        """
+
+        if not self.enabled:
+            return NULL_STAGE
+
+        return Frame(self, self.start_frame(**info))
+
+    def emit(self, record: dict) -> None:
+        with self.lock:
+            for sink in self.sinks:
+                sink.emit(record)
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: {"stages", "counters"} with the histogram of each stage
+                (and of the whole frames) and the total of each counter.
+        """
+
+        with self.lock:
+            return {
+                "stages": {
+                    name: histogram.to_dict()
+                    for (name, histogram) in self.histograms.items()
+                },
+                "counters": dict(self.totals)
+            }
+
+
+class Attached:
+    """
+    Make a record current for the thread inside a with block.
+    """
+
+    def __init__(self, owner: Instrumentation, record: dict) -> None:
+        self.owner = owner
+        self.record = record
+
+    def __enter__(self) -> dict:
+        self.previous = getattr(self.owner.local, "record", None)
+        self.owner.local.record = self.record
+
+        return self.record
+
+    def __exit__(self, *exception) -> bool:
+        self.owner.local.record = self.previous
+        return False
+
+
+class Frame(Attached):
+    """
+    Open, attach and finish a frame record around a with block.
+    """
+
+    def __exit__(self, *exception) -> bool:
+        super().__exit__(*exception)
+        self.owner.finish_frame(self.record)
+
+        return False
+
+
+# Instrumentation shared by the whole detection pipeline
+INSTRUMENTATION = Instrumentation()
+
+enable = INSTRUMENTATION.enable
+disable = INSTRUMENTATION.disable
+reset = INSTRUMENTATION.reset
+
+stage = INSTRUMENTATION.stage
+count = INSTRUMENTATION.count
+
+start_frame = INSTRUMENTATION.start_frame
+attach = INSTRUMENTATION.attach
+finish_frame = INSTRUMENTATION.finish_frame
+frame = INSTRUMENTATION.frame
+
+summary = INSTRUMENTATION.summary
@@ -0,0 +1,176 @@
+from functools import lru_cache
+
+import numpy as np
+
+from constantspcl import (
+    CONE_RADIUS,
+    LIDAR_ORIENTATION, LIDAR_DISPLACEMENT,
+    RIG_ORIENTATIONS, RIG_DISPLACEMENTS,
+    SCAN_FIELD_WIDTH, SCAN_FIELD_CENTER_ANGLE,
+    ANGULAR_RESOLUTION, CHANNEL_ANGLE_IN_RAD,
+    DISTANCE_UNCERTAINTY
+)
+
+
+class LidarModel:
+    """
+    Geometry of a LiDAR sensor with the direction of every laser beam
+    precomputed once. Only the vehicle yaw changes between frames, so
+    each pose just rotates the cached direction table.
+    """
+
+    def __init__(
+        self,
+        channel_angles: np.ndarray = CHANNEL_ANGLE_IN_RAD,
+        scan_field_width: float = SCAN_FIELD_WIDTH,
+        scan_field_center_angle: float = SCAN_FIELD_CENTER_ANGLE,
+        angular_resolution: float = ANGULAR_RESOLUTION,
+        displacement: np.ndarray = LIDAR_DISPLACEMENT,
+        orientation: float = LIDAR_ORIENTATION,
+        distance_uncertainty: float = DISTANCE_UNCERTAINTY
+    ) -> None:
+        """
+        Build the sensor profile. Every parameter defaults to constantspcl.
+
+        Args:
+            channel_angles (np.ndarray, optional): angles in radians of the channels
+                concerning the horizontal plane. Only negative angles must be passed.
+
+            scan_field_width (float, optional): horizontal field of view in radians.
+            scan_field_center_angle (float, optional): center of the field of view in radians.
+            angular_resolution (float, optional): azimuth step in radians.
+
+            displacement (np.ndarray, optional): LiDAR position in vehicle frame.
+            orientation (float, optional): LiDAR yaw in vehicle frame in radians.
+
+            distance_uncertainty (float, optional): standard deviation of the range noise.
+        """
+
+        self.channel_angles = np.atleast_1d(np.asarray(channel_angles, dtype=float))
+
+        self.scan_field_width = float(scan_field_width)
+        self.scan_field_center_angle = float(scan_field_center_angle)
+        self.angular_resolution = float(angular_resolution)
+
+        self.displacement = np.asarray(displacement, dtype=float)
+        self.orientation = float(orientation)
+
+        self.distance_uncertainty = float(distance_uncertainty)
+
+        self.num_points = round(2 * np.pi / self.angular_resolution)
+
+        self.angles = np.linspace(
+            self.scan_field_center_angle - 0.5 * self.scan_field_width,
+            self.scan_field_center_angle + 0.5 * self.scan_field_width,
+            self.num_points
+        )
+
+        cos_channels = np.cos(self.channel_angles)[:, np.newaxis]
+
+        self.directions = np.empty((len(self.channel_angles), self.num_points, 3))
+        self.directions[..., 0] = cos_channels * np.cos(self.angles)
+        self.directions[..., 1] = cos_channels * np.sin(self.angles)
+        self.directions[..., 2] = np.sin(self.channel_angles)[:, np.newaxis]
+
+        # The lattice is shared between every frame
+        self.angles.setflags(write=False)
+        self.directions.setflags(write=False)
+
+        min_tan_value = np.min(np.abs(np.tan(self.channel_angles)))
+
+        self.max_distance_to_scan = (
+            CONE_RADIUS + self.displacement[2] / min_tan_value
+        )
+
+    @property
+    def num_channels(self) -> int:
+        """
+        Returns:
+            int: number of channels of the sensor.
+        """
+
+        return len(self.channel_angles)
+
+    def with_channels(self, channel_angles: np.ndarray) -> "LidarModel":
+        """
+        Build a profile with the same geometry but other channels.
+
+        Args:
+            channel_angles (np.ndarray): angles in radians of the channels.
+
+        Returns:
+            LidarModel: the new sensor profile.
+        """
+
+        return LidarModel(
+            channel_angles,
+            self.scan_field_width,
+            self.scan_field_center_angle,
+            self.angular_resolution,
+            self.displacement,
+            self.orientation,
+            self.distance_uncertainty
+        )
+
+    def azimuths(self, yaw: float) -> np.ndarray:
+        """
+        Azimuth of every laser beam for the given LiDAR yaw.
+
+        Args:
+            yaw (float): LiDAR yaw in global frame in radians.
+
+        Returns:
+            np.ndarray: azimuths in radians in global frame.
+        """
+
+        return self.angles + yaw
+
+    def rotated_directions(self, yaw: float) -> np.ndarray:
+        """
+        Direction table rotated by the given LiDAR yaw.
+
+        Args:
+            yaw (float): LiDAR yaw in global frame in radians.
+
+        Returns:
+            np.ndarray: unit directions in global frame, channels in
+                the first axis and azimuths in the second.
+        """
+
+        cos = np.cos(yaw)
+        sin = np.sin(yaw)
+
+        rotated = np.empty_like(self.directions)
+        rotated[..., 0] = cos * self.directions[..., 0] - sin * self.directions[..., 1]
+        rotated[..., 1] = sin * self.directions[..., 0] + cos * self.directions[..., 1]
+        rotated[..., 2] = self.directions[..., 2]
+
+        return rotated
+
+
+@lru_cache(maxsize=None)
+def get_default_model() -> LidarModel:
+    """
+    Get the sensor profile described by constantspcl, built only once per process.
+
+    Returns:
+        LidarModel: the default sensor profile.
+    """
+
+    return LidarModel()
+
+
+@lru_cache(maxsize=None)
+def get_rig_models() -> tuple:
+    """
+    Get the sensor profiles of the multi LiDAR rig described by constantspcl,
+    built only once per process.
+
+    Returns:
+        tuple: one LidarModel per sensor of the rig.
+    """
+
+    return tuple(
+        LidarModel(displacement=displacement, orientation=orientation)
+        for (displacement, orientation) in zip(RIG_DISPLACEMENTS, RIG_ORIENTATIONS)
+    )
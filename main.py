@@ -1,11 +1,11 @@
+import sys
 
-from handler import *
-from processing import *
-import os
+import pipeline
 
 
-def main():
-    processing(pcl)
+def main(pointclouds: str = "pcls", destination: str = "centroids") -> None:
+    report = pipeline.run_pipeline(pointclouds, destination)
+    pipeline.print_report(report)
 
 if __name__ == '__main__':
 
@@ -13,19 +13,15 @@ if __name__ == '__main__':
 
     pointclouds = 'pcls'                #pointclouds = folder que contem as pcls
 
-    #for pcloud in os.listdir(pointclouds):  
-    #handler = Handler(os.path.join(pointclouds, pcloud),"outtest.txt")  #os.path.join(pointclouds, pcloud)
-    handler = Handler("pcls/pcl_0.csv","outtest.txt")  #os.path.join(pointclouds, pcloud)
-    handler.txtToList()
-    pcl = handler.pclList
-    pcl = np.asarray(pcl)
+    if len(sys.argv) > 1:
+        pointclouds = sys.argv[1]
 
 
     import cProfile, pstats
 
     profiler = cProfile.Profile()
     profiler.enable()
-    main()
+    main(pointclouds)
     profiler.disable()
     stats = pstats.Stats(profiler).sort_stats('ncalls')
     stats.strip_dirs()
@@ -44,4 +40,3 @@ if __name__ == '__main__':
     #sudo apt install graphviz
     #gprof2dot -f pstats destino | dot -Tpng -o out.png
     #eog out.png
-
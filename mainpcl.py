@@ -1,86 +1,93 @@
 import os
-import json
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import numpy as np
 
 import handlerpcl as handlerpcl
+import pclbin
 import simulate
+import utils
+
+from lidar import get_default_model
+from rangeimage import RangeImage
 
-from constantspcl import MAX_DISTANCE_TO_SCAN
+from constantspcl import POINT_DTYPE
 
 
-def load_track(filename: str = "track.json") -> dict:
+def write_frame(filename: str, frame) -> None:
     """
-    Load track from JSON file.
+    Store a simulated frame.
 
     Args:
-        filename (str, optional): name of the JSON file
-            that will be read. Defaults to "track.json".
-
-    Returns:
-        dict: that represents the track {"cones", "center_line"}.
+        filename (str): name of the file that will be created.
+        frame: point cloud or RangeImage (binary only).
     """
 
-    track = {"cones": None, "center_line": None}
-
-    with open(filename) as file:
-        content = json.load(file)
-
-        track["cones"] = np.concatenate(
-            (np.asarray(content["mark_cones"]),
-             np.asarray(content["blue_cones"]),
-             np.asarray(content["yellow_cones"])), axis=0
-        )
-
-        track["center_line"] = np.asarray(content["center_line"])
-
-    return track
+    if isinstance(frame, RangeImage):
+        frame.write(filename)
+    else:
+        handlerpcl.write_point_cloud(filename, frame)
 
 
-def get_vehicle_pose(track: dict, index: int) -> np.ndarray:
+def generate_frames(
+    indexes, track: dict, directory: str, seed: int,
+    extension: str = ".csv", organized: bool = False
+) -> int:
     """
-    Get vehicle pose from some position in the track.
+    Generate and store the point clouds of some positions of the track, one
+    frame at a time in a single reused buffer, so the memory does not grow
+    with the number of frames.
+
+    Every frame draws from its own random stream derived from the base seed
+    and the index, so the output does not depend on the generation order.
 
     Args:
+        indexes: indexes that represent the vehicle positions in the track.
         track (dict): dict that represents the track {"cones", "center_line"}.
-        index (int): index that represents the vehicle position in the track.
 
-    Returns:
-        np.ndarray: vehicle pose in global frame [x, y, z, yaw].
-    """
-
-    pose = np.zeros(4)
-
-    direction = (
-        track["center_line"][index+1] - track["center_line"][index]
-    )
+        directory (str): path and name of the directory
+            where the point clouds will be stored.
 
-    pose[:2] = track["center_line"][index]
-    pose[3] = np.arctan2(direction[1], direction[0])
+        seed (int): base seed of the random streams.
 
-    return pose
+        extension (str, optional): file extension, ".csv" or
+            pclbin.BINARY_EXTENSION. Defaults to ".csv".
 
+        organized (bool, optional): store the range images (binary only)
+            instead of the shuffled points. Defaults to False.
 
-def get_closest_cones(pose: np.ndarray, cones: np.ndarray) -> np.ndarray:
+    Returns:
+        int: number of stored frames.
     """
-    Get only the cones that are close enough to be detected.
 
-    Args:
-        pose (np.ndarray): vehicle pose in global frame [x, y, z, yaw].
-        cones (np.ndarray): all cones with 3D coordinates in rows.
+    model = get_default_model()
+    buffer = np.empty((model.num_channels * model.num_points, 3), dtype=POINT_DTYPE)
 
-    Returns:
-        np.ndarray: only visible cones with 3D coordinates in rows.
-    """
+    frames = simulate.generate_frames(
+        track, indexes, seed, model, organized=organized, out=buffer
+    )
+
+    count = 0
 
-    vectors = cones - pose[:2]
+    for (index, frame) in frames:
+        write_frame(f"{directory}//pcl_{index}{extension}", frame)
+        count += 1
 
-    mask = np.einsum("ij,ij->i", vectors, vectors) < MAX_DISTANCE_TO_SCAN**2
+        # handler.draw2D(point_cloud)
+        # handler.draw3D(point_cloud)
+        # handler.draw_lidar_view(track, pose)
 
-    return cones[mask]
+    return count
 
 
-def main(ini_index: int, fin_index: int, directory: str) -> None:
+def main(
+    ini_index: int, fin_index: int, directory: str,
+    workers: int = 1, seed: int = 0, extension: str = ".csv",
+    organized: bool = False, track_cache: str = None
+) -> None:
     """
     Generate some point clouds from a possible trajectory of the vehicle on the track.
 
@@ -90,9 +97,27 @@ def main(ini_index: int, fin_index: int, directory: str) -> None:
 
         directory (str): path and name of the directory
             where the point clouds will be stored.
+
+        workers (int, optional): number of worker processes that share
+            the index range. Defaults to 1 (no extra process).
+
+        seed (int, optional): base seed of the per frame random streams.
+            Defaults to 0.
+
+        extension (str, optional): file extension, ".csv" or
+            pclbin.BINARY_EXTENSION. Defaults to ".csv".
+
+        organized (bool, optional): store range images (binary only) instead
+            of shuffled points. Defaults to False.
+
+        track_cache (str, optional): .npz file that keeps the loaded track
+            between runs. Defaults to None (no cache).
     """
 
-    track = load_track()
+    if organized and not pclbin.is_binary(extension):
+        raise ValueError("organized point clouds are only stored in the binary format")
+
+    track = utils.load_track(cache=track_cache)
 
     if not os.path.exists(directory):
         os.mkdir(directory)
@@ -102,20 +127,32 @@ def main(ini_index: int, fin_index: int, directory: str) -> None:
     else:
         fin_index += 1
 
-    for index in range(ini_index, fin_index):
-        pose = get_vehicle_pose(track, index)
-        nearby = get_closest_cones(pose, track["cones"])
+    indexes = range(ini_index, fin_index)
+    task = partial(
+        generate_frames, track=track, directory=directory, seed=seed,
+        extension=extension, organized=organized
+    )
 
-        point_cloud = simulate.generate_point_cloud(pose, nearby)
-        np.random.shuffle(point_cloud)
+    start = time.perf_counter()
 
-        handlerpcl.write_point_cloud(f"{directory}//pcl_{index}", point_cloud)
+    if workers > 1:
+        # Every worker streams consecutive index ranges through its own buffer
+        chunksize = max(1, len(indexes) // (4 * workers))
+        chunks = [indexes[first:first + chunksize] for first in range(0, len(indexes), chunksize)]
 
-        # handler.draw2D(point_cloud)
-        # handler.draw3D(point_cloud)
-        # handler.draw_lidar_view(track, pose)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(task, chunks):
+                pass
+    else:
+        task(indexes)
 
+    elapsed = time.perf_counter() - start
 
-if __name__ == "__main__":
-    main(0, 5, "pcls")
+    print(
+        "Generated %d point clouds in %.2f s (%.2f frames/s, %d workers)."
+        % (len(indexes), elapsed, len(indexes) / elapsed, workers)
+    )
 
+
+if __name__ == "__main__":
+    main(0, 5, "pcls", workers=os.cpu_count())
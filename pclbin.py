@@ -0,0 +1,357 @@
+import os
+import sys
+import struct
+import warnings
+
+from itertools import islice
+
+import numpy as np
+
+import instrument
+
+from constantspcl import POINT_DTYPE
+
+
+BINARY_EXTENSION = ".pclb"
+
+MAGIC = b"PCLB"
+VERSION = 1
+
+# magic, version, number of columns, number of points, dtype, column names
+HEADER_FORMAT = "<4sHHQ8s40s"
+HEADER_SIZE = 64
+
+XYZ_COLUMNS = ("x", "y", "z")
+
+TEXT_CHUNK_SIZE = 65536
+
+
+def is_binary(filename: str) -> bool:
+    """
+    Check by the extension whether the file uses the binary point cloud format.
+
+    Args:
+        filename (str): name of the file.
+
+    Returns:
+        bool: True if the file is (or must be written as) a binary point cloud.
+    """
+
+    return filename.endswith(BINARY_EXTENSION)
+
+
+def as_points(point_cloud: np.ndarray, dtype: np.dtype = POINT_DTYPE) -> np.ndarray:
+    """
+    Apply the point cloud dtype policy: 3D coordinates in C-contiguous rows
+    of the given type. Frames that already follow it are not copied.
+
+    Args:
+        point_cloud (np.ndarray): points in rows with at least 3 columns.
+        dtype (np.dtype, optional): floating point type. Defaults to POINT_DTYPE.
+
+    Returns:
+        np.ndarray: 3D coordinates in rows.
+    """
+
+    return np.ascontiguousarray(np.asarray(point_cloud)[:, :3], dtype=dtype)
+
+
+def read_header(filename: str) -> dict:
+    """
+    Read the header of a binary point cloud file.
+
+    Args:
+        filename (str): name of the binary file that will be read.
+
+    Returns:
+        dict: that represents the header {"count", "dtype", "columns"}.
+    """
+
+    with open(filename, "rb") as file:
+        raw = file.read(HEADER_SIZE)
+
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f"{filename} is too short to be a binary point cloud")
+
+    magic, version, num_columns, count, dtype, columns = struct.unpack_from(HEADER_FORMAT, raw)
+
+    if magic != MAGIC:
+        raise ValueError(f"{filename} is not a binary point cloud")
+
+    if version != VERSION:
+        raise ValueError(f"{filename} uses unsupported format version {version}")
+
+    columns = tuple(columns.rstrip(b"\0").decode("ascii").split(","))
+
+    if len(columns) != num_columns:
+        raise ValueError(f"{filename} has a corrupted header")
+
+    return {
+        "count": count,
+        "dtype": np.dtype(dtype.rstrip(b"\0").decode("ascii")),
+        "columns": columns
+    }
+
+
+def read_binary(filename: str) -> np.ndarray:
+    """
+    Map a binary point cloud file into memory without copying it.
+
+    Args:
+        filename (str): name of the binary file that will be read.
+
+    Returns:
+        np.ndarray: read-only points in rows, with the columns of the header
+            (x, y, z and an optional extra column).
+    """
+
+    header = read_header(filename)
+    shape = (header["count"], len(header["columns"]))
+
+    if header["count"] == 0:
+        return np.empty(shape, dtype=header["dtype"])
+
+    return np.memmap(
+        filename, dtype=header["dtype"], mode="r", offset=HEADER_SIZE, shape=shape
+    )
+
+
+def write_binary(
+    filename: str, point_cloud: np.ndarray,
+    extra: np.ndarray = None, extra_name: str = "intensity"
+) -> None:
+    """
+    Generate a binary point cloud file.
+
+    Args:
+        filename (str): name of the binary file that will be created.
+        point_cloud (np.ndarray): 3D coordinates in rows.
+
+        extra (np.ndarray, optional): one extra value per point, like the
+            intensity or the channel. Defaults to None.
+
+        extra_name (str, optional): name of the extra column. Defaults to "intensity".
+    """
+
+    columns = XYZ_COLUMNS
+    data = np.asarray(point_cloud)[:, :3]
+
+    if extra is not None:
+        columns += (extra_name,)
+        data = np.column_stack((data, extra))
+
+    data = np.ascontiguousarray(data)
+
+    names = ",".join(columns).encode("ascii")
+    dtype = data.dtype.str.encode("ascii")
+
+    header = struct.pack(
+        HEADER_FORMAT, MAGIC, VERSION, len(columns), len(data), dtype, names
+    )
+
+    with open(filename, "wb") as file:
+        file.write(header.ljust(HEADER_SIZE, b"\0"))
+        file.write(data.tobytes())
+
+
+def parse_lines(lines: list, columns: int = 3) -> tuple:
+    """
+    Parse text lines with 3 or 4 columns separated by commas and/or any
+    amount of whitespace.
+
+    Args:
+        lines (list): lines of a CSV or TXT point cloud.
+        columns (int, optional): 3 keeps the 3D coordinates, 4 also keeps
+            the optional extra column (np.nan on the lines without it).
+            Defaults to 3.
+
+    Returns:
+        tuple: points in rows and the number of skipped lines.
+    """
+
+    if len(lines) == 0:
+        return np.empty((0, columns)), 0
+
+    lines = [line.replace(",", " ") for line in lines]
+
+    # Fast path: a well formed chunk goes through the numpy C parser
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")   # Chunk with blank lines only
+
+            points = np.loadtxt(lines, ndmin=2)
+    except ValueError:
+        points = None
+
+    if points is not None and points.shape[1] in (3, 4):
+        if points.shape[1] < columns:
+            points = np.column_stack((points, np.full(len(points), np.nan)))
+
+        return points[:, :columns], len(lines) - len(points)
+
+    rows = [line.split() for line in lines]
+    counts = np.fromiter(map(len, rows), dtype=int, count=len(rows))
+
+    valid = (counts == 3) | (counts == 4)
+
+    # Lines of 3 columns get np.nan as extra column
+    rows = [(row + ["nan"])[:columns] for (row, ok) in zip(rows, valid) if ok]
+
+    tokens = [token for row in rows for token in row]
+
+    try:
+        points = np.fromiter(map(float, tokens), dtype=float, count=len(tokens))
+    except ValueError:
+        points = None
+
+    if points is not None:
+        return points.reshape((-1, columns)), len(lines) - len(rows)
+
+    # Some token is not a number: fall back to line by line conversion
+    parsed = []
+    for row in rows:
+        try:
+            parsed.append([float(value) for value in row])
+        except ValueError:
+            continue
+
+    return np.asarray(parsed, dtype=float).reshape((-1, columns)), len(lines) - len(parsed)
+
+
+def iter_text(file, chunk_size: int = TEXT_CHUNK_SIZE, columns: int = 3):
+    """
+    Parse an open CSV or TXT point cloud in chunks of lines.
+
+    Args:
+        file: text file positioned at the first line of points.
+        chunk_size (int, optional): number of lines per chunk.
+            Defaults to TEXT_CHUNK_SIZE.
+        columns (int, optional): columns kept (see parse_lines). Defaults to 3.
+
+    Yields:
+        tuple: points in rows and the number of skipped lines of each chunk.
+    """
+
+    while True:
+        lines = list(islice(file, chunk_size))
+
+        if not lines:
+            return
+
+        yield parse_lines(lines, columns)
+
+
+def write_text(file, point_cloud: np.ndarray, chunk_size: int = TEXT_CHUNK_SIZE) -> None:
+    """
+    Write the points as "x y z" lines, a whole chunk of lines at a time.
+
+    Args:
+        file: text file open for writing.
+        point_cloud (np.ndarray): 3D coordinates in rows.
+        chunk_size (int, optional): number of lines per write.
+            Defaults to TEXT_CHUNK_SIZE.
+    """
+
+    rows = np.asarray(point_cloud).tolist()
+
+    for start in range(0, len(rows), chunk_size):
+        file.write("".join(
+            " ".join(map(str, row)) + "\n" for row in rows[start:start + chunk_size]
+        ))
+
+
+def read_points(filename: str) -> np.ndarray:
+    """
+    Read the 3D coordinates of a binary, CSV (with header) or TXT point cloud.
+
+    Args:
+        filename (str): name of the file that will be read.
+
+    Returns:
+        np.ndarray: 3D coordinates in rows (see as_points).
+    """
+
+    with instrument.stage("load"):
+        if is_binary(filename):
+            points = as_points(read_binary(filename))
+        else:
+            with open(filename) as file:
+                if filename.endswith(".csv"):
+                    next(file, None)
+
+                chunks = [as_points(points) for (points, _) in iter_text(file)]
+
+            points = np.concatenate(chunks) if chunks else np.empty((0, 3), POINT_DTYPE)
+
+    instrument.count("loaded", len(points))
+
+    return points
+
+
+def read_text(filename: str) -> np.ndarray:
+    """
+    Read a point cloud from a CSV (with header) or TXT (whitespace separated)
+    file with the parser of read_points, keeping the optional extra column.
+    Lines without 3 or 4 columns are skipped.
+
+    Args:
+        filename (str): name of the text file that will be read.
+
+    Returns:
+        np.ndarray: points in rows with 4 columns, the extra one is np.nan
+            on the lines of 3 columns.
+    """
+
+    with open(filename) as file:
+        if filename.endswith(".csv"):
+            next(file, None)
+
+        chunks = [points for (points, _) in iter_text(file, columns=4)]
+
+    return np.concatenate(chunks) if chunks else np.empty((0, 4))
+
+
+def convert_directory(source: str, destination: str = None) -> int:
+    """
+    Convert every CSV and TXT point cloud of a directory to the binary format.
+
+    Args:
+        source (str): directory with the text point clouds.
+        destination (str, optional): directory where the binary files will
+            be stored. Defaults to the source directory.
+
+    Returns:
+        int: number of converted files.
+    """
+
+    destination = source if destination is None else destination
+
+    if not os.path.exists(destination):
+        os.mkdir(destination)
+
+    converted = 0
+
+    for name in sorted(os.listdir(source)):
+        stem, extension = os.path.splitext(name)
+
+        if extension not in (".csv", ".txt"):
+            continue
+
+        points = read_text(os.path.join(source, name))
+
+        # The extra column is only stored when some line has it
+        extra = points[:, 3] if np.any(~np.isnan(points[:, 3])) else None
+
+        write_binary(
+            os.path.join(destination, stem + BINARY_EXTENSION), points[:, :3], extra
+        )
+
+        converted += 1
+
+    return converted
+
+
+if __name__ == "__main__":
+    converted = convert_directory(*sys.argv[1:3])
+
+    print("Converted %d point clouds." % converted)
@@ -0,0 +1,352 @@
+import os
+import re
+import glob
+import queue
+import threading
+import time
+
+import numpy as np
+
+import instrument
+import pclbin
+import ransac
+
+from processing import processing
+
+
+# Frames waiting between two stages
+QUEUE_SIZE = 8
+
+
+def list_frames(source: str) -> list:
+    """
+    List the point cloud files of a directory or glob pattern in frame order
+    (numbers in the names are compared by value, so pcl_10 comes after pcl_9).
+
+    Args:
+        source (str): directory or glob pattern of the point clouds.
+
+    Returns:
+        list: paths of the point clouds.
+    """
+
+    if os.path.isdir(source):
+        paths = [
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.endswith((".csv", ".txt", pclbin.BINARY_EXTENSION))
+        ]
+    else:
+        paths = glob.glob(source)
+
+    def natural_key(path: str) -> list:
+        return [
+            int(part) if part.isdigit() else part
+            for part in re.split(r"(\d+)", os.path.basename(path))
+        ]
+
+    return sorted(paths, key=natural_key)
+
+
+def centroids_path(path: str, destination: str, extension: str) -> str:
+    """
+    Name of the file that stores the centroids of a frame.
+
+    Args:
+        path (str): path of the frame.
+        destination (str): directory of the centroid files.
+        extension (str): ".txt" or pclbin.BINARY_EXTENSION.
+
+    Returns:
+        str: path of the centroid file.
+    """
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+
+    return os.path.join(destination, f"{stem}_centroids{extension}")
+
+
+def write_centroids(filename: str, centroids: np.ndarray) -> None:
+    """
+    Store the centroids of a frame as text ("x y z" lines) or binary.
+
+    Args:
+        filename (str): name of the file that will be created.
+        centroids (np.ndarray): 3D coordinates of the cones centroid.
+    """
+
+    if pclbin.is_binary(filename):
+        pclbin.write_binary(filename, centroids)
+        return
+
+    with open(filename, "w") as file:
+        pclbin.write_text(file, centroids)
+
+
+class Stage:
+    """
+    Pool of threads that apply a function to the items of a queue and
+    put the results into the next queue.
+    """
+
+    def __init__(self, name: str, function, workers: int, inbox: queue.Queue, outbox: queue.Queue) -> None:
+        """
+        Args:
+            name (str): name of the stage in the report.
+            function: applied to each item.
+            workers (int): number of threads.
+            inbox (queue.Queue): items to process, one None per thread ends it.
+            outbox (queue.Queue): results, or None for the last stage.
+        """
+
+        self.name = name
+        self.function = function
+        self.inbox = inbox
+        self.outbox = outbox
+
+        self.errors = []
+        self.busy_time = 0.0
+        self.items = 0
+
+        self.max_depth = 0
+        self.depth_sum = 0
+
+        self.lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self.work, name=f"{name}-{index}", daemon=True)
+            for index in range(workers)
+        ]
+
+    def start(self) -> None:
+        """
+        Start the threads of the stage.
+        """
+
+        for thread in self.threads:
+            thread.start()
+
+    def close(self) -> None:
+        """
+        Wait for every item of the inbox to be processed.
+        """
+
+        for _ in self.threads:
+            self.inbox.put(None)
+
+        for thread in self.threads:
+            thread.join()
+
+    def work(self) -> None:
+        """
+        Thread loop: process the items of the inbox until a None arrives.
+        """
+
+        while True:
+            item = self.inbox.get()
+
+            if item is None:
+                return
+
+            depth = self.inbox.qsize()
+            start = time.perf_counter()
+
+            try:
+                result = self.function(item)
+            except Exception as error:
+                with self.lock:
+                    self.errors.append((item[0], error))
+                continue
+
+            with self.lock:
+                self.busy_time += time.perf_counter() - start
+                self.items += 1
+
+                self.max_depth = max(self.max_depth, depth)
+                self.depth_sum += depth
+
+            if self.outbox is not None:
+                self.outbox.put(result)
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: {"workers", "items", "busy_s", "max_queue", "mean_queue", "errors"}
+                where the queue depths are those seen in the inbox.
+        """
+
+        return {
+            "workers": len(self.threads),
+            "items": self.items,
+            "busy_s": self.busy_time,
+            "max_queue": self.max_depth,
+            "mean_queue": self.depth_sum / self.items if self.items else 0.0,
+            "errors": len(self.errors)
+        }
+
+
+def run_pipeline(
+    source: str, destination: str = None,
+    readers: int = 2, processors: int = 2, writers: int = 1,
+    queue_size: int = QUEUE_SIZE, extension: str = ".txt",
+    track_floor: bool = False
+) -> dict:
+    """
+    Detect the cones of every frame of a directory (or glob) with overlapped
+    reading, processing and writing stages connected by bounded queues.
+
+    Args:
+        source (str): directory or glob pattern of the point clouds.
+        destination (str, optional): directory where the centroids of each
+            frame will be stored. Defaults to None (nothing is written).
+
+        readers (int, optional): threads loading frames. Defaults to 2.
+        processors (int, optional): threads running processing. Defaults to 2.
+        writers (int, optional): threads storing centroids. Defaults to 1.
+
+        queue_size (int, optional): capacity of the queues between
+            stages. Defaults to QUEUE_SIZE.
+
+        extension (str, optional): ".txt" or pclbin.BINARY_EXTENSION for
+            the centroid files. Defaults to ".txt".
+
+        track_floor (bool, optional): track the floor plane between frames
+            with a ransac.FloorEstimator per processing thread (each thread
+            gets the frames in order). Defaults to False.
+
+    Returns:
+        dict: {"frames", "centroids", "elapsed_s", "fps", "stages"} with the
+            centroids of each frame in frame order and the report of each
+            stage, and "floor" (see ransac.floor_statistics) with track_floor.
+    """
+
+    paths = list_frames(source)
+
+    if destination is not None and not os.path.exists(destination):
+        os.mkdir(destination)
+
+    centroids = [None] * len(paths)
+
+    # Floor tracker of each processing thread
+    local = threading.local()
+    estimators = []
+
+    def get_estimator() -> ransac.FloorEstimator:
+        if not track_floor:
+            return None
+
+        if not hasattr(local, "estimator"):
+            local.estimator = ransac.FloorEstimator()
+            estimators.append(local.estimator)
+
+        return local.estimator
+
+    # The instrumentation record of a frame travels with it between the stages
+    def read(item: tuple) -> tuple:
+        index, path = item
+        record = instrument.start_frame(index=index, path=path)
+
+        with instrument.attach(record):
+            return index, path, record, pclbin.read_points(path)
+
+    def process(item: tuple) -> tuple:
+        index, path, record, point_cloud = item
+
+        with instrument.attach(record):
+            return index, path, record, processing(point_cloud, estimator=get_estimator())
+
+    def write(item: tuple) -> tuple:
+        index, path, record, result = item
+        centroids[index] = result
+
+        if destination is not None:
+            with instrument.attach(record), instrument.stage("write"):
+                write_centroids(centroids_path(path, destination, extension), result)
+
+        instrument.finish_frame(record)
+
+        return item
+
+    path_queue = queue.Queue(queue_size)
+    frame_queue = queue.Queue(queue_size)
+    result_queue = queue.Queue(queue_size)
+
+    stages = [
+        Stage("read", read, readers, path_queue, frame_queue),
+        Stage("process", process, processors, frame_queue, result_queue),
+        Stage("write", write, writers, result_queue, None)
+    ]
+
+    start = time.perf_counter()
+
+    for stage in stages:
+        stage.start()
+
+    for item in enumerate(paths):
+        path_queue.put(item)
+
+    for stage in stages:
+        stage.close()
+
+    elapsed = time.perf_counter() - start
+
+    for stage in stages:
+        for (index, error) in stage.errors:
+            raise RuntimeError(f"{stage.name} failed on {paths[index]}") from error
+
+    report = {
+        "frames": len(paths),
+        "centroids": centroids,
+        "elapsed_s": elapsed,
+        "fps": len(paths) / elapsed if elapsed > 0 else 0.0,
+        "stages": {stage.name: stage.report() for stage in stages}
+    }
+
+    if track_floor:
+        report["floor"] = ransac.floor_statistics(estimators)
+
+    return report
+
+
+def print_report(report: dict) -> None:
+    """
+    Print the throughput and the queue depths of a pipeline run.
+
+    Args:
+        report (dict): returned by run_pipeline.
+    """
+
+    print(
+        "Processed %d frames in %.2f s (%.2f frames/s)."
+        % (report["frames"], report["elapsed_s"], report["fps"])
+    )
+
+    for (name, stage) in report["stages"].items():
+        print(
+            "  %-8s %d workers, busy %.2f s, queue max %d mean %.1f, %d errors"
+            % (name, stage["workers"], stage["busy_s"], stage["max_queue"],
+               stage["mean_queue"], stage["errors"])
+        )
+
+    if "floor" in report:
+        print_floor(report["floor"])
+
+    # Latency of the detection steps when the instrumentation is enabled
+    for (name, histogram) in instrument.summary()["stages"].items():
+        print(
+            "  %-10s mean %7.2f ms, p50 <= %g ms, p95 <= %g ms, max %7.2f ms"
+            % (name, histogram["mean"], histogram["p50"], histogram["p95"], histogram["max"])
+        )
+
+
+def print_floor(statistics: dict) -> None:
+    """
+    Print the hit rate of the floor tracking.
+
+    Args:
+        statistics (dict): returned by ransac.floor_statistics.
+    """
+
+    print(
+        "  floor    %d/%d warm hits (%.0f%%), warm %.2f ms, full RANSAC %.2f ms, %.1f ms saved"
+        % (statistics["warm_hits"], statistics["frames"], 100 * statistics["hit_rate"],
+           statistics["warm_ms"], statistics["full_ms"], statistics["saved_ms"])
+    )
@@ -1,39 +1,487 @@
-import numpy as np
+import atexit
+
+from functools import lru_cache
+from concurrent.futures import Executor, ThreadPoolExecutor
 
-# from cuml.cluster import DBSCAN
-from sklearn.cluster import DBSCAN
+import numpy as np
 
+import clustering
+import instrument
+import pclbin
 import ransac
+import scanline
+
+from lidar import LidarModel, get_rig_models
+from rangeimage import RangeImage, locate_points
 
 from constants import *
+from constantspcl import POINT_DTYPE
 
 
-def processing(point_cloud: np.ndarray) -> np.ndarray:
+def compute_cluster_features(point_cloud: np.ndarray, labels: np.ndarray) -> dict:
+    """
+    Compute the features of every cluster in a single grouped pass.
+    Noise points (label -1) are ignored.
+
+    Args:
+        point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+        labels (np.ndarray): cluster label of each point.
+
+    Returns:
+        dict: per cluster features in rows {"count", "centroid", "minimum",
+            "maximum", "height", "radial_spread"}.
+    """
+
+    num_clusters = labels.max() + 1 if len(labels) > 0 else 0
+
+    # Noise goes to an extra first row, so the points are never copied by label
+    ids = labels + 1
+    rows = num_clusters + 1
+
+    count = np.bincount(ids, minlength=rows)
+
+    sums = np.stack(
+        [np.bincount(ids, point_cloud[:, axis], rows) for axis in range(3)],
+        axis=1
+    )
+
+    centroid = sums / np.maximum(count, 1)[:, np.newaxis]
+
+    minimum = np.full((rows, 3), np.inf, dtype=point_cloud.dtype)
+    maximum = np.full((rows, 3), -np.inf, dtype=point_cloud.dtype)
+
+    np.minimum.at(minimum, ids, point_cloud)
+    np.maximum.at(maximum, ids, point_cloud)
+
+    # Root mean square horizontal distance to the centroid
+    offsets = point_cloud[:, :2] - centroid[ids, :2]
+    squared = np.einsum("ij,ij->i", offsets, offsets)
+
+    radial_spread = np.sqrt(
+        np.bincount(ids, squared, rows)[1:] / count[1:]
+    )
+
+    return {
+        "count": count[1:],
+        "centroid": centroid[1:].astype(point_cloud.dtype),
+        "minimum": minimum[1:],
+        "maximum": maximum[1:],
+        "height": maximum[1:, 2] - minimum[1:, 2],
+        "radial_spread": radial_spread
+    }
+
+
+def filter_clusters(features: dict) -> np.ndarray:
+    """
+    Reject the clusters whose size does not match a cone.
+
+    Args:
+        features (dict): per cluster features of compute_cluster_features.
+
+    Returns:
+        np.ndarray: mask of the clusters that may be cones.
+    """
+
+    extent = features["maximum"][:, :2] - features["minimum"][:, :2]
+    width = np.max(extent, axis=1)
+
+    return (
+        (features["height"] <= CONE_HEIGHT + CLUSTER_SIZE_TOLERANCE)
+        & (width <= 2 * CONE_RADIUS + CLUSTER_SIZE_TOLERANCE)
+    )
+
+
+def label_points(
+    inside: np.ndarray, off_ground: np.ndarray, labels: np.ndarray, cones: np.ndarray
+) -> np.ndarray:
+    """
+    Label every point from the selections made by the detection.
+
+    Args:
+        inside (np.ndarray): mask of the points inside of the crop rectangle.
+        off_ground (np.ndarray): indexes (or mask) of the clustered points.
+        labels (np.ndarray): cluster label of each clustered point (-1 for noise).
+        cones (np.ndarray): mask of the clusters kept as cones.
+
+    Returns:
+        np.ndarray: cone number or LABEL_* constant of each point,
+            with the shape of inside.
+    """
+
+    numbers = np.where(cones, np.cumsum(cones) - 1, LABEL_REJECTED)
+
+    point_labels = np.where(inside, LABEL_FLOOR, LABEL_CROPPED)
+
+    # Noise (-1) picks the appended last entry
+    point_labels[off_ground] = np.append(numbers, LABEL_NOISE)[labels]
+
+    return point_labels
+
+
+def processing(
+    point_cloud, mode: str = DETECTION_MODE, return_labels: bool = False,
+    backend: str = CLUSTER_BACKEND, estimator: ransac.FloorEstimator = None,
+    dtype: np.dtype = POINT_DTYPE
+):
     """
     Remove the floor (RANSAC) and cluster the remaining
     points (DBSCAN) to compute the cones centroid.
 
+    The selections are carried as masks and indexes, so only the clustered
+    points are copied out of the frame.
+
     Args:
-        point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+        point_cloud: 3D coordinates in LiDAR frame (np.ndarray, converted
+            by pclbin.as_points), or a RangeImage for the "scanline" mode.
+
+        mode (str, optional): "ransac" or "scanline" (ground segmentation
+            and clustering over the range image). Defaults to DETECTION_MODE.
+
+        return_labels (bool, optional): also return the label of every
+            original point (the points of RangeImage.points() for a range
+            image). Defaults to False.
+
+        backend (str, optional): DBSCAN engine of the "ransac" mode (see
+            clustering.dbscan). Defaults to CLUSTER_BACKEND.
+
+        estimator (ransac.FloorEstimator, optional): floor tracker of the
+            "ransac" mode, for consecutive frames of one sensor. Defaults
+            to None (full RANSAC on every frame).
+
+        dtype (np.dtype, optional): floating point type the frame is
+            processed in (range images keep theirs). Defaults to POINT_DTYPE.
 
     Returns:
-        np.ndarray: 3D coordinates of cone's centroid in LiDAR frame.
+        3D coordinates of cone's centroid in LiDAR frame (np.ndarray) and,
+            with return_labels, the cone number (row of the centroids) or
+            LABEL_* constant of each point.
     """
 
-    no_floor = ransac.remove_floor(point_cloud)
+    if isinstance(point_cloud, np.ndarray):
+        point_cloud = pclbin.as_points(point_cloud, dtype)
+
+    instrument.count("points", len(point_cloud))
+
+    if mode == "scanline":
+        with instrument.stage("scanline"):
+            if isinstance(point_cloud, RangeImage):
+                image = point_cloud
+            else:
+                image = RangeImage.from_points(point_cloud)
+
+            inside, off_ground = scanline.select(image)
+
+            no_floor = scanline.masked_points(image, off_ground)
+            labels = scanline.cluster_image(image, off_ground)
+
+        instrument.count("off_ground", len(no_floor))
+
+    elif mode == "ransac":
+        if estimator is None:
+            inside, off_ground = ransac.select_off_ground(point_cloud)
+        else:
+            inside, off_ground = estimator.select_off_ground(point_cloud)
+
+        no_floor = point_cloud[off_ground]
+
+        # Run cluster algorithm
+        with instrument.stage("dbscan"):
+            labels = clustering.dbscan(no_floor, MAX_DISTANCE, MIN_SAMPLES, backend)
+
+    else:
+        raise ValueError(f"unknown detection mode {mode!r}")
+
+    with instrument.stage("centroids"):
+        features = compute_cluster_features(no_floor, labels)
+
+        cones = filter_clusters(features)
+        centroids = features["centroid"][cones]
+
+    instrument.count("clusters", len(features["count"]))
+    instrument.count("cones", len(centroids))
 
-    # Run cluster algorithm
-    cluster = DBSCAN(eps=MAX_DISTANCE, min_samples=MIN_SAMPLES)
+    if not return_labels:
+        return centroids
 
-    labels = cluster.fit(no_floor).labels_
+    point_labels = label_points(inside, off_ground, labels, cones)
 
-    del cluster
+    if mode == "scanline":
+        if point_cloud is image:
+            point_labels = point_labels[image.valid]
+        else:
+            # Every point takes the label of its pixel
+            pixels = locate_points(point_cloud, image.model)[0]
+            point_labels = np.append(point_labels.reshape(-1), LABEL_CROPPED)[pixels]
+
+    return centroids, point_labels
+
+
+def processing_batch(point_clouds: list, batch_size: int = BATCH_FRAMES) -> list:
+    """
+    Detect the cones of many frames (RANSAC mode) with the per call costs
+    paid once per batch: the RANSAC hypotheses of every frame are scored in
+    stacked arrays and the off-ground points of every frame are clustered
+    by a single DBSCAN call, each frame shifted by FRAME_SPACING. Nothing is
+    kept between calls (the clustering structures depend on the points).
+
+    The random draws are those of processing called on each frame in turn,
+    so both give the same centroids from the same numpy random state.
+
+    Args:
+        point_clouds (list): 3D coordinates in LiDAR frame of each frame.
+        batch_size (int, optional): frames processed together.
+            Defaults to BATCH_FRAMES.
+
+    Returns:
+        list: 3D coordinates of cone's centroid in LiDAR frame of each frame.
+    """
 
     centroids = []
-    for label in labels:
-        centroids.append(
-            np.mean(no_floor[labels == label], axis=0)
-        )
 
-    
-    return np.asarray(centroids)
+    for start in range(0, len(point_clouds), batch_size):
+        frames = [pclbin.as_points(point_cloud) for point_cloud in point_clouds[start:start + batch_size]]
+
+        instrument.count("points", sum(map(len, frames)))
+
+        with instrument.stage("crop"):
+            insides = [ransac.crop_mask(frame) for frame in frames]
+            cropped = [np.flatnonzero(inside) for inside in insides]
+
+        instrument.count("cropped", sum(map(len, cropped)))
+
+        with instrument.stage("ransac"):
+            # Frames with nothing in the crop rectangle have no floor to fit
+            fitted = [index for (index, rows) in enumerate(cropped) if len(rows) > 0]
+
+            planes = ransac.find_floors(
+                [frames[index] for index in fitted], [cropped[index] for index in fitted]
+            ) if fitted else []
+
+            no_floor = [frame[:0] for frame in frames]
+
+            for (index, plane) in zip(fitted, planes):
+                off_ground = ransac.select_off_plane(frames[index], plane, insides[index])
+                no_floor[index] = frames[index][off_ground]
+
+        sizes = [len(points) for points in no_floor]
+        frame_ids = np.repeat(np.arange(len(frames)), sizes)
+
+        stacked = np.concatenate(no_floor)
+
+        instrument.count("off_ground", len(stacked))
+
+        with instrument.stage("dbscan"):
+            spread = stacked.astype(float)
+            spread[:, 0] += FRAME_SPACING * frame_ids
+
+            # The frames do not interact and the grid engine only visits the cells of
+            # each frame, so the engine is chosen as for an average frame
+            labels = clustering.dbscan(
+                spread, MAX_DISTANCE, MIN_SAMPLES,
+                backend=clustering.select_backend(len(stacked) // len(frames), CLUSTER_BACKEND)
+            )
+
+        with instrument.stage("centroids"):
+            features = compute_cluster_features(stacked, labels)
+            cones = np.flatnonzero(filter_clusters(features))
+
+            clustered = labels >= 0
+
+            cluster_frames = np.zeros(len(features["count"]), dtype=int)
+            cluster_frames[labels[clustered]] = frame_ids[clustered]
+
+            cones = cones[np.argsort(cluster_frames[cones], kind="stable")]
+            counts = np.bincount(cluster_frames[cones], minlength=len(frames))
+
+            centroids.extend(np.split(features["centroid"][cones], np.cumsum(counts)[:-1]))
+
+        instrument.count("clusters", len(features["count"]))
+        instrument.count("cones", len(cones))
+
+    return centroids
+
+
+def sensor_transforms(models: tuple) -> tuple:
+    """
+    Rigid transform from the LiDAR frame of each sensor to the vehicle frame.
+
+    Args:
+        models (tuple): sensor profile of each sensor, with its extrinsics.
+
+    Returns:
+        tuple: rotation matrix (yaw) of each sensor in the first axis and
+            its position in vehicle frame in rows, in POINT_DTYPE.
+    """
+
+    yaws = np.array([model.orientation for model in models])
+
+    cos = np.cos(yaws)
+    sin = np.sin(yaws)
+
+    rotations = np.zeros((len(models), 3, 3))
+    rotations[:, 0, 0] = cos
+    rotations[:, 0, 1] = -sin
+    rotations[:, 1, 0] = sin
+    rotations[:, 1, 1] = cos
+    rotations[:, 2, 2] = 1
+
+    translations = np.array([model.displacement for model in models])
+
+    return rotations.astype(POINT_DTYPE), translations.astype(POINT_DTYPE)
+
+
+def to_vehicle_frame(point_clouds: list, models: tuple) -> tuple:
+    """
+    Move the points of every sensor to the vehicle frame with a single
+    batched transform over the stacked clouds.
+
+    Args:
+        point_clouds (list): 3D coordinates in the LiDAR frame of each sensor.
+        models (tuple): sensor profile of each sensor, with its extrinsics.
+
+    Returns:
+        tuple: stacked 3D coordinates in vehicle frame and the sensor
+            number of each point.
+    """
+
+    rotations, translations = sensor_transforms(models)
+
+    sensor_ids = np.repeat(np.arange(len(point_clouds)), [len(points) for points in point_clouds])
+    stacked = np.concatenate(point_clouds).astype(POINT_DTYPE, copy=False)
+
+    fused = np.einsum("nij,nj->ni", rotations[sensor_ids], stacked) + translations[sensor_ids]
+
+    return fused, sensor_ids
+
+
+def select_sensor_off_ground(
+    point_cloud, model: LidarModel, rng: np.random.Generator = None
+) -> np.ndarray:
+    """
+    Crop one sensor of a rig and remove its floor (RANSAC). The crop
+    rectangle is placed in vehicle frame, so every sensor keeps the same
+    area, while the floor plane is fitted in the LiDAR frame.
+
+    Args:
+        point_cloud: 3D coordinates in LiDAR frame (converted by pclbin.as_points).
+        model (LidarModel): sensor profile, with its extrinsics.
+
+        rng (np.random.Generator, optional): source of the RANSAC draws.
+            Defaults to the global numpy random state.
+
+    Returns:
+        np.ndarray: off-ground points in LiDAR frame.
+    """
+
+    point_cloud = pclbin.as_points(point_cloud)
+
+    cos = np.cos(model.orientation)
+    sin = np.sin(model.orientation)
+
+    # Only the horizontal coordinates are needed by the crop
+    planar = point_cloud[:, :2] @ np.array([[cos, sin], [-sin, cos]], dtype=point_cloud.dtype)
+    inside = ransac.crop_mask(planar + model.displacement[:2].astype(point_cloud.dtype))
+
+    cropped = np.flatnonzero(inside)
+
+    # A sensor may not see the crop rectangle at all
+    if len(cropped) == 0:
+        return point_cloud[:0]
+
+    plane = ransac.find_floor(point_cloud, cropped, rng)
+
+    return point_cloud[ransac.select_off_plane(point_cloud, plane, inside)]
+
+
+@lru_cache(maxsize=None)
+def sensor_pool(workers: int) -> ThreadPoolExecutor:
+    """
+    Get the threads of processing_fused, started only once per process
+    and shut down when it exits.
+
+    Args:
+        workers (int): number of threads.
+
+    Returns:
+        ThreadPoolExecutor: the pool.
+    """
+
+    pool = ThreadPoolExecutor(workers, thread_name_prefix="sensor")
+    atexit.register(pool.shutdown)
+
+    return pool
+
+
+def processing_fused(
+    point_clouds: list, models: tuple = None, workers: int = FUSION_WORKERS,
+    seed: int = None, executor: Executor = None
+) -> np.ndarray:
+    """
+    Detect the cones seen by a multi LiDAR rig (RANSAC mode). The sensors
+    are cropped and their floor removed independently, in parallel, then
+    their off-ground points are moved to the vehicle frame and clustered
+    by a single DBSCAN call, so a cone seen by two sensors is one cluster.
+
+    The stages of the sensors run in the pool threads, so the frame of
+    instrument only records them as a whole ("sensors"). Each sensor draws
+    its RANSAC hypotheses from its own generator, so the result does not
+    depend on the order the threads run in.
+
+    Args:
+        point_clouds (list): 3D coordinates in the LiDAR frame of each sensor.
+
+        models (tuple, optional): sensor profile of each sensor, with its
+            extrinsics. Defaults to lidar.get_rig_models().
+
+        workers (int, optional): threads processing the sensors, 1 runs
+            them in the calling thread. Defaults to FUSION_WORKERS.
+
+        seed (int, optional): sensor s draws from np.random.default_rng([seed, s]).
+            Defaults to None (drawn from the global numpy random state, so
+            np.random.seed still makes the calls repeatable).
+
+        executor (Executor, optional): runs the sensors instead of the
+            shared pool of the given number of workers. Defaults to None.
+
+    Returns:
+        np.ndarray: 3D coordinates of cone's centroid in vehicle frame.
+    """
+
+    models = get_rig_models() if models is None else models
+
+    if len(point_clouds) != len(models):
+        raise ValueError(f"{len(point_clouds)} point clouds for {len(models)} sensors")
+
+    seed = np.random.randint(2**31) if seed is None else seed
+    rngs = [np.random.default_rng([seed, sensor]) for sensor in range(len(models))]
+
+    instrument.count("points", sum(map(len, point_clouds)))
+
+    with instrument.stage("sensors"):
+        if executor is None and workers > 1 and len(models) > 1:
+            executor = sensor_pool(workers)
+
+        if executor is not None:
+            off_ground = list(executor.map(select_sensor_off_ground, point_clouds, models, rngs))
+        else:
+            off_ground = [
+                select_sensor_off_ground(point_cloud, model, rng)
+                for (point_cloud, model, rng) in zip(point_clouds, models, rngs)
+            ]
+
+    with instrument.stage("fuse"):
+        no_floor = to_vehicle_frame(off_ground, models)[0]
+
+    instrument.count("off_ground", len(no_floor))
+
+    with instrument.stage("dbscan"):
+        labels = clustering.dbscan(no_floor, MAX_DISTANCE, MIN_SAMPLES)
+
+    with instrument.stage("centroids"):
+        features = compute_cluster_features(no_floor, labels)
+        centroids = features["centroid"][filter_clusters(features)]
+
+    instrument.count("clusters", len(features["count"]))
+    instrument.count("cones", len(centroids))
+
+    return centroids
@@ -0,0 +1,236 @@
+import numpy as np
+
+import pclbin
+
+from lidar import LidarModel, get_default_model
+
+from constantspcl import POINT_DTYPE
+
+
+# Name of the binary column that keeps the pixel of each point
+PIXEL_COLUMN = "pixel"
+
+
+def locate_points(point_cloud: np.ndarray, model: LidarModel) -> tuple:
+    """
+    Nearest beam of the sensor of each point of a flat point cloud.
+
+    Args:
+        point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+        model (LidarModel): sensor profile.
+
+    Returns:
+        tuple: flat pixel index (channel * azimuth bins + bin) of each
+            point, -1 outside of the field of view, and its range.
+    """
+
+    point_cloud = np.asarray(point_cloud)[:, :3]
+
+    ranges = np.sqrt(np.einsum("ij,ij->i", point_cloud, point_cloud))
+    horizontal = np.hypot(point_cloud[:, 0], point_cloud[:, 1])
+
+    elevations = np.arctan2(point_cloud[:, 2], horizontal)
+    channels = np.argmin(
+        np.abs(elevations[:, np.newaxis] - model.channel_angles), axis=1
+    )
+
+    step = (model.angles[-1] - model.angles[0]) / max(1, model.num_points - 1)
+
+    # Wrapped half a bin early, so the points of the first bin that fall just
+    # before its angle (rounding) are not sent a whole turn away
+    offsets = np.mod(
+        np.arctan2(point_cloud[:, 1], point_cloud[:, 0]) - model.angles[0] + step / 2, 2 * np.pi
+    ) - step / 2
+    bins = np.rint(offsets / step).astype(np.int64)
+
+    inside = (bins < model.num_points) & (ranges > 0)
+
+    return np.where(inside, channels * model.num_points + bins, -1), ranges
+
+
+class RangeImage:
+    """
+    Organized point cloud: one range per laser beam in a channel x azimuth
+    grid, with a validity mask for the beams without return. The pixel of
+    every point is implicit, so the neighbours of a point are found by
+    moving one row (channel) or one column (azimuth bin) in the image.
+    """
+
+    def __init__(
+        self, ranges: np.ndarray, valid: np.ndarray = None, model: LidarModel = None
+    ) -> None:
+        """
+        Args:
+            ranges (np.ndarray): distance of each beam, channels in the
+                first axis and azimuth bins in the second.
+
+            valid (np.ndarray, optional): mask of the beams with a return.
+                Defaults to the finite positive ranges.
+
+            model (LidarModel, optional): sensor profile that defines the
+                grid. Defaults to constantspcl.
+        """
+
+        self.model = get_default_model() if model is None else model
+
+        shape = (self.model.num_channels, self.model.num_points)
+
+        ranges = np.asarray(ranges)
+
+        if ranges.shape != shape:
+            raise ValueError(f"range image of shape {ranges.shape}, expected {shape}")
+
+        if valid is None:
+            valid = np.isfinite(ranges) & (ranges > 0)
+
+        self.ranges = np.where(valid, ranges, 0).astype(POINT_DTYPE)
+        self.valid = np.asarray(valid, dtype=bool)
+
+    @property
+    def shape(self) -> tuple:
+        """
+        Returns:
+            tuple: number of channels and of azimuth bins.
+        """
+
+        return self.ranges.shape
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.valid))
+
+    def pixels(self) -> tuple:
+        """
+        Pixel of every valid point, in the order of points().
+
+        Returns:
+            tuple: channel index and azimuth bin of each point.
+        """
+
+        return np.nonzero(self.valid)
+
+    def points(self) -> np.ndarray:
+        """
+        Flatten the image, channel after channel.
+
+        Returns:
+            np.ndarray: 3D coordinates of the valid points in LiDAR frame.
+        """
+
+        channels, bins = self.pixels()
+
+        return np.multiply(
+            self.ranges[channels, bins, np.newaxis], self.model.directions[channels, bins],
+            dtype=self.ranges.dtype
+        )
+
+    def index_image(self, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Row of points() stored in each pixel, for constant time lookups.
+
+        Args:
+            mask (np.ndarray, optional): pixels to number instead, in row
+                major order like scanline.masked_points. Defaults to the
+                valid pixels.
+
+        Returns:
+            np.ndarray: row index of each pixel, -1 where there is no point.
+        """
+
+        mask = self.valid if mask is None else mask
+
+        index = np.full(self.shape, -1)
+        index[mask] = np.arange(np.count_nonzero(mask))
+
+        return index
+
+    @classmethod
+    def from_points(cls, point_cloud: np.ndarray, model: LidarModel = None) -> "RangeImage":
+        """
+        Organize a flat point cloud by the nearest beam of the sensor. Points
+        outside of the field of view are dropped and, when two points fall in
+        the same pixel, the nearest one is kept.
+
+        Args:
+            point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+            model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+
+        Returns:
+            RangeImage: the organized point cloud.
+        """
+
+        model = get_default_model() if model is None else model
+
+        pixels, ranges = locate_points(point_cloud, model)
+        inside = pixels >= 0
+
+        image = np.full((model.num_channels, model.num_points), np.inf)
+        np.minimum.at(image.reshape(-1), pixels[inside], ranges[inside])
+
+        return cls(image, np.isfinite(image), model)
+
+    @classmethod
+    def from_pixels(
+        cls, point_cloud: np.ndarray, pixels: np.ndarray, model: LidarModel = None
+    ) -> "RangeImage":
+        """
+        Rebuild an image from its points and their flat pixel indexes.
+
+        Args:
+            point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+            pixels (np.ndarray): channel * azimuth bins + bin of each point.
+            model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+
+        Returns:
+            RangeImage: the organized point cloud.
+        """
+
+        model = get_default_model() if model is None else model
+
+        point_cloud = np.asarray(point_cloud)[:, :3]
+        pixels = np.asarray(pixels).astype(np.int64)
+
+        shape = (model.num_channels, model.num_points)
+
+        ranges = np.zeros(shape)
+        valid = np.zeros(shape, dtype=bool)
+
+        ranges.flat[pixels] = np.sqrt(np.einsum("ij,ij->i", point_cloud, point_cloud))
+        valid.flat[pixels] = True
+
+        return cls(ranges, valid, model)
+
+    def write(self, filename: str) -> None:
+        """
+        Store the valid points in the binary point cloud format, with the
+        flat pixel index of each point as extra column.
+
+        Args:
+            filename (str): name of the binary file that will be created.
+        """
+
+        if not pclbin.is_binary(filename):
+            raise ValueError(f"{filename} is not a binary point cloud name")
+
+        pixels = np.flatnonzero(self.valid)
+
+        pclbin.write_binary(filename, self.points(), pixels, PIXEL_COLUMN)
+
+    @classmethod
+    def read(cls, filename: str, model: LidarModel = None) -> "RangeImage":
+        """
+        Load a point cloud as a range image. Files written by write keep
+        their pixels, any other point cloud is organized by from_points.
+
+        Args:
+            filename (str): name of the file that will be read.
+            model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+
+        Returns:
+            RangeImage: the organized point cloud.
+        """
+
+        if pclbin.is_binary(filename) and PIXEL_COLUMN in pclbin.read_header(filename)["columns"]:
+            data = pclbin.read_binary(filename)
+            return cls.from_pixels(data[:, :3], data[:, 3], model)
+
+        return cls.from_points(pclbin.read_points(filename), model)
@@ -1,5 +1,10 @@
+import time
+
 import numpy as np
 
+import instrument
+import voxel
+
 from constants import *
 
 
@@ -14,10 +19,25 @@ def crop_rectangle(point_cloud: np.ndarray) -> np.ndarray:
         np.ndarray: filtered point cloud.
     """
 
-    mask_x = (MINIMUM_X < point_cloud[:, 0]) & (point_cloud[:, 0] < MAXIMUM_X)
-    mask_y = (MINIMUM_Y < point_cloud[:, 1]) & (point_cloud[:, 1] < MAXIMUM_Y)
+    return point_cloud[crop_mask(point_cloud)]
+
+
+def crop_mask(point_cloud: np.ndarray) -> np.ndarray:
+    """
+    Mask of the points inside of the crop rectangle.
+
+    Args:
+        point_cloud (np.ndarray): coordinates in LiDAR frame in the last
+            axis (at least x and y).
+
+    Returns:
+        np.ndarray: mask of the points kept by crop_rectangle.
+    """
+
+    mask_x = (MINIMUM_X < point_cloud[..., 0]) & (point_cloud[..., 0] < MAXIMUM_X)
+    mask_y = (MINIMUM_Y < point_cloud[..., 1]) & (point_cloud[..., 1] < MAXIMUM_Y)
 
-    return point_cloud[mask_x & mask_y]
+    return mask_x & mask_y
 
 
 def compute_planes(random_points: np.ndarray) -> np.ndarray:
@@ -50,28 +70,528 @@ def compute_planes(random_points: np.ndarray) -> np.ndarray:
     return np.concatenate((normals, d_values[:, np.newaxis]), axis=1)
 
 
-def find_best_plane(downsample: np.ndarray, planes: np.ndarray) -> np.ndarray:
+def count_inliers(points: np.ndarray, planes: np.ndarray) -> np.ndarray:
+    """
+    Count the inliers of each plane, a block of planes at a time.
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+
+        planes (np.ndarray): normalized normals and respective d values
+            of each plane with coefficients a, b, c, and d in rows.
+
+    Returns:
+        np.ndarray: number of inlier points of each plane.
+    """
+
+    inliers_quantity = np.empty(len(planes), dtype=int)
+
+    for start in range(0, len(planes), RANSAC_BLOCK_SIZE):
+        block = planes[start:start + RANSAC_BLOCK_SIZE]
+
+        distances = np.abs(
+            np.matmul(block[:, :3], points.T) + block[:, 3:]
+        )
+
+        inliers_quantity[start:start + RANSAC_BLOCK_SIZE] = np.sum(
+            distances < DIST2PLANE_THRESHOLD, axis=1
+        )
+
+    return inliers_quantity
+
+
+def required_iterations(inlier_ratio: float) -> float:
+    """
+    Number of hypotheses needed to draw at least one made only of
+    inliers with probability RANSAC_CONFIDENCE.
+
+    Args:
+        inlier_ratio (float): observed share of inlier points
+            (or an array of them).
+
+    Returns:
+        float: required number of hypotheses (an array for an array).
+    """
+
+    success = np.asarray(inlier_ratio, dtype=float)**3
+
+    with np.errstate(divide="ignore"):
+        iterations = np.log(1 - RANSAC_CONFIDENCE) / np.log(1 - np.minimum(success, 1.0))
+
+    iterations = np.where(success >= 1.0, 0.0, np.where(success <= 0.0, np.inf, iterations))
+
+    return iterations if iterations.ndim else float(iterations)
+
+
+def find_best_plane(
+    downsample: np.ndarray, planes: np.ndarray, mode: str = None
+) -> np.ndarray:
     """
     Find the plane between the computed with the most inlier points.
 
     Args:
-        downsample (np.ndarray): just the first rows of the point cloud.
+        downsample (np.ndarray): sample of the point cloud (see sample_points).
 
         planes (np.ndarray): normalized normals and respective d values
             of each plane with coefficients a, b, c, and d in rows.
 
+        mode (str, optional): "fixed", "adaptive" or "preemptive".
+            Defaults to None (RANSAC_MODE when called).
+
+    Returns:
+        np.ndarray: normalized normal and respective d value of best plane.
+    """
+
+    mode = RANSAC_MODE if mode is None else mode
+
+    if mode == "fixed":
+        return planes[np.argmax(count_inliers(downsample, planes))]
+
+    if mode == "preemptive":
+        # Rank every hypothesis on a spread subset and fully score the best ones
+        step = max(1, len(downsample) // PREEMPTIVE_SUBSET_SIZE)
+        ranking = count_inliers(downsample[::step], planes)
+
+        keep = max(1, round(PREEMPTIVE_KEEP_RATIO * len(planes)))
+        survivors = planes[np.sort(np.argsort(-ranking, kind="stable")[:keep])]
+
+        return survivors[np.argmax(count_inliers(downsample, survivors))]
+
+    if mode != "adaptive":
+        raise ValueError(f"unknown RANSAC mode {mode!r}")
+
+    best_plane = planes[0]
+    best_quantity = -1
+
+    for start in range(0, len(planes), RANSAC_BLOCK_SIZE):
+        block = planes[start:start + RANSAC_BLOCK_SIZE]
+        inliers_quantity = count_inliers(downsample, block)
+
+        index = np.argmax(inliers_quantity)
+
+        if inliers_quantity[index] > best_quantity:
+            best_plane = block[index]
+            best_quantity = inliers_quantity[index]
+
+        scored = start + len(block)
+
+        if scored >= required_iterations(best_quantity / len(downsample)):
+            break
+
+    return best_plane
+
+
+def fit_plane(points: np.ndarray) -> np.ndarray:
+    """
+    Least-squares plane through the points (smallest principal direction).
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+
+    Returns:
+        np.ndarray: normalized normal and respective d value of the plane.
+    """
+
+    centroid = np.mean(points, axis=0)
+
+    normal = np.linalg.svd(points - centroid, full_matrices=False)[2][-1]
+
+    return np.append(normal, -normal @ centroid)
+
+
+def draw_rows(count: int, size: int, rng: np.random.Generator = None) -> np.ndarray:
+    """
+    Random row numbers, drawn with replacement.
+
+    Args:
+        count (int): rows to draw from.
+        size (int): rows drawn.
+        rng (np.random.Generator, optional): source of the draws.
+            Defaults to the global numpy random state.
+
+    Returns:
+        np.ndarray: row numbers.
+    """
+
+    if rng is None:
+        return np.random.randint(count, size=size)
+
+    return rng.integers(count, size=size)
+
+
+def sample_points(
+    point_cloud: np.ndarray, leaf_size: float = RANSAC_LEAF_SIZE, indexes: np.ndarray = None,
+    rng: np.random.Generator = None
+) -> np.ndarray:
+    """
+    Draw the points that RANSAC uses to generate and score the hypotheses:
+    up to DOWNSAMPLE_SIZE random voxel representatives of at most
+    RANSAC_PRESAMPLE_SIZE random points.
+
+    Args:
+        point_cloud (np.ndarray): cropped 3D coordinates in LiDAR frame.
+        leaf_size (float, optional): voxel side, 0 takes the first
+            DOWNSAMPLE_SIZE rows. Defaults to RANSAC_LEAF_SIZE.
+
+        indexes (np.ndarray, optional): rows of the point cloud to sample
+            from, only the drawn rows are copied. Defaults to None (every row).
+
+        rng (np.random.Generator, optional): source of the draws.
+            Defaults to the global numpy random state.
+
+    Returns:
+        np.ndarray: downsample with 3D coordinates in rows.
+    """
+
+    count = len(point_cloud) if indexes is None else len(indexes)
+
+    if leaf_size <= 0:
+        rows = slice(DOWNSAMPLE_SIZE) if indexes is None else indexes[:DOWNSAMPLE_SIZE]
+        return point_cloud[rows]
+
+    if count > RANSAC_PRESAMPLE_SIZE:
+        rows = draw_rows(count, RANSAC_PRESAMPLE_SIZE, rng)
+        point_cloud = point_cloud[rows if indexes is None else indexes[rows]]
+    elif indexes is not None:
+        point_cloud = point_cloud[indexes]
+
+    downsample = voxel.voxel_downsample(point_cloud, leaf_size)[0]
+
+    if len(downsample) > DOWNSAMPLE_SIZE:
+        random = np.random if rng is None else rng
+        downsample = downsample[random.choice(len(downsample), DOWNSAMPLE_SIZE, replace=False)]
+
+    return downsample
+
+
+def find_floor(
+    point_cloud: np.ndarray, indexes: np.ndarray = None, rng: np.random.Generator = None
+) -> np.ndarray:
+    """
+    Find the floor plane with RANSAC.
+
+    Args:
+        point_cloud (np.ndarray): cropped 3D coordinates in LiDAR frame.
+        indexes (np.ndarray, optional): rows of the point cloud inside of the
+            crop rectangle. Defaults to None (every row).
+
+        rng (np.random.Generator, optional): source of the samples and of
+            the hypotheses. Defaults to the global numpy random state.
+
     Returns:
         np.ndarray: normalized normal and respective d value of best plane.
     """
 
+    with instrument.stage("sample"):
+        downsample = sample_points(point_cloud, indexes=indexes, rng=rng)
+
+    with instrument.stage("planes"):
+        random_points = downsample[draw_rows(len(downsample), 3 * NUM_PLANES, rng)]
+
+        planes = compute_planes(random_points)
+
+    with instrument.stage("score"):
+        return find_best_plane(downsample, planes)
+
+
+def stack_rows(arrays: list, fill: float = np.nan) -> np.ndarray:
+    """
+    Stack arrays with different numbers of rows, padding the shorter ones.
+
+    Args:
+        arrays (list): arrays with the same trailing shape.
+        fill (float, optional): value of the padding rows. Defaults to np.nan.
+
+    Returns:
+        np.ndarray: arrays in the first axis and their rows in the second.
+    """
+
+    length = max(len(array) for array in arrays)
+
+    stacked = np.full(
+        (len(arrays), length) + arrays[0].shape[1:], fill, dtype=np.result_type(*arrays)
+    )
+
+    for (row, array) in enumerate(arrays):
+        stacked[row, :len(array)] = array
+
+    return stacked
+
+
+def compute_planes_batch(random_points: np.ndarray) -> tuple:
+    """
+    compute_planes for several frames at once. The collinear hypotheses are
+    moved behind the others as NaN rows, so every frame keeps its order.
+
+    Args:
+        random_points (np.ndarray): 3 * NUM_PLANES random points of
+            each frame, frames in the first axis.
+
+    Returns:
+        tuple: planes of each frame with coefficients a, b, c, and d in the
+            last axis and the number of valid planes of each frame.
+    """
+
+    reshaped = np.reshape(random_points, (len(random_points), NUM_PLANES, 3, 3))
+
+    vectors = reshaped[:, :, 1:] - reshaped[:, :, :1]
+    normals = np.cross(vectors[:, :, 0], vectors[:, :, 1])
+
+    norms = np.sqrt(
+        np.einsum("fij,fij->fi", normals, normals)
+    )
+
+    valid = norms > 0   # Remove collinear points
+    normals = normals / np.where(valid, norms, 1)[..., np.newaxis]
+
+    d_values = -np.einsum("fij,fij->fi", normals, reshaped[:, :, 0])
+
+    planes = np.concatenate((normals, d_values[..., np.newaxis]), axis=2)
+    planes[~valid] = np.nan
+
+    order = np.argsort(~valid, axis=1, kind="stable")
+
+    return np.take_along_axis(planes, order[..., np.newaxis], axis=1), valid.sum(axis=1)
+
+
+def count_inliers_batch(points: np.ndarray, planes: np.ndarray) -> np.ndarray:
+    """
+    Count the inliers of each plane of each frame, a block of planes at a
+    time. NaN points and planes (padding) never count.
+
+    Args:
+        points (np.ndarray): 3D coordinates of each frame in columns,
+            frames in the first axis (frames x 3 x points).
+        planes (np.ndarray): planes of each frame, frames in the first axis.
+
+    Returns:
+        np.ndarray: number of inlier points of each plane of each frame.
+    """
+
+    inliers_quantity = np.empty(planes.shape[:2], dtype=int)
+
+    for start in range(0, planes.shape[1], RANSAC_BLOCK_SIZE):
+        block = planes[:, start:start + RANSAC_BLOCK_SIZE]
+
+        distances = np.abs(
+            np.matmul(block[..., :3], points) + block[..., 3:]
+        )
+
+        inliers_quantity[:, start:start + RANSAC_BLOCK_SIZE] = np.sum(
+            distances < DIST2PLANE_THRESHOLD, axis=2
+        )
+
+    return inliers_quantity
+
+
+def find_best_planes(
+    downsamples: np.ndarray, sizes: np.ndarray, planes: np.ndarray,
+    num_planes: np.ndarray, mode: str = None
+) -> np.ndarray:
+    """
+    find_best_plane for several frames at once, with the same choices
+    as one call per frame.
+
+    Args:
+        downsamples (np.ndarray): samples of the frames padded with NaN rows
+            (see stack_rows), frames in the first axis.
+        sizes (np.ndarray): number of sample points of each frame.
+
+        planes (np.ndarray): planes of each frame (see compute_planes_batch).
+        num_planes (np.ndarray): number of valid planes of each frame.
+
+        mode (str, optional): "fixed", "adaptive" or "preemptive".
+            Defaults to None (RANSAC_MODE when called).
+
+    Returns:
+        np.ndarray: best plane of each frame in rows.
+    """
+
+    mode = RANSAC_MODE if mode is None else mode
+
+    frames = np.arange(len(planes))
+    padded = np.arange(planes.shape[1]) >= num_planes[:, np.newaxis]
+
+    # Coordinates in contiguous rows make the stacked products faster
+    columns = np.ascontiguousarray(downsamples.transpose(0, 2, 1))
+
+    if mode == "fixed":
+        inliers_quantity = count_inliers_batch(columns, planes)
+        inliers_quantity[padded] = -1
+
+        return planes[frames, np.argmax(inliers_quantity, axis=1)]
+
+    if mode == "preemptive":
+        # Rank every hypothesis on a spread subset and fully score the best ones
+        steps = np.maximum(1, sizes // PREEMPTIVE_SUBSET_SIZE)
+
+        rows = np.arange(-(-sizes.max() // steps.min())) * steps[:, np.newaxis]
+        subsets = np.take_along_axis(
+            downsamples, np.minimum(rows, downsamples.shape[1] - 1)[..., np.newaxis], axis=1
+        )
+        subsets[rows >= sizes[:, np.newaxis]] = np.nan
+
+        ranking = count_inliers_batch(np.ascontiguousarray(subsets.transpose(0, 2, 1)), planes)
+        ranking[padded] = -1
+
+        keep = np.maximum(1, np.round(PREEMPTIVE_KEEP_RATIO * num_planes).astype(int))
+
+        ranks = np.argsort(-ranking, axis=1, kind="stable")[:, :keep.max()]
+        dropped = np.arange(keep.max()) >= keep[:, np.newaxis]
+
+        survivors = np.sort(np.where(dropped, planes.shape[1], ranks), axis=1)
+        survivors = np.where(survivors < planes.shape[1], survivors, 0)
+
+        candidates = np.take_along_axis(planes, survivors[..., np.newaxis], axis=1)
+        candidates[dropped] = np.nan
+
+        inliers_quantity = count_inliers_batch(columns, candidates)
+        inliers_quantity[dropped] = -1
+
+        return candidates[frames, np.argmax(inliers_quantity, axis=1)]
+
+    if mode != "adaptive":
+        raise ValueError(f"unknown RANSAC mode {mode!r}")
+
+    best_planes = planes[:, 0].copy()
+    best_quantity = np.full(len(planes), -1)
+
+    active = num_planes > 0
+
+    for start in range(0, planes.shape[1], RANSAC_BLOCK_SIZE):
+        current = np.flatnonzero(active)
+
+        if len(current) == 0:
+            break
+
+        block = planes[current, start:start + RANSAC_BLOCK_SIZE]
+
+        inliers_quantity = count_inliers_batch(columns[current], block)
+        inliers_quantity[padded[current, start:start + RANSAC_BLOCK_SIZE]] = -1
+
+        index = np.argmax(inliers_quantity, axis=1)
+        quantity = inliers_quantity[np.arange(len(current)), index]
+
+        better = quantity > best_quantity[current]
+
+        best_planes[current[better]] = block[better, index[better]]
+        best_quantity[current[better]] = quantity[better]
+
+        scored = np.minimum(start + block.shape[1], num_planes[current])
+
+        active[current] = (
+            (scored < num_planes[current])
+            & (scored < required_iterations(best_quantity[current] / sizes[current]))
+        )
+
+    return best_planes
+
+
+def find_floors(point_clouds: list, indexes: list = None) -> np.ndarray:
+    """
+    Find the floor plane of several frames with RANSAC, scoring the
+    hypotheses of every frame together. The random draws follow
+    one find_floor call per frame.
+
+    Args:
+        point_clouds (list): cropped 3D coordinates in LiDAR frame of each frame.
+        indexes (list, optional): rows of each point cloud inside of the crop
+            rectangle. Defaults to None (every row).
+
+    Returns:
+        np.ndarray: normalized normal and respective d value of the
+            best plane of each frame in rows.
+    """
+
+    indexes = [None] * len(point_clouds) if indexes is None else indexes
+
+    downsamples = []
+    random_points = []
+
+    for (point_cloud, rows) in zip(point_clouds, indexes):
+        downsample = sample_points(point_cloud, indexes=rows)
+
+        downsamples.append(downsample)
+        random_points.append(
+            downsample[np.random.randint(len(downsample), size=3 * NUM_PLANES)]
+        )
+
+    planes, num_planes = compute_planes_batch(np.stack(random_points))
+    sizes = np.array([len(downsample) for downsample in downsamples])
+
+    return find_best_planes(stack_rows(downsamples), sizes, planes, num_planes)
+
+
+def remove_plane(point_cloud: np.ndarray, plane: np.ndarray) -> np.ndarray:
+    """
+    Remove the inliers of the plane.
+
+    Args:
+        point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+        plane (np.ndarray): normalized normal and respective d value.
+
+    Returns:
+        np.ndarray: filtered point cloud.
+    """
+
     distances = np.abs(
-        np.matmul(planes[:, :3], downsample.T) + planes[:, 3:]
+        np.matmul(plane[:3], point_cloud.T) + plane[3]
     )
 
-    mask = distances < DIST2PLANE_THRESHOLD
-    inliers_quantity = np.sum(mask, axis=1)
+    return point_cloud[distances > DIST2PLANE_THRESHOLD]
 
-    return planes[np.argmax(inliers_quantity)]
+
+def select_off_plane(point_cloud: np.ndarray, plane: np.ndarray, inside: np.ndarray) -> np.ndarray:
+    """
+    Indexes of the selected points that are not inliers of the plane.
+
+    Args:
+        point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+        plane (np.ndarray): normalized normal and respective d value.
+        inside (np.ndarray): mask of the selected points.
+
+    Returns:
+        np.ndarray: indexes of the selected points off the plane.
+    """
+
+    distances = point_cloud @ plane[:3]
+    distances += plane[3]
+
+    return np.flatnonzero(inside & (np.abs(distances, out=distances) > DIST2PLANE_THRESHOLD))
+
+
+def select_off_ground(point_cloud: np.ndarray, estimate=find_floor) -> tuple:
+    """
+    Crop the point cloud and find the points above the floor without copying
+    it: the crop is a mask, the floor plane is estimated from a sample of
+    the cropped rows and the off-ground points are returned as indexes.
+
+    Args:
+        point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+        estimate (optional): floor plane of (point_cloud, cropped indexes).
+            Defaults to find_floor.
+
+    Returns:
+        tuple: mask of the points inside of the crop rectangle and the
+            indexes of those off the floor plane.
+    """
+
+    with instrument.stage("crop"):
+        inside = crop_mask(point_cloud)
+        cropped = np.flatnonzero(inside)
+
+    instrument.count("cropped", len(cropped))
+
+    # Nothing to fit a floor to, like a partial frame outside of the crop rectangle
+    if len(cropped) == 0:
+        return inside, cropped
+
+    with instrument.stage("ransac"):
+        off_ground = select_off_plane(point_cloud, estimate(point_cloud, cropped), inside)
+
+    instrument.count("off_ground", len(off_ground))
+
+    return inside, off_ground
 
 
 def remove_floor(point_cloud: np.ndarray) -> np.ndarray:
@@ -85,18 +605,159 @@ def remove_floor(point_cloud: np.ndarray) -> np.ndarray:
         np.ndarray: filtered (no floor) point cloud.
     """
 
-    point_cloud = crop_rectangle(point_cloud)
-    downsample = point_cloud[:DOWNSAMPLE_SIZE]
+    return point_cloud[select_off_ground(point_cloud)[1]]
 
-    random_points = downsample[
-        np.random.randint(DOWNSAMPLE_SIZE, size=3 * NUM_PLANES)
-    ]
 
-    planes = compute_planes(random_points)
-    best_plane = find_best_plane(downsample, planes)
+class FloorEstimator:
+    """
+    Floor plane tracker for consecutive frames. The previous plane is checked
+    on a small sample of the new frame and, while it still holds, refined by a
+    least-squares fit over its inliers. The full RANSAC only runs when the
+    warm plane inlier ratio drops below the threshold.
+    """
 
-    distances = np.abs(
-        np.matmul(best_plane[:3], point_cloud.T) + best_plane[3]
-    )
+    def __init__(
+        self,
+        sample_size: int = WARM_SAMPLE_SIZE,
+        min_inlier_ratio: float = WARM_INLIER_RATIO
+    ) -> None:
+        """
+        Args:
+            sample_size (int, optional): points used to check the previous plane.
+                Defaults to WARM_SAMPLE_SIZE.
 
-    return point_cloud[distances > DIST2PLANE_THRESHOLD]
+            min_inlier_ratio (float, optional): minimum inlier ratio of the
+                previous plane to skip the RANSAC. Defaults to WARM_INLIER_RATIO.
+        """
+
+        self.sample_size = sample_size
+        self.min_inlier_ratio = min_inlier_ratio
+
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget the tracked plane and the statistics.
+        """
+
+        self.plane = None
+
+        self.frames = 0
+        self.warm_hits = 0
+
+        self.warm_time = 0.0
+        self.full_time = 0.0
+
+    def estimate(self, point_cloud: np.ndarray, indexes: np.ndarray = None) -> np.ndarray:
+        """
+        Estimate the floor plane of a new frame.
+
+        Args:
+            point_cloud (np.ndarray): cropped 3D coordinates in LiDAR frame.
+            indexes (np.ndarray, optional): rows of the point cloud inside of
+                the crop rectangle. Defaults to None (every row).
+
+        Returns:
+            np.ndarray: normalized normal and respective d value of the floor.
+        """
+
+        start = time.perf_counter()
+        self.frames += 1
+
+        count = len(point_cloud) if indexes is None else len(indexes)
+
+        if self.plane is not None and count > 0:
+            step = max(1, count // self.sample_size)
+            sample = point_cloud[::step] if indexes is None else point_cloud[indexes[::step]]
+
+            distances = np.abs(sample @ self.plane[:3] + self.plane[3])
+            inliers = sample[distances < DIST2PLANE_THRESHOLD]
+
+            if len(inliers) >= max(3, self.min_inlier_ratio * len(sample)):
+                plane = fit_plane(inliers)
+
+                # Keep the normal pointing to the same side
+                self.plane = plane if plane[:3] @ self.plane[:3] >= 0 else -plane
+
+                self.warm_hits += 1
+                self.warm_time += time.perf_counter() - start
+
+                return self.plane
+
+        self.plane = find_floor(point_cloud, indexes)
+        self.full_time += time.perf_counter() - start
+
+        return self.plane
+
+    def select_off_ground(self, point_cloud: np.ndarray) -> tuple:
+        """
+        Crop the frame and find the points off its estimated floor
+        (see the select_off_ground function).
+
+        Args:
+            point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+
+        Returns:
+            tuple: mask of the points inside of the crop rectangle and the
+                indexes of those off the floor plane.
+        """
+
+        return select_off_ground(point_cloud, self.estimate)
+
+    def remove_floor(self, point_cloud: np.ndarray) -> np.ndarray:
+        """
+        Crop the frame and remove the inliers of its estimated floor.
+
+        Args:
+            point_cloud (np.ndarray): 3D coordinates in LiDAR frame.
+
+        Returns:
+            np.ndarray: filtered (no floor) point cloud.
+        """
+
+        return point_cloud[self.select_off_ground(point_cloud)[1]]
+
+    def statistics(self) -> dict:
+        """
+        Hit rate of the warm start and latency of each kind of estimate.
+
+        Returns:
+            dict: see floor_statistics.
+        """
+
+        return floor_statistics([self])
+
+
+def floor_statistics(estimators: list) -> dict:
+    """
+    Hit rate of the warm start and latency of each kind of estimate over
+    several floor trackers, like the one of each thread of a pipeline.
+
+    Args:
+        estimators (list): FloorEstimator objects.
+
+    Returns:
+        dict: {"frames", "warm_hits", "full_runs", "hit_rate", "warm_ms",
+            "full_ms", "saved_ms"} with the mean latencies in milliseconds
+            and the total time saved by the warm hits.
+    """
+
+    frames = sum(estimator.frames for estimator in estimators)
+    warm_hits = sum(estimator.warm_hits for estimator in estimators)
+    warm_time = sum(estimator.warm_time for estimator in estimators)
+    full_time = sum(estimator.full_time for estimator in estimators)
+
+    full_runs = frames - warm_hits
+
+    warm_ms = 1e3 * warm_time / warm_hits if warm_hits else 0.0
+    full_ms = 1e3 * full_time / full_runs if full_runs else 0.0
+
+    return {
+        "frames": frames,
+        "warm_hits": warm_hits,
+        "full_runs": full_runs,
+        "hit_rate": warm_hits / frames if frames else 0.0,
+        "warm_ms": warm_ms,
+        "full_ms": full_ms,
+        "saved_ms": warm_hits * (full_ms - warm_ms)
+    }
@@ -0,0 +1,212 @@
+import numpy as np
+
+import clustering
+import ransac
+
+from rangeimage import RangeImage
+
+from constants import *
+
+
+def masked_points(image: RangeImage, mask: np.ndarray) -> np.ndarray:
+    """
+    3D coordinates of the masked pixels of the image.
+
+    Args:
+        image (RangeImage): organized point cloud.
+        mask (np.ndarray): pixels to convert.
+
+    Returns:
+        np.ndarray: coordinates in LiDAR frame in rows (row major order of the pixels).
+    """
+
+    return np.multiply(
+        image.ranges[mask][:, np.newaxis], image.model.directions[mask], dtype=image.ranges.dtype
+    )
+
+
+def sliding_minimum(values: np.ndarray, half_width: int) -> np.ndarray:
+    """
+    Minimum over a centered window along the last axis in linear time
+    (van Herk / Gil-Werman: prefix and suffix minimums of blocks as wide
+    as the window).
+
+    Args:
+        values (np.ndarray): values in the last axis.
+        half_width (int): elements on each side of the window.
+
+    Returns:
+        np.ndarray: minimum of each window, same shape as values.
+    """
+
+    width = 2 * half_width + 1
+    length = values.shape[-1]
+
+    padded = np.full(
+        values.shape[:-1] + (-(-(length + 2 * half_width) // width) * width,), np.inf
+    )
+    padded[..., half_width:half_width + length] = values
+
+    blocks = padded.reshape(values.shape[:-1] + (-1, width))
+
+    prefix = np.minimum.accumulate(blocks, axis=-1).reshape(padded.shape)
+    suffix = np.minimum.accumulate(blocks[..., ::-1], axis=-1)[..., ::-1].reshape(padded.shape)
+
+    return np.minimum(suffix[..., :length], prefix[..., width - 1:width - 1 + length])
+
+
+def segment_ground(
+    image: RangeImage, max_slope: float = GROUND_MAX_SLOPE,
+    max_slope_change: float = GROUND_MAX_SLOPE_CHANGE, max_step: float = GROUND_MAX_STEP,
+    window_angle: float = GROUND_WINDOW_ANGLE
+) -> np.ndarray:
+    """
+    Label the ground ring by ring, from the nearest one outwards. At every
+    azimuth the ground of the column is extended along its current slope and
+    a point is ground when it stays close to that prediction and to the
+    lowest point of its ring around it. Each column starts flat under the
+    sensor, so the surface only has to be smooth and may bend or climb along
+    the track, unlike a single RANSAC plane.
+
+    Args:
+        image (RangeImage): organized point cloud.
+
+        max_slope (float, optional): steepest ground in degrees.
+            Defaults to GROUND_MAX_SLOPE.
+
+        max_slope_change (float, optional): largest change of slope in degrees
+            between two ground points. Defaults to GROUND_MAX_SLOPE_CHANGE.
+
+        max_step (float, optional): height error always accepted (noise and
+            bumps). Defaults to GROUND_MAX_STEP.
+
+        window_angle (float, optional): half width in degrees of the azimuth
+            window of the lowest ring point. Defaults to GROUND_WINDOW_ANGLE.
+
+    Returns:
+        np.ndarray: ground mask of the pixels.
+    """
+
+    # Every beam of a channel has the same elevation
+    dtype = image.ranges.dtype
+
+    ranges = image.ranges * np.cos(image.model.channel_angles).astype(dtype)[:, np.newaxis]
+    heights = image.ranges * np.sin(image.model.channel_angles).astype(dtype)[:, np.newaxis]
+
+    max_gradient = float(np.tan(np.deg2rad(max_slope)))
+    max_bend = float(np.tan(np.deg2rad(max_slope_change)))
+
+    step = (image.model.angles[-1] - image.model.angles[0]) / max(1, image.shape[1] - 1)
+    half_width = max(1, round(np.deg2rad(window_angle) / step))
+
+    lowest = sliding_minimum(np.where(image.valid, heights, np.inf), half_width)
+    near_lowest = heights - lowest <= max_step
+
+    last_range = np.zeros(image.shape[1], dtype)
+    last_height = np.full(image.shape[1], -image.model.displacement[2], dtype)
+    gradient = np.zeros(image.shape[1], dtype)
+
+    ground = np.zeros(image.shape, dtype=bool)
+
+    for channel in np.argsort(image.model.channel_angles):
+        runs = np.maximum(ranges[channel] - last_range, 0.0)
+        errors = np.abs(heights[channel] - last_height - gradient * runs)
+
+        ground[channel] = (
+            image.valid[channel] & near_lowest[channel]
+            & (errors <= max_step + max_bend * runs)
+        )
+
+        # Follow the slope of the column between its last two ground points,
+        # bending at most max_slope_change so a stray point barely moves it
+        updated = ground[channel] & (runs > 0)
+        measured = (heights[channel, updated] - last_height[updated]) / runs[updated]
+
+        gradient[updated] = np.clip(
+            np.clip(measured, gradient[updated] - max_bend, gradient[updated] + max_bend),
+            -max_gradient, max_gradient
+        )
+
+        last_range = np.where(ground[channel], ranges[channel], last_range)
+        last_height = np.where(ground[channel], heights[channel], last_height)
+
+    return ground
+
+
+def cluster_image(
+    image: RangeImage, mask: np.ndarray,
+    max_distance: float = MAX_DISTANCE, min_points: int = MIN_SAMPLES
+) -> np.ndarray:
+    """
+    Connected components of the masked pixels. Neighbour beams of the same
+    ring are linked when their points are close, neighbour rings at the same
+    azimuth when their points are horizontally close (cones stand upright).
+
+    Args:
+        image (RangeImage): organized point cloud.
+        mask (np.ndarray): pixels to cluster.
+
+        max_distance (float, optional): longest link. Defaults to MAX_DISTANCE.
+        min_points (int, optional): smallest cluster, smaller components are
+            noise. Defaults to MIN_SAMPLES.
+
+    Returns:
+        np.ndarray: cluster label of the masked pixels (in row major order),
+            -1 for noise.
+    """
+
+    points = masked_points(image, mask)
+
+    index = image.index_image(mask)
+
+    # Rings from the lowest to the highest, so vertical neighbours are consecutive
+    rings = np.argsort(image.model.channel_angles)
+    index = index[rings]
+
+    def close_pairs(first: np.ndarray, second: np.ndarray, axes: slice) -> tuple:
+        paired = (first >= 0) & (second >= 0)
+        first, second = first[paired], second[paired]
+
+        deltas = points[first, axes] - points[second, axes]
+        close = np.einsum("ij,ij->i", deltas, deltas) <= max_distance**2
+
+        return first[close], second[close]
+
+    # Same ring, consecutive azimuth bins
+    left, right = close_pairs(index[:, :-1], index[:, 1:], slice(None))
+
+    # Same azimuth bin, consecutive rings
+    lower, upper = close_pairs(index[:-1], index[1:], slice(0, 2))
+
+    component = clustering.connected_components(
+        len(points), np.concatenate((left, lower)), np.concatenate((right, upper))
+    )
+
+    roots, labels, sizes = np.unique(component, return_inverse=True, return_counts=True)
+
+    kept = sizes >= min_points
+    numbers = np.where(kept, np.cumsum(kept) - 1, -1)
+
+    return numbers[labels]
+
+
+def select(image: RangeImage) -> tuple:
+    """
+    Crop the image and remove its ground without building its points
+    (the crop only needs the horizontal coordinates of each pixel).
+
+    Args:
+        image (RangeImage): organized point cloud.
+
+    Returns:
+        tuple: masks of the pixels inside of the crop rectangle
+            and of the off-ground pixels among them.
+    """
+
+    planar = np.multiply(
+        image.ranges[..., np.newaxis], image.model.directions[..., :2], dtype=image.ranges.dtype
+    )
+
+    inside = image.valid & ransac.crop_mask(planar)
+
+    return inside, inside & ~segment_ground(image)
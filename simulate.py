@@ -1,6 +1,12 @@
 from constantspcl import *
 import numpy as np
 
+import instrument
+import utils
+
+from lidar import LidarModel, get_default_model, get_rig_models
+from rangeimage import RangeImage
+
 
 def compute_distance(delta_pos: np.ndarray, direction: np.ndarray) -> float:
     """
@@ -39,7 +45,309 @@ def compute_distance(delta_pos: np.ndarray, direction: np.ndarray) -> float:
     return None
 
 
-def scan_channel(pose: np.ndarray, cones: np.ndarray, channel_angle: float) -> np.ndarray:
+def solve_distances(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """
+    Element-wise appropriate root of equation ax² + 2bx + c = 0.
+
+    Args:
+        a (np.ndarray): quadratic coefficients, broadcastable with b and c.
+        b (np.ndarray): half of the linear coefficients.
+        c (np.ndarray): constant coefficients.
+
+    Returns:
+        np.ndarray: appropriate distances, np.inf where the laser beam does not hit the cone.
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = b / a
+        delta = ratio**2 - c / a
+
+        root = np.sqrt(np.where(delta < 0, np.nan, delta))
+
+        distance_1 = -ratio + root
+        distance_2 = -ratio - root
+
+        distances = np.where(
+            distance_2 >= 0,
+            np.minimum(distance_1, distance_2),
+            np.where(distance_1 >= 0, distance_1, np.inf)
+        )
+
+        # Degenerate equation (beam parallel to the cone surface)
+        linear = np.where(b == 0, np.inf, -0.5 * c / b)
+
+    return np.where(a == 0, linear, distances)
+
+
+def compute_distances(delta_pos: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    """
+    Vectorized version of compute_distance for many laser beams and cones at once.
+
+    Args:
+        delta_pos (np.ndarray): differences between vehicle pos and cones pos in rows.
+        directions (np.ndarray): directions of laser beams firing in rows.
+
+    Returns:
+        np.ndarray: appropriate distances with beams in rows and cones in columns,
+            np.inf where the laser beam does not hit the cone.
+    """
+
+    a = np.einsum("ij,ij->i", directions @ A, directions)[:, np.newaxis]
+    b = directions @ A @ delta_pos.T
+    c = np.einsum("ij,ij->i", delta_pos @ A, delta_pos)[np.newaxis]
+
+    return solve_distances(a, b, c)
+
+
+def build_sector_index(pose: np.ndarray, cones: np.ndarray) -> np.ndarray:
+    """
+    Index the cones by the azimuth sectors that their silhouette can cover.
+
+    Only hits between the ground and the LiDAR height are relevant, where the
+    cone surface is never wider than the base radius or, above the tip, than
+    the radius it reaches at the LiDAR height.
+
+    Args:
+        pose (np.ndarray): LiDAR pose in global frame [x, y, z, yaw].
+        cones (np.ndarray): all visible cones with 3D coordinates in rows.
+
+    Returns:
+        np.ndarray: indexes of the candidate cones of each sector
+            (global azimuth) in rows, padded with -1.
+    """
+
+    sector_width = 2 * np.pi / NUM_AZIMUTH_SECTORS
+
+    radius = CONE_RADIUS * max(1.0, (pose[2] - np.min(cones[:, 2])) / CONE_HEIGHT)
+
+    vectors = cones[:, :2] - pose[:2]
+    ranges = np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+
+    centers = np.arctan2(vectors[:, 1], vectors[:, 0])
+    half_widths = np.full(len(cones), np.pi)
+
+    far = ranges > radius
+    half_widths[far] = np.arcsin(radius / ranges[far])
+
+    first = np.floor((centers - half_widths) / sector_width).astype(int)
+    last = np.floor((centers + half_widths) / sector_width).astype(int)
+
+    counts = np.minimum(last - first + 1, NUM_AZIMUTH_SECTORS)
+
+    # Expand every cone over its consecutive sectors
+    cone_ids = np.repeat(np.arange(len(cones)), counts)
+    offsets = np.arange(len(cone_ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+    sectors = (np.repeat(first, counts) + offsets) % NUM_AZIMUTH_SECTORS
+
+    order = np.argsort(sectors, kind="stable")
+    sectors = sectors[order]
+
+    sector_counts = np.bincount(sectors, minlength=NUM_AZIMUTH_SECTORS)
+    starts = np.cumsum(sector_counts) - sector_counts
+
+    table = np.full((NUM_AZIMUTH_SECTORS, max(1, sector_counts.max())), -1)
+    table[sectors, np.arange(len(sectors)) - starts[sectors]] = cone_ids[order]
+
+    return table
+
+
+def get_azimuth_sectors(angles: np.ndarray) -> np.ndarray:
+    """
+    Get the sector of the index built by build_sector_index for each azimuth.
+
+    Args:
+        angles (np.ndarray): azimuths in radians in the global frame.
+
+    Returns:
+        np.ndarray: respective sector indexes.
+    """
+
+    sector_width = 2 * np.pi / NUM_AZIMUTH_SECTORS
+
+    sectors = np.floor(np.mod(angles, 2 * np.pi) / sector_width).astype(int)
+
+    return np.minimum(sectors, NUM_AZIMUTH_SECTORS - 1)
+
+
+def ground_heights(positions: np.ndarray, surface: np.ndarray = None) -> np.ndarray:
+    """
+    Height of the ground under the given positions.
+
+    Args:
+        positions (np.ndarray): 2D (or 3D) coordinates in rows.
+        surface (np.ndarray, optional): planes ax + by + cz + d = 0 (c > 0) in
+            rows, the ground is their upper envelope. Defaults to None (z = 0).
+
+    Returns:
+        np.ndarray: ground height of each position.
+    """
+
+    if surface is None:
+        return np.zeros(len(positions))
+
+    heights = -(positions[:, :2] @ surface[:, :2].T + surface[:, 3]) / surface[:, 2]
+
+    return np.max(heights, axis=1)
+
+
+def ground_distances(
+    pose: np.ndarray, directions: np.ndarray, surface: np.ndarray = None
+) -> np.ndarray:
+    """
+    Distance to the ground along each laser beam. Above the upper envelope of
+    planes, a beam leaves the free space through the first plane it crosses.
+
+    Args:
+        pose (np.ndarray): LiDAR pose in global frame [x, y, z, yaw].
+        directions (np.ndarray): directions of laser beams firing in rows.
+
+        surface (np.ndarray, optional): planes ax + by + cz + d = 0 (c > 0) in
+            rows, the ground is their upper envelope. Defaults to None (z = 0).
+
+    Returns:
+        np.ndarray: distances, np.inf for the beams that never reach the ground.
+    """
+
+    if surface is None:
+        return -pose[2] / directions[:, 2]
+
+    heights = surface[:, :3] @ pose[:3] + surface[:, 3]
+    slopes = directions @ surface[:, :3].T
+
+    with np.errstate(divide="ignore"):
+        distances = np.where(slopes < 0, -heights / slopes, np.inf)
+
+    return np.min(distances, axis=1)
+
+
+def compute_nearest_distances(
+    delta_pos: np.ndarray, directions: np.ndarray, candidates: np.ndarray
+) -> np.ndarray:
+    """
+    Distance to the nearest cone hit by each laser beam among its candidate cones.
+
+    Args:
+        delta_pos (np.ndarray): differences between vehicle pos and cones pos in rows.
+        directions (np.ndarray): directions of laser beams firing, channels
+            in the first axis and azimuths in the second.
+
+        candidates (np.ndarray): indexes of the candidate cones of each
+            azimuth in rows, padded with -1.
+
+    Returns:
+        np.ndarray: nearest distances of each laser beam, np.inf if no cone is hit.
+    """
+
+    weighted = directions @ A
+
+    a = np.einsum("ijk,ijk->ij", weighted, directions)[..., np.newaxis]
+    b = np.einsum("ijk,jlk->ijl", weighted, delta_pos[candidates])
+    c = np.einsum("ij,ij->i", delta_pos @ A, delta_pos)[candidates]
+
+    distances = solve_distances(a, b, c)
+    distances[:, candidates < 0] = np.inf
+
+    return np.min(distances, axis=2)
+
+
+def scan_ranges(
+    pose: np.ndarray, cones: np.ndarray,
+    model: LidarModel = None, rng: np.random.Generator = None,
+    surface: np.ndarray = None
+) -> tuple:
+    """
+    Measure the distance of every laser beam of the sensor at once.
+
+    Args:
+        pose (np.ndarray): LiDAR pose in global frame [x, y, z, yaw].
+        cones (np.ndarray): all visible cones with 3D coordinates in rows.
+
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+        rng (np.random.Generator, optional): source of the distance noise.
+            Defaults to the global numpy random state.
+
+        surface (np.ndarray, optional): ground planes (see ground_heights).
+            Defaults to None (z = 0).
+
+    Returns:
+        tuple: distances and directions in global frame of the laser
+            beams, channels in the first axis and azimuths in the second.
+    """
+
+    model = get_default_model() if model is None else model
+    rng = np.random if rng is None else rng
+
+    directions = model.rotated_directions(pose[3])
+    distances = np.full(directions.shape[:2], np.inf)
+
+    if len(cones) > 0:
+        candidates = build_sector_index(pose, cones)[
+            get_azimuth_sectors(model.azimuths(pose[3]))
+        ]
+
+        # Beams of empty sectors go straight to the ground
+        busy = np.flatnonzero(candidates[:, 0] >= 0)
+
+        distances[:, busy] = compute_nearest_distances(
+            pose[:3] - cones, directions[:, busy], candidates[busy]
+        )
+
+    directions = directions.reshape((-1, 3))
+    distances = distances.reshape(-1)
+
+    hit = np.flatnonzero(np.isfinite(distances))
+    distances[hit] = rng.normal(distances[hit], model.distance_uncertainty)
+
+    hits = pose[:3] + distances[hit, np.newaxis] * directions[hit]
+    heights = hits[:, 2] - ground_heights(hits, surface) if surface is not None else hits[:, 2]
+
+    on_cone = (0 < heights) & (heights < CONE_EFFECTIVE_HEIGHT)
+
+    # Every beam that did not hit a cone ends up on the ground
+    ground = np.ones(len(directions), dtype=bool)
+    ground[hit[on_cone]] = False
+
+    distances[ground] = rng.normal(
+        ground_distances(pose, directions[ground], surface), model.distance_uncertainty
+    )
+
+    shape = (model.num_channels, model.num_points)
+
+    return distances.reshape(shape), directions.reshape(shape + (3,))
+
+
+def scan_channels(
+    pose: np.ndarray, cones: np.ndarray,
+    model: LidarModel = None, rng: np.random.Generator = None,
+    surface: np.ndarray = None
+) -> np.ndarray:
+    """
+    Scan all the channels of the sensor at once and compute the respective partial point cloud.
+
+    Args:
+        pose (np.ndarray): LiDAR pose in global frame [x, y, z, yaw].
+        cones (np.ndarray): all visible cones with 3D coordinates in rows.
+
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+        rng (np.random.Generator, optional): source of the distance noise.
+            Defaults to the global numpy random state.
+
+        surface (np.ndarray, optional): ground planes (see ground_heights).
+            Defaults to None (z = 0).
+
+    Returns:
+        np.ndarray: points identified by LiDAR, channel after channel.
+    """
+
+    distances, directions = scan_ranges(pose, cones, model, rng, surface)
+
+    return pose[:3] + distances.reshape((-1, 1)) * directions.reshape((-1, 3))
+
+
+def scan_channel(
+    pose: np.ndarray, cones: np.ndarray, channel_angle: float,
+    rng: np.random.Generator = None, model: LidarModel = None
+) -> np.ndarray:
     """
     Scan the given channel and compute the respective partial point cloud.
 
@@ -50,86 +358,229 @@ def scan_channel(pose: np.ndarray, cones: np.ndarray, channel_angle: float) -> n
         channel_angle (float): angle in radians of a channel concerning
             the horizontal plane. Only negative angles must be passed.
 
+        rng (np.random.Generator, optional): source of the distance noise.
+            Defaults to the global numpy random state.
+
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+
     Returns:
         np.ndarray: points identified by LiDAR for the given channel.
     """
 
-    num_points = round(2 * np.pi / ANGULAR_RESOLUTION)
+    model = get_default_model() if model is None else model
+
+    return scan_channels(pose, cones, model.with_channels(channel_angle), rng)
+
+
+def get_lidar_pose(
+    pose: np.ndarray, model: LidarModel, surface: np.ndarray = None
+) -> np.ndarray:
+    """
+    LiDAR pose of a vehicle pose, standing on the ground.
+
+    Args:
+        pose (np.ndarray): vehicle pose in global frame [x, y, z, yaw] (not modified).
+        model (LidarModel): sensor profile.
+        surface (np.ndarray, optional): ground planes (see ground_heights).
+            Defaults to None (z = 0).
+
+    Returns:
+        np.ndarray: LiDAR pose in global frame [x, y, z, yaw].
+    """
+
+    # The displacement turns with the vehicle, as for the sensors of a rig
+    lidar_pose = utils.get_lidar_poses(np.array(pose, dtype=float)[np.newaxis], model)[0]
+    lidar_pose[2] += ground_heights(lidar_pose[np.newaxis, :2], surface)[0]
+
+    return lidar_pose
+
+
+def generate_point_cloud(
+    pose: np.ndarray, cones: np.ndarray,
+    rng: np.random.Generator = None, model: LidarModel = None,
+    surface: np.ndarray = None, out: np.ndarray = None
+) -> np.ndarray:
+    """
+    Generate the complete LiDAR point cloud, one point per laser beam.
+
+    Args:
+        pose (np.ndarray): vehicle pose in global frame [x, y, z, yaw] (not modified).
+        cones (np.ndarray): all visible cones with 2D coordinates in rows.
+
+        rng (np.random.Generator, optional): source of the distance noise.
+            Defaults to the global numpy random state.
+
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+
+        surface (np.ndarray, optional): ground planes (see ground_heights), the
+            vehicle and the cones stand on them. Defaults to None (z = 0).
+
+        out (np.ndarray, optional): C-contiguous array of num_channels *
+            num_points rows and 3 columns that receives the point cloud,
+            so a sequence of frames reuses one buffer. Defaults to None
+            (a new POINT_DTYPE array).
+
+    Returns:
+        np.ndarray: point cloud in LiDAR frame, channel after channel (the
+            ray casting runs in double precision).
+    """
+
+    model = get_default_model() if model is None else model
+
+    shape = (model.num_channels * model.num_points, 3)
+
+    if out is None:
+        out = np.empty(shape, POINT_DTYPE)
+    elif out.shape != shape or not out.flags.c_contiguous:
+        raise ValueError(f"output of shape {out.shape}, expected a C-contiguous {shape}")
+
+    new_coord = (CONE_HEIGHT + ground_heights(cones, surface))[:, np.newaxis]
+
+    cones = np.concatenate((cones, new_coord), axis=1)
+
+    with instrument.stage("simulate"):
+        distances = scan_ranges(get_lidar_pose(pose, model, surface), cones, model, rng, surface)[0]
 
-    angles = np.linspace(
-        SCAN_FIELD_CENTER_ANGLE - 0.5 * SCAN_FIELD_WIDTH,
-        SCAN_FIELD_CENTER_ANGLE + 0.5 * SCAN_FIELD_WIDTH,
-        num_points
+    instrument.count("simulated", distances.size)
+
+    # In the LiDAR frame every beam keeps the direction of the sensor table
+    np.multiply(
+        distances[..., np.newaxis], model.directions, out=out.reshape(model.directions.shape)
     )
 
-    points = np.zeros((num_points, 3))
+    return out
 
-    for (index, angle) in enumerate(angles):
-        direction = np.array(
-            [np.cos(channel_angle) * np.cos(angle + pose[3]),
-             np.cos(channel_angle) * np.sin(angle + pose[3]),
-             np.sin(channel_angle)]
-        )
 
-        distances = []
-        for cone in cones:
-            distance = compute_distance(pose[:3] - cone, direction)
+def generate_sensor_frames(
+    pose: np.ndarray, cones: np.ndarray, models: tuple = None,
+    rng: np.random.Generator = None, surface: np.ndarray = None,
+    out: list = None
+) -> list:
+    """
+    Generate the point cloud of every sensor of a multi LiDAR rig for the
+    same vehicle pose, each one in its own LiDAR frame.
 
-            if distance is not None:
-                distances.append(distance)
+    Args:
+        pose (np.ndarray): vehicle pose in global frame [x, y, z, yaw] (not modified).
+        cones (np.ndarray): cones visible from any sensor with 2D coordinates in rows.
 
-        if len(distances) > 0:
-            distance = np.random.normal(
-                min(distances), DISTANCE_UNCERTAINTY
-            )
+        models (tuple, optional): sensor profile of each sensor, with its
+            extrinsics. Defaults to lidar.get_rig_models().
 
-            points[index] = pose[:3] + distance * direction
+        rng (np.random.Generator, optional): source of the distance noise,
+            consumed sensor after sensor. Defaults to the global numpy random state.
 
-            if 0 < points[index, 2] and points[index, 2] < CONE_EFFECTIVE_HEIGHT:
-                continue
+        surface (np.ndarray, optional): ground planes (see ground_heights), the
+            vehicle and the cones stand on them. Defaults to None (z = 0).
 
-        distance = np.random.normal(
-            -pose[2] / direction[2], DISTANCE_UNCERTAINTY
-        )
+        out (list, optional): output buffer of each sensor (see
+            generate_point_cloud). Defaults to None (new arrays).
 
-        points[index] = pose[:3] + distance * direction
+    Returns:
+        list: point cloud of each sensor in its LiDAR frame.
+    """
 
-    return points
+    models = get_rig_models() if models is None else models
+    out = [None] * len(models) if out is None else out
 
+    return [
+        generate_point_cloud(pose, cones, rng, model, surface, buffer)
+        for (model, buffer) in zip(models, out)
+    ]
 
-def generate_point_cloud(pose: np.ndarray, cones: np.ndarray) -> np.ndarray:
+
+def generate_range_image(
+    pose: np.ndarray, cones: np.ndarray,
+    rng: np.random.Generator = None, model: LidarModel = None,
+    surface: np.ndarray = None
+) -> RangeImage:
     """
-    Generate the complete LiDAR point cloud.
+    Generate the complete LiDAR measurement as an organized range image.
+    Consumes the random stream like generate_point_cloud, so both give
+    the same points for the same seed.
 
     Args:
         pose (np.ndarray): vehicle pose in global frame [x, y, z, yaw].
         cones (np.ndarray): all visible cones with 2D coordinates in rows.
 
+        rng (np.random.Generator, optional): source of the distance noise.
+            Defaults to the global numpy random state.
+
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+
+        surface (np.ndarray, optional): ground planes (see ground_heights), the
+            vehicle and the cones stand on them. Defaults to None (z = 0).
+
     Returns:
-        np.ndarray: point cloud in LiDAR frame.
+        RangeImage: distance of every laser beam.
     """
 
-    point_cloud = np.zeros((0, 3))
+    model = get_default_model() if model is None else model
 
-    new_coord = np.array([CONE_HEIGHT] * len(cones))[:, np.newaxis]
+    new_coord = (CONE_HEIGHT + ground_heights(cones, surface))[:, np.newaxis]
 
     cones = np.concatenate((cones, new_coord), axis=1)
 
-    pose[3] += LIDAR_ORIENTATION
-    pose[:3] += LIDAR_DISPLACEMENT
+    with instrument.stage("simulate"):
+        distances = scan_ranges(get_lidar_pose(pose, model, surface), cones, model, rng, surface)[0]
 
-    for channel in CHANNEL_ANGLE_IN_RAD:
-        point_cloud = np.append(
-            point_cloud, scan_channel(pose, cones, channel), axis=0
-        )
+    return RangeImage(distances, model=model)
 
-    cos = np.cos(pose[3])
-    sin = np.sin(pose[3])
 
-    rotmat = np.array(
-        [[cos, -sin, 0],
-         [sin,  cos, 0],
-         [  0,    0, 1]]
-    )
+def generate_frames(
+    track: dict, indexes, seed: int = 0, model: LidarModel = None,
+    surface: np.ndarray = None, organized: bool = False,
+    shuffle: bool = True, out: np.ndarray = None
+):
+    """
+    Simulate the frames of some center line indexes lazily, so a whole
+    lap runs in bounded memory. The visible cones are looked up
+    FRAME_QUERY_SIZE poses at a time and every frame draws from its own
+    random stream derived from the base seed and the index, so a frame
+    does not depend on the others.
+
+    Args:
+        track (dict): returned by utils.load_track.
+        indexes: center line indexes of the frames.
+        seed (int, optional): base seed of the random streams. Defaults to 0.
+
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+        surface (np.ndarray, optional): ground planes (see ground_heights).
+            Defaults to None (z = 0).
+
+        organized (bool, optional): yield range images instead of point
+            clouds. Defaults to False.
+
+        shuffle (bool, optional): shuffle the points of each point cloud,
+            like a sensor capture. Defaults to True.
+
+        out (np.ndarray, optional): buffer that receives every point cloud
+            (see generate_point_cloud), each frame is then only valid until
+            the next one. Defaults to None (a new array per frame).
+
+    Yields:
+        tuple: center line index and point cloud (or RangeImage) of each frame.
+    """
+
+    model = get_default_model() if model is None else model
+    indexes = np.asarray(indexes, dtype=int)
+
+    for start in range(0, len(indexes), FRAME_QUERY_SIZE):
+        chunk = indexes[start:start + FRAME_QUERY_SIZE]
+
+        poses = np.array([utils.get_vehicle_pose(track, index) for index in chunk])
+        visible = utils.query_cones(track, poses, model)
+
+        for (index, pose, cones) in zip(chunk, poses, visible):
+            rng = np.random.default_rng([seed, index])
+
+            if organized:
+                yield int(index), generate_range_image(pose, cones, rng, model, surface)
+                continue
+
+            point_cloud = generate_point_cloud(pose, cones, rng, model, surface, out)
+
+            if shuffle:
+                rng.shuffle(point_cloud)
 
-    return (point_cloud - pose[:3]) @ rotmat
+            yield int(index), point_cloud
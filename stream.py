@@ -0,0 +1,816 @@
+import sys
+import time
+import socket
+import struct
+import asyncio
+import argparse
+import collections
+
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import instrument
+import pclbin
+import pipeline
+import ransac
+
+from lidar import get_default_model
+from processing import processing
+
+from constantspcl import POINT_DTYPE
+
+
+PACKET_MAGIC = b"LDRP"
+PACKET_VERSION = 1
+
+# magic, version, frame id, packet index, packets of the frame,
+# first point, number of points, send time (time.time)
+PACKET_HEADER = struct.Struct("<4sHIHHIHd")
+
+# Coordinates on the wire, whatever POINT_DTYPE is
+PACKET_DTYPE = np.dtype("<f4")
+
+# 1200 bytes of coordinates, a packet fits in an Ethernet frame
+POINTS_PER_PACKET = 100
+
+STREAM_HOST = "127.0.0.1"
+STREAM_PORT = 2368
+
+# Frames per second sent by the replay sender (rotation rate of the sensor)
+FRAME_RATE = 10.0
+
+# Assembled frames waiting for the detection, the oldest one is dropped
+# when a new frame arrives and the queue is full
+FRAME_QUEUE_SIZE = 2
+
+# Frames assembled at the same time (reordered packets), the oldest
+# one is finished with its missing packets when another one starts
+MAX_OPEN_FRAMES = 2
+
+# Age in seconds after which an assembled frame is too stale to be processed
+MAX_FRAME_AGE = 0.5
+
+# Requested socket receive buffer, so bursts survive a slow frame
+RECEIVE_BUFFER_SIZE = 1 << 23
+
+
+def encode_packet(
+    frame_id: int, index: int, num_packets: int, first: int, points: np.ndarray
+) -> bytes:
+    """
+    Build a packet with some consecutive points of a frame.
+
+    Args:
+        frame_id (int): number of the frame (increases frame after frame).
+        index (int): position of the packet in the frame.
+        num_packets (int): packets of the frame.
+        first (int): row of the frame of the first point.
+        points (np.ndarray): 3D coordinates in rows.
+
+    Returns:
+        bytes: header followed by the coordinates.
+    """
+
+    header = PACKET_HEADER.pack(
+        PACKET_MAGIC, PACKET_VERSION, frame_id, index, num_packets, first, len(points), time.time()
+    )
+
+    return header + np.ascontiguousarray(points, dtype=PACKET_DTYPE).tobytes()
+
+
+def decode_packet(data: bytes) -> tuple:
+    """
+    Read a packet built by encode_packet.
+
+    Args:
+        data (bytes): the datagram.
+
+    Returns:
+        tuple: frame id, packet index, packets of the frame, first point,
+            send time and the 3D coordinates in rows (a view of data).
+    """
+
+    if len(data) < PACKET_HEADER.size:
+        raise ValueError("packet shorter than its header")
+
+    magic, version, frame_id, index, num_packets, first, count, sent = PACKET_HEADER.unpack_from(data)
+
+    if magic != PACKET_MAGIC or version != PACKET_VERSION:
+        raise ValueError("not a LiDAR packet")
+
+    if index >= num_packets or len(data) != PACKET_HEADER.size + 3 * PACKET_DTYPE.itemsize * count:
+        raise ValueError("corrupted LiDAR packet")
+
+    points = np.frombuffer(data, dtype=PACKET_DTYPE, offset=PACKET_HEADER.size).reshape(-1, 3)
+
+    return frame_id, index, num_packets, first, sent, points
+
+
+def split_packets(count: int, points_per_packet: int = POINTS_PER_PACKET) -> np.ndarray:
+    """
+    First point of every packet of a frame.
+
+    Args:
+        count (int): points of the frame.
+        points_per_packet (int, optional): Defaults to POINTS_PER_PACKET.
+
+    Returns:
+        np.ndarray: first row of each packet, followed by count.
+    """
+
+    return np.append(np.arange(0, count, points_per_packet), count)
+
+
+class FrameAssembler:
+    """
+    Gather the packets of each frame into preallocated buffers. A frame is
+    finished when its last missing packet arrives or, like on the azimuth
+    wrap of the sensor, when newer frames push it out of the open frames.
+    The buffers are lent with the finished frames and given back by release.
+    """
+
+    def __init__(
+        self, max_points: int, num_buffers: int, max_open: int = MAX_OPEN_FRAMES
+    ) -> None:
+        """
+        Args:
+            max_points (int): largest frame.
+            num_buffers (int): frames held at the same time (open, queued
+                and being processed).
+            max_open (int, optional): frames assembled at the same time.
+                Defaults to MAX_OPEN_FRAMES.
+        """
+
+        self.max_points = max_points
+        self.max_open = max_open
+
+        self.buffers = [np.empty((max_points, 3), dtype=POINT_DTYPE) for _ in range(num_buffers)]
+        self.free = list(range(num_buffers))
+
+        self.open = collections.OrderedDict()
+
+        self.last_finished = -1
+        self.newest = -1
+
+        self.stats = {
+            "packets": 0, "lost_packets": 0, "late_packets": 0, "invalid_packets": 0,
+            "missing_frames": 0, "overruns": 0, "complete_frames": 0, "partial_frames": 0
+        }
+
+    def add(self, data: bytes, arrival: float, reclaim=None) -> list:
+        """
+        Store a packet in the buffer of its frame.
+
+        Args:
+            data (bytes): the datagram.
+            arrival (float): time.perf_counter() at the reception.
+            reclaim (optional): called without arguments when no buffer is
+                free, it must release one and return True, or return False.
+
+        Returns:
+            list: the frames finished by this packet (see finish).
+        """
+
+        try:
+            frame_id, index, num_packets, first, sent, points = decode_packet(data)
+        except ValueError:
+            self.stats["invalid_packets"] += 1
+            return []
+
+        if first + len(points) > self.max_points:
+            self.stats["invalid_packets"] += 1
+            return []
+
+        self.stats["packets"] += 1
+
+        if frame_id not in self.open and frame_id <= self.last_finished:
+            self.stats["late_packets"] += 1
+            return []
+
+        finished = []
+
+        if frame_id not in self.open:
+            # The sensor moved on, the oldest frames will not get more packets
+            while self.open and (
+                len(self.open) >= self.max_open or next(iter(self.open)) <= frame_id - self.max_open
+            ):
+                finished.append(self.finish(next(iter(self.open))))
+
+            if not self.free and not (reclaim is not None and reclaim()):
+                self.stats["overruns"] += 1
+                return finished
+
+            # Frames skipped by the ids, until one of them shows up reordered
+            if frame_id > self.newest:
+                self.stats["missing_frames"] += frame_id - self.newest - 1
+                self.newest = frame_id
+            else:
+                self.stats["missing_frames"] -= 1
+
+            self.open[frame_id] = {
+                "id": frame_id,
+                "buffer": self.free.pop(),
+                "firsts": np.zeros(num_packets, dtype=np.int64),
+                "sizes": np.zeros(num_packets, dtype=np.int64),
+                "received": np.zeros(num_packets, dtype=bool),
+                "missing": num_packets,
+                "arrival": arrival,
+                "sent": sent
+            }
+
+        frame = self.open[frame_id]
+
+        if index >= len(frame["received"]) or frame["received"][index]:
+            self.stats["invalid_packets"] += 1
+            return finished
+
+        self.buffers[frame["buffer"]][first:first + len(points)] = points
+
+        frame["firsts"][index] = first
+        frame["sizes"][index] = len(points)
+        frame["received"][index] = True
+        frame["missing"] -= 1
+
+        if frame["missing"] == 0:
+            finished.append(self.finish(frame_id))
+
+        return finished
+
+    def finish(self, frame_id: int) -> dict:
+        """
+        Close an open frame. The points of the missing packets are left
+        out, the others are moved to the front of the buffer.
+
+        Args:
+            frame_id (int): number of the frame.
+
+        Returns:
+            dict: frame {"id", "buffer", "points", "packets", "lost",
+                "arrival", "sent", "ready"} whose points are a view of
+                the buffer, valid until release.
+        """
+
+        frame = self.open.pop(frame_id)
+        self.last_finished = max(self.last_finished, frame_id)
+
+        buffer = self.buffers[frame["buffer"]]
+        received = np.flatnonzero(frame["received"])
+
+        lost = len(frame["received"]) - len(received)
+        count = int(frame["sizes"].sum())
+
+        if lost:
+            # Packets hold consecutive rows, so the rows only move backwards
+            end = 0
+
+            for index in received:
+                first, size = frame["firsts"][index], frame["sizes"][index]
+
+                if first != end:
+                    buffer[end:end + size] = buffer[first:first + size]
+
+                end += size
+
+            self.stats["partial_frames"] += 1
+            self.stats["lost_packets"] += lost
+        else:
+            self.stats["complete_frames"] += 1
+
+        return {
+            "id": frame_id,
+            "buffer": frame["buffer"],
+            "points": buffer[:count],
+            "packets": len(received),
+            "lost": lost,
+            "arrival": frame["arrival"],
+            "sent": frame["sent"],
+            "ready": time.perf_counter()
+        }
+
+    def flush(self) -> list:
+        """
+        Finish every open frame.
+
+        Returns:
+            list: the finished frames.
+        """
+
+        return [self.finish(frame_id) for frame_id in list(self.open)]
+
+    def release(self, frame: dict) -> None:
+        """
+        Give back the buffer of a finished frame.
+
+        Args:
+            frame (dict): returned by finish.
+        """
+
+        self.free.append(frame["buffer"])
+
+
+class PacketReceiver(asyncio.DatagramProtocol):
+    """
+    Assemble the received packets into frames and keep the newest ones
+    for the detection: the queue is bounded and, when the detection falls
+    behind, the oldest frames are dropped instead of delaying the new ones.
+    """
+
+    def __init__(
+        self, max_points: int = None, queue_size: int = FRAME_QUEUE_SIZE,
+        max_open: int = MAX_OPEN_FRAMES, max_age: float = MAX_FRAME_AGE, workers: int = 1
+    ) -> None:
+        """
+        Args:
+            max_points (int, optional): largest frame. Defaults to every
+                beam of the default LidarModel.
+
+            queue_size (int, optional): frames waiting for the detection.
+                Defaults to FRAME_QUEUE_SIZE.
+
+            max_open (int, optional): frames assembled at the same time.
+                Defaults to MAX_OPEN_FRAMES.
+
+            max_age (float, optional): seconds after which a waiting frame
+                is dropped. Defaults to MAX_FRAME_AGE.
+
+            workers (int, optional): frames processed at the same time.
+                Defaults to 1.
+        """
+
+        if max_points is None:
+            model = get_default_model()
+            max_points = model.num_channels * model.num_points
+
+        self.queue_size = queue_size
+        self.max_age = max_age
+
+        # One buffer per open, queued and processed frame, plus the one being started
+        self.assembler = FrameAssembler(max_points, max_open + queue_size + workers + 1, max_open)
+
+        self.ready = collections.deque()
+        self.event = asyncio.Event()
+
+        self.last_packet = time.perf_counter()
+
+        self.dropped = 0
+        self.stale = 0
+
+        self.histograms = {
+            name: instrument.Histogram() for name in ("assembly", "wait", "process", "latency")
+        }
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, address: tuple) -> None:
+        self.last_packet = time.perf_counter()
+
+        for frame in self.assembler.add(data, self.last_packet, self.drop_oldest):
+            self.push(frame)
+
+    def push(self, frame: dict) -> None:
+        """
+        Queue a finished frame, dropping the oldest one when the queue is full.
+
+        Args:
+            frame (dict): returned by FrameAssembler.finish.
+        """
+
+        self.histograms["assembly"].add(1e3 * (frame["ready"] - frame["arrival"]))
+
+        if len(self.ready) >= self.queue_size:
+            self.drop_oldest()
+
+        self.ready.append(frame)
+        self.event.set()
+
+    def drop_oldest(self) -> bool:
+        """
+        Drop the oldest queued frame and free its buffer.
+
+        Returns:
+            bool: False when no frame is queued.
+        """
+
+        if not self.ready:
+            return False
+
+        self.assembler.release(self.ready.popleft())
+        self.dropped += 1
+
+        return True
+
+    def flush(self) -> None:
+        """
+        Queue the frames still being assembled.
+        """
+
+        for frame in self.assembler.flush():
+            self.push(frame)
+
+    async def get(self, timeout: float = None) -> dict:
+        """
+        Wait for the oldest frame that is not stale.
+
+        Args:
+            timeout (float, optional): seconds without packets after which
+                the open frames are flushed and None is returned once the
+                queue is empty. Defaults to None (wait forever).
+
+        Returns:
+            dict: frame (see FrameAssembler.finish), None on timeout.
+        """
+
+        while True:
+            while self.ready:
+                frame = self.ready.popleft()
+
+                if time.perf_counter() - frame["ready"] <= self.max_age:
+                    return frame
+
+                self.assembler.release(frame)
+                self.stale += 1
+
+            self.event.clear()
+
+            if timeout is None:
+                await self.event.wait()
+                continue
+
+            idle = time.perf_counter() - self.last_packet
+
+            try:
+                await asyncio.wait_for(self.event.wait(), max(0.0, timeout - idle))
+            except asyncio.TimeoutError:
+                if time.perf_counter() - self.last_packet < timeout:
+                    continue
+
+                self.flush()
+
+                if not self.ready:
+                    return None
+
+    def done(self, frame: dict, started: float) -> None:
+        """
+        Record the latencies of a processed frame and free its buffer.
+
+        Args:
+            frame (dict): returned by get.
+            started (float): time.perf_counter() when its processing started.
+        """
+
+        finished = time.perf_counter()
+
+        self.histograms["wait"].add(1e3 * (started - frame["ready"]))
+        self.histograms["process"].add(1e3 * (finished - started))
+        self.histograms["latency"].add(1e3 * (finished - frame["arrival"]))
+
+        self.assembler.release(frame)
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: packet counters of the assembler, "loss_ratio", "dropped"
+                (pushed out of the full queue), "stale" (older than max_age)
+                and the latency histograms in milliseconds: "assembly" (first
+                packet to finished frame), "wait" (queued), "process" and
+                "latency" (first packet to centroids).
+        """
+
+        stats = dict(self.assembler.stats)
+        expected = stats["packets"] - stats["late_packets"] + stats["lost_packets"]
+
+        stats["loss_ratio"] = stats["lost_packets"] / expected if expected else 0.0
+        stats["dropped"] = self.dropped
+        stats["stale"] = self.stale
+        stats["latency_ms"] = {
+            name: histogram.to_dict() for (name, histogram) in self.histograms.items()
+        }
+
+        return stats
+
+
+def open_receiver_socket(host: str, port: int) -> socket.socket:
+    """
+    Bind a UDP socket with a large receive buffer.
+
+    Args:
+        host (str): address to listen on.
+        port (int): UDP port (0 picks a free one).
+
+    Returns:
+        socket.socket: the bound socket.
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+    sock.bind((host, port))
+
+    return sock
+
+
+async def receive(
+    sock: socket.socket, handle=processing, frames: int = None, timeout: float = None,
+    queue_size: int = FRAME_QUEUE_SIZE, max_age: float = MAX_FRAME_AGE, ready=None
+) -> dict:
+    """
+    Receive packets and detect the cones of every assembled frame. The
+    detection runs in a worker thread, so the packets keep being received
+    and assembled while a frame is processed.
+
+    Args:
+        sock (socket.socket): bound UDP socket (see open_receiver_socket).
+
+        handle (optional): called with the points of each frame (a view
+            of a reused buffer). Defaults to processing.
+
+        frames (int, optional): stop after this many frames were handled.
+            Defaults to None (no limit).
+
+        timeout (float, optional): stop after this many seconds without
+            packets. Defaults to None (wait forever).
+
+        queue_size (int, optional): Defaults to FRAME_QUEUE_SIZE.
+        max_age (float, optional): Defaults to MAX_FRAME_AGE.
+
+        ready (asyncio.Event, optional): set once the socket is listening.
+
+    Returns:
+        dict: {"frames", "errors", "last_error", "results", "elapsed_s",
+            "fps"} and the counters of PacketReceiver.report, with the
+            result of each handled frame by frame id and the number of
+            frames the handler raised on.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    transport, receiver = await loop.create_datagram_endpoint(
+        lambda: PacketReceiver(queue_size=queue_size, max_age=max_age), sock=sock
+    )
+
+    if ready is not None:
+        ready.set()
+
+    results = {}
+
+    errors = 0
+    last_error = None
+
+    def work(frame: dict):
+        with instrument.frame(index=frame["id"], packets=frame["packets"], lost=frame["lost"]):
+            return handle(frame["points"])
+
+    start = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(1) as executor:
+            while frames is None or len(results) + errors < frames:
+                frame = await receiver.get(timeout)
+
+                if frame is None:
+                    break
+
+                started = time.perf_counter()
+
+                # A frame the handler fails on must neither stop the stream nor keep its buffer
+                try:
+                    results[frame["id"]] = await loop.run_in_executor(executor, work, frame)
+                except Exception as error:
+                    errors += 1
+                    last_error = f"frame {frame['id']}: {error!r}"
+                finally:
+                    receiver.done(frame, started)
+    finally:
+        transport.close()
+
+    elapsed = time.perf_counter() - start
+
+    report = receiver.report()
+    report.update({
+        "frames": len(results),
+        "errors": errors,
+        "last_error": last_error,
+        "results": results,
+        "elapsed_s": elapsed,
+        "fps": len(results) / elapsed if elapsed > 0 else 0.0
+    })
+
+    return report
+
+
+async def replay(
+    source: str, host: str = STREAM_HOST, port: int = STREAM_PORT,
+    rate: float = FRAME_RATE, loops: int = 1, loss: float = 0.0, seed: int = 0
+) -> dict:
+    """
+    Stream point cloud files as packets, spread evenly over the period of
+    each frame like a rotating sensor.
+
+    Args:
+        source (str): directory or glob pattern of the point clouds.
+        host (str, optional): address of the receiver. Defaults to STREAM_HOST.
+        port (int, optional): UDP port of the receiver. Defaults to STREAM_PORT.
+        rate (float, optional): frames per second. Defaults to FRAME_RATE.
+        loops (int, optional): times the files are sent. Defaults to 1.
+
+        loss (float, optional): share of the packets left out on purpose,
+            to exercise the loss accounting. Defaults to 0.0.
+
+        seed (int, optional): seed of the left out packets. Defaults to 0.
+
+    Returns:
+        dict: {"frames", "packets", "skipped", "elapsed_s", "behind_s"} where
+            behind_s is how late the last packet was on its schedule.
+    """
+
+    paths = pipeline.list_frames(source)
+    rng = np.random.default_rng(seed)
+
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        asyncio.DatagramProtocol, remote_addr=(host, port)
+    )
+
+    period = 1.0 / rate
+    sent = skipped = 0
+    behind = 0.0
+
+    start = time.perf_counter()
+
+    try:
+        for (frame_id, path) in enumerate(paths * loops):
+            points = pclbin.as_points(pclbin.read_points(path))
+            firsts = split_packets(len(points))
+
+            num_packets = len(firsts) - 1
+            frame_start = start + frame_id * period
+
+            for index in range(num_packets):
+                due = frame_start + period * index / num_packets
+                behind = time.perf_counter() - due
+
+                # Yield even when late, a receiver of the same loop must keep
+                # draining its socket
+                await asyncio.sleep(max(0.0, -behind))
+
+                if loss and rng.random() < loss:
+                    skipped += 1
+                    continue
+
+                transport.sendto(encode_packet(
+                    frame_id, index, num_packets, firsts[index], points[firsts[index]:firsts[index + 1]]
+                ))
+                sent += 1
+    finally:
+        transport.close()
+
+    return {
+        "frames": len(paths) * loops,
+        "packets": sent,
+        "skipped": skipped,
+        "elapsed_s": time.perf_counter() - start,
+        "behind_s": max(0.0, behind)
+    }
+
+
+async def loopback(
+    source: str, rate: float = FRAME_RATE, loss: float = 0.0,
+    queue_size: int = FRAME_QUEUE_SIZE, max_age: float = MAX_FRAME_AGE, handle=processing
+) -> tuple:
+    """
+    Replay point cloud files to a receiver of the same event loop.
+
+    Args:
+        source (str): directory or glob pattern of the point clouds.
+        rate (float, optional): frames per second. Defaults to FRAME_RATE.
+        loss (float, optional): share of the packets left out. Defaults to 0.0.
+        queue_size (int, optional): Defaults to FRAME_QUEUE_SIZE.
+        max_age (float, optional): Defaults to MAX_FRAME_AGE.
+        handle (optional): called with the points of each frame. Defaults to processing.
+
+    Returns:
+        tuple: reports of replay and receive.
+    """
+
+    sock = open_receiver_socket(STREAM_HOST, 0)
+    ready = asyncio.Event()
+
+    receiving = asyncio.create_task(receive(
+        sock, handle, timeout=max(0.5, 5 / rate), queue_size=queue_size, max_age=max_age, ready=ready
+    ))
+
+    await ready.wait()
+
+    sent = await replay(source, STREAM_HOST, sock.getsockname()[1], rate, loss=loss)
+
+    return sent, await receiving
+
+
+def print_report(report: dict) -> None:
+    """
+    Print the counters and latencies of a receive run.
+
+    Args:
+        report (dict): returned by receive.
+    """
+
+    print(
+        "Handled %d frames in %.2f s (%.2f frames/s): %d complete, %d partial, "
+        "%d dropped, %d stale, %d missing."
+        % (report["frames"], report["elapsed_s"], report["fps"], report["complete_frames"],
+           report["partial_frames"], report["dropped"], report["stale"], report["missing_frames"])
+    )
+
+    print(
+        "  packets  %d received, %d lost (%.2f%%), %d late, %d invalid, %d overruns"
+        % (report["packets"], report["lost_packets"], 100 * report["loss_ratio"],
+           report["late_packets"], report["invalid_packets"], report["overruns"])
+    )
+
+    if report["errors"]:
+        print("  errors   %d frames, last: %s" % (report["errors"], report["last_error"]))
+
+    if "floor" in report:
+        pipeline.print_floor(report["floor"])
+
+    for (name, histogram) in report["latency_ms"].items():
+        print(
+            "  %-8s mean %7.2f ms, p50 <= %g ms, p95 <= %g ms, max %7.2f ms"
+            % (name, histogram["mean"], histogram["p50"], histogram["p95"], histogram["max"])
+        )
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Stream point clouds as UDP packets and detect the cones of the received frames."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    receiver = commands.add_parser("receive", help="detect the cones of the received frames")
+    receiver.add_argument("--host", default=STREAM_HOST)
+    receiver.add_argument("--port", type=int, default=STREAM_PORT)
+    receiver.add_argument("--frames", type=int, default=None, help="stop after this many frames")
+    receiver.add_argument("--timeout", type=float, default=None, help="stop after seconds without packets")
+    receiver.add_argument("--queue-size", type=int, default=FRAME_QUEUE_SIZE)
+    receiver.add_argument("--max-age", type=float, default=MAX_FRAME_AGE)
+    receiver.add_argument("--track-floor", action="store_true", help="track the floor plane between frames")
+
+    sender = commands.add_parser("replay", help="stream the point cloud files as packets")
+    sender.add_argument("source", nargs="?", default="pcls", help="directory or glob of the point clouds")
+    sender.add_argument("--host", default=STREAM_HOST)
+    sender.add_argument("--port", type=int, default=STREAM_PORT)
+    sender.add_argument("--rate", type=float, default=FRAME_RATE, help="frames per second")
+    sender.add_argument("--loops", type=int, default=1)
+    sender.add_argument("--loss", type=float, default=0.0, help="share of packets left out")
+
+    both = commands.add_parser("loopback", help="replay the files to a receiver in this process")
+    both.add_argument("source", nargs="?", default="pcls", help="directory or glob of the point clouds")
+    both.add_argument("--rate", type=float, default=FRAME_RATE, help="frames per second")
+    both.add_argument("--loss", type=float, default=0.0, help="share of packets left out")
+    both.add_argument("--queue-size", type=int, default=FRAME_QUEUE_SIZE)
+    both.add_argument("--max-age", type=float, default=MAX_FRAME_AGE)
+    both.add_argument("--track-floor", action="store_true", help="track the floor plane between frames")
+
+    args = parser.parse_args(argv)
+
+    # The frames are handled one at a time, in order, so one tracker follows them all
+    estimator = ransac.FloorEstimator() if getattr(args, "track_floor", False) else None
+    handle = processing if estimator is None else partial(processing, estimator=estimator)
+
+    if args.command == "receive":
+        sock = open_receiver_socket(args.host, args.port)
+        report = asyncio.run(receive(
+            sock, handle, frames=args.frames, timeout=args.timeout,
+            queue_size=args.queue_size, max_age=args.max_age
+        ))
+
+        if estimator is not None:
+            report["floor"] = estimator.statistics()
+
+        print_report(report)
+
+    elif args.command == "replay":
+        sent = asyncio.run(replay(args.source, args.host, args.port, args.rate, args.loops, args.loss))
+        print(
+            "Sent %d frames (%d packets, %d left out) in %.2f s, last packet %.1f ms late."
+            % (sent["frames"], sent["packets"], sent["skipped"], sent["elapsed_s"], 1e3 * sent["behind_s"])
+        )
+
+    else:
+        sent, report = asyncio.run(loopback(
+            args.source, args.rate, args.loss, args.queue_size, args.max_age, handle
+        ))
+
+        if estimator is not None:
+            report["floor"] = estimator.statistics()
+
+        print("Sent %d frames (%d packets, %d left out)." % (sent["frames"], sent["packets"], sent["skipped"]))
+        print_report(report)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules of the repository are imported from its root, as the scripts do
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
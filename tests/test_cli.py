@@ -0,0 +1,61 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import cli
+import pclbin
+import simulate
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+
+    thread = threading.Thread(target=cli.serve, args=(socket_path, False), daemon=True)
+    thread.start()
+
+    cli.wait_for_daemon(socket_path, timeout=10.0)
+
+    yield socket_path
+
+    if thread.is_alive():
+        list(cli.request({"command": "shutdown"}, socket_path))
+
+    thread.join(timeout=10.0)
+
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+
+
+def test_daemon_socket_per_user():
+    assert str(os.getuid()) in os.path.basename(cli.DAEMON_SOCKET)
+
+
+def test_daemon_replies(daemon, tmp_path):
+    frame = str(tmp_path / "frame.pclb")
+    point_cloud = simulate.generate_point_cloud(np.zeros(4), np.array([[5.0, 1.0]]), np.random.default_rng(0))
+    pclbin.write_binary(frame, point_cloud)
+
+    missing = str(tmp_path / "missing.pclb")
+
+    replies = list(cli.request({"paths": [frame, missing, frame], "mode": "ransac"}, daemon))
+
+    assert len(replies) == 4
+
+    for reply in (replies[0], replies[2]):
+        assert reply["path"] == frame
+        assert len(reply["centroids"]) == 1 and reply["ms"] > 0
+
+    assert replies[1]["path"] == missing
+    assert replies[1]["error"].startswith("FileNotFoundError")
+
+    assert replies[3]["frames"] == 3
+
+    # The daemon serves the next client
+    assert list(cli.request({"paths": []}, daemon))[-1]["frames"] == 0
+
+
+def test_daemon_shutdown(daemon):
+    assert list(cli.request({"command": "shutdown"}, daemon)) == [{"shutdown": True}]
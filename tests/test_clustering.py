@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+import pytest
+
+import clustering
+import ransac
+import simulate
+import utils
+
+from conftest import ROOT
+
+sklearn_cluster = pytest.importorskip("sklearn.cluster")
+
+
+def assert_same_partition(labels: np.ndarray, expected: np.ndarray) -> None:
+    """
+    Same noise points and a one to one map between the cluster labels.
+    """
+
+    np.testing.assert_array_equal(labels == -1, expected == -1)
+
+    clustered = expected != -1
+    pairs = np.unique(np.column_stack((labels[clustered], expected[clustered])), axis=0)
+
+    assert len(pairs) == len(np.unique(labels[clustered]))
+    assert len(pairs) == len(np.unique(expected[clustered]))
+
+
+def reference_labels(points: np.ndarray, eps: float, min_samples: int) -> np.ndarray:
+    return sklearn_cluster.DBSCAN(eps=eps, min_samples=min_samples).fit(points).labels_
+
+
+def random_blobs(seed: int, num_blobs: int = 12, noise: int = 200) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+
+    centers = rng.uniform(-10, 10, (num_blobs, 3))
+    sizes = rng.integers(1, 40, num_blobs)
+    spreads = rng.uniform(0.05, 0.4, num_blobs)
+
+    blobs = [
+        rng.normal(center, spread, (size, 3))
+        for (center, size, spread) in zip(centers, sizes, spreads)
+    ]
+
+    return np.concatenate(blobs + [rng.uniform(-12, 12, (noise, 3))])
+
+
+@pytest.mark.parametrize("index", [0, 150, 300])
+def test_grid_dbscan_simulated_frames(index):
+    track = utils.load_track(os.path.join(ROOT, "track.json"))
+    pose = utils.get_vehicle_pose(track, index)
+
+    point_cloud = simulate.generate_point_cloud(
+        pose, utils.query_cones(track, pose), np.random.default_rng(index)
+    )
+
+    np.random.seed(index)
+    no_floor = ransac.remove_floor(point_cloud)
+
+    assert len(no_floor) > 0
+
+    for min_samples in (1, 3, 5):
+        labels = clustering.grid_dbscan(no_floor, 0.3, min_samples)
+        assert_same_partition(labels, reference_labels(no_floor, 0.3, min_samples))
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("eps", [0.1, 0.3, 1.0])
+@pytest.mark.parametrize("min_samples", [1, 2, 4, 10])
+def test_grid_dbscan_random_blobs(seed, eps, min_samples):
+    points = random_blobs(seed)
+
+    labels = clustering.grid_dbscan(points, eps, min_samples)
+
+    assert_same_partition(labels, reference_labels(points, eps, min_samples))
+
+
+@pytest.mark.parametrize("spacing", [0.25, 0.25 * (1 + 1e-9), 0.25 * (1 - 1e-9)])
+def test_grid_dbscan_eps_boundary(spacing):
+    # Chains with neighbours exactly at (or just around) eps, along every axis and diagonally
+    steps = np.arange(12)[:, np.newaxis] * spacing
+
+    points = np.concatenate([
+        steps * [1, 0, 0],
+        steps * [0, 1, 0] + [5, 0, 0],
+        steps * [0, 0, 1] + [0, 5, 0],
+        steps * [1, 1, 0] / np.sqrt(2) + [5, 5, 0]
+    ])
+
+    for min_samples in (2, 3, 4):
+        labels = clustering.grid_dbscan(points, 0.25, min_samples)
+        assert_same_partition(labels, reference_labels(points, 0.25, min_samples))
+
+
+def test_grid_dbscan_min_samples_edges():
+    rng = np.random.default_rng(7)
+
+    # Groups of exactly 1 to 6 points inside one eps ball, far apart
+    points = np.concatenate([
+        rng.uniform(-0.05, 0.05, (size, 3)) + [3.0 * size, 0, 0] for size in range(1, 7)
+    ])
+
+    for min_samples in range(1, 8):
+        labels = clustering.grid_dbscan(points, 0.3, min_samples)
+        expected = reference_labels(points, 0.3, min_samples)
+
+        assert_same_partition(labels, expected)
+
+    # No group reaches min_samples: everything is noise
+    assert np.all(clustering.grid_dbscan(points, 0.3, 7) == -1)
+
+
+def test_grid_dbscan_shared_border_point():
+    # Two dense groups of core points and a border point within eps of both
+    left = np.array([[0.0, 0, 0], [-0.1, 0, 0], [-0.1, 0.1, 0], [0, 0.1, 0], [-0.05, 0.05, 0]])
+    right = left * [-1, 1, 1] + [0.5, 0, 0]
+    points = np.concatenate([left, right, [[0.25, -0.15, 0]]])
+
+    labels = clustering.grid_dbscan(points, 0.3, 5)
+    expected = reference_labels(points, 0.3, 5)
+
+    assert len(np.unique(expected[expected >= 0])) == 2 and expected[-1] >= 0
+    assert_same_partition(labels, expected)
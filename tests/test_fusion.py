@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import processing
+import simulate
+
+from lidar import LidarModel, get_rig_models
+
+
+def test_to_vehicle_frame_identity():
+    model = LidarModel(displacement=np.zeros(3), orientation=0.0)
+    points = np.random.default_rng(0).normal(size=(2, 10, 3)).astype(np.float32)
+
+    fused, sensor_ids = processing.to_vehicle_frame(list(points), (model, model))
+
+    np.testing.assert_array_equal(fused, points.reshape(-1, 3))
+    np.testing.assert_array_equal(sensor_ids, np.repeat([0, 1], 10))
+
+
+def test_to_vehicle_frame_yaw_and_offset():
+    models = (
+        LidarModel(displacement=np.array([1.0, 2.0, 0.5]), orientation=np.pi / 2),
+        LidarModel(displacement=np.array([-1.0, 0.0, 1.0]), orientation=np.pi)
+    )
+    points = [np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 2.0]]), np.array([[3.0, 1.0, 0.0]])]
+
+    fused, sensor_ids = processing.to_vehicle_frame(points, models)
+
+    np.testing.assert_allclose(
+        fused, [[1.0, 3.0, 0.5], [0.0, 2.0, 2.5], [-4.0, -1.0, 1.0]], atol=1e-6
+    )
+    np.testing.assert_array_equal(sensor_ids, [0, 0, 1])
+
+
+def test_single_sensor_matches_processing():
+    model = LidarModel(displacement=np.array([0.3, 0.1, 1.1]), orientation=np.deg2rad(5.0))
+
+    # Well inside of the crop rectangle in both frames
+    cones = np.array([[4.0, 1.0], [6.0, -1.5], [7.5, 2.0]])
+    point_cloud = simulate.generate_point_cloud(np.zeros(4), cones, np.random.default_rng(0), model)
+
+    np.random.seed(0)
+    expected = processing.processing(point_cloud, "ransac")
+    expected = processing.to_vehicle_frame([expected], (model,))[0]
+
+    fused = processing.processing_fused([point_cloud], (model,), seed=0)
+
+    # Same clusters, only the RANSAC draws differ
+    assert len(fused) == len(expected) == len(cones)
+    np.testing.assert_allclose(
+        fused[np.argsort(fused[:, 0])], expected[np.argsort(expected[:, 0])], atol=0.01
+    )
+
+
+@pytest.fixture(scope="module")
+def rig_frame():
+    # Ahead of the vehicle, in the field of view of both sensors
+    cone = np.array([[5.0, 0.0]])
+    point_clouds = simulate.generate_sensor_frames(np.zeros(4), cone, rng=np.random.default_rng(0))
+
+    return cone, point_clouds
+
+
+def test_cone_seen_by_two_sensors(rig_frame):
+    cone, point_clouds = rig_frame
+    models = get_rig_models()
+
+    # Each sensor alone detects it
+    for (point_cloud, model) in zip(point_clouds, models):
+        assert len(processing.processing_fused([point_cloud], (model,), seed=0)) == 1
+
+    centroids = processing.processing_fused(point_clouds, models, seed=0)
+
+    assert len(centroids) == 1
+    assert np.hypot(*(centroids[0, :2] - cone[0])) < 0.2
+
+
+def test_fused_deterministic(rig_frame):
+    point_clouds = rig_frame[1]
+
+    serial = processing.processing_fused(point_clouds, workers=1, seed=3)
+
+    with ThreadPoolExecutor(2) as executor:
+        for _ in range(3):
+            np.testing.assert_array_equal(
+                processing.processing_fused(point_clouds, seed=3, executor=executor), serial
+            )
+
+    np.testing.assert_array_equal(processing.processing_fused(point_clouds, workers=2, seed=3), serial)
+
+    # Without a seed, the global random state picks it
+    np.random.seed(1)
+    first = processing.processing_fused(point_clouds, workers=2)
+    np.random.seed(1)
+    np.testing.assert_array_equal(processing.processing_fused(point_clouds, workers=2), first)
@@ -0,0 +1,92 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import instrument
+import simulate
+
+from processing import processing
+
+
+@pytest.fixture
+def point_cloud():
+    # Simulated before the sink is enabled, the simulator has its own stage
+    rng = np.random.default_rng(0)
+
+    return simulate.generate_point_cloud(np.zeros(4), np.array([[4.0, 1.0], [6.0, -1.0]]), rng)
+
+
+@pytest.fixture
+def sink():
+    sink = instrument.MemorySink()
+    instrument.enable(sink)
+
+    yield sink
+
+    instrument.disable()
+    instrument.reset()
+
+
+def test_memory_stages_nest(sink):
+    instrument.enable(sink, memory=True)
+    tracemalloc.start()
+
+    try:
+        with instrument.frame(), instrument.stage("outer"):
+            small = np.ones(1024)
+
+            with instrument.stage("inner"):
+                large = np.ones(64 * 1024)
+                del large
+    finally:
+        tracemalloc.stop()
+
+    peaks = sink.records[-1]["peak_kib"]
+
+    # 512 KiB array inside, 8 KiB before it
+    assert 500 < peaks["inner"] < 600
+    assert peaks["outer"] >= peaks["inner"] + 7
+
+
+def test_processing_stages(point_cloud, sink):
+    np.random.seed(0)
+
+    with instrument.frame(index=0):
+        centroids = processing(point_cloud, "ransac")
+
+    (record,) = sink.records
+
+    assert record["frame"] == {"index": 0}
+    assert {"crop", "ransac", "sample", "planes", "score", "dbscan", "centroids"} <= set(record["stages"])
+    assert record["total_ms"] >= record["stages"]["ransac"] >= record["stages"]["score"]
+
+    assert record["counters"]["points"] == len(point_cloud)
+    assert record["counters"]["cones"] == len(centroids) == 2
+
+    assert instrument.summary()["stages"]["frame"]["count"] == 1
+
+
+def test_disabled_records_nothing():
+    sink = instrument.MemorySink()
+    instrument.enable(sink)
+    instrument.disable()
+
+    assert instrument.stage("crop") is instrument.NULL_STAGE
+    assert instrument.start_frame(index=0) is None
+
+    with instrument.frame(index=0), instrument.stage("crop"):
+        instrument.count("points", 10)
+
+    assert sink.records == []
+    assert instrument.summary() == {"stages": {}, "counters": {}}
+
+
+def test_stage_outside_of_frame(sink):
+    with instrument.stage("crop"):
+        pass
+
+    instrument.count("points", 3)
+
+    assert [set(record) for record in sink.records] == [{"stages"}, {"counters"}]
+    assert instrument.summary()["counters"] == {"points": 3}
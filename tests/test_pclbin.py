@@ -0,0 +1,74 @@
+import numpy as np
+
+import pclbin
+
+from constantspcl import POINT_DTYPE
+
+
+def write_file(directory, name: str, text: str) -> str:
+    path = directory / name
+    path.write_text(text)
+
+    return str(path)
+
+
+def test_convert_mixed_columns(tmp_path):
+    write_file(tmp_path, "mixed.txt", "1 2 3 4\n5 6 7\n8 9 10 11\n")
+
+    assert pclbin.convert_directory(str(tmp_path)) == 1
+
+    data = pclbin.read_binary(str(tmp_path / "mixed.pclb"))
+
+    assert pclbin.read_header(str(tmp_path / "mixed.pclb"))["columns"] == ("x", "y", "z", "intensity")
+    np.testing.assert_array_equal(data[:, :3], [[1, 2, 3], [5, 6, 7], [8, 9, 10]])
+    np.testing.assert_array_equal(data[:, 3], [4, np.nan, 11])
+
+    # Same rows as the loader of the detection
+    np.testing.assert_array_equal(data[:, :3], pclbin.read_points(str(tmp_path / "mixed.txt")))
+
+
+def test_convert_three_columns_csv(tmp_path):
+    write_file(tmp_path, "frame.csv", "x,y,z\n1,2,3\n4, 5, 6\nbad line\n")
+
+    pclbin.convert_directory(str(tmp_path))
+
+    data = pclbin.read_binary(str(tmp_path / "frame.pclb"))
+
+    assert pclbin.read_header(str(tmp_path / "frame.pclb"))["columns"] == pclbin.XYZ_COLUMNS
+    np.testing.assert_array_equal(data, [[1, 2, 3], [4, 5, 6]])
+
+
+def test_convert_header_only_csv(tmp_path):
+    write_file(tmp_path, "empty.csv", "x,y,z\n")
+    write_file(tmp_path, "blank.txt", "")
+
+    assert pclbin.convert_directory(str(tmp_path)) == 2
+
+    for name in ("empty.pclb", "blank.pclb"):
+        header = pclbin.read_header(str(tmp_path / name))
+        data = pclbin.read_binary(str(tmp_path / name))
+
+        assert header["count"] == 0
+        assert data.shape == (0, 3)
+        assert (tmp_path / name).stat().st_size == pclbin.HEADER_SIZE
+
+
+def test_parse_lines_skips_malformed_lines():
+    points, skipped = pclbin.parse_lines(["1 2 3\n", "4 5\n", "6,7,8,9\n", "a b c\n", "\n"])
+
+    np.testing.assert_array_equal(points, [[1, 2, 3], [6, 7, 8]])
+    assert skipped == 3
+
+
+def test_read_points_dtype(tmp_path):
+    points = np.random.default_rng(0).normal(size=(50, 4))
+
+    text = write_file(tmp_path, "frame.txt", "".join("%.9g %.9g %.9g %.9g\n" % tuple(row) for row in points))
+    binary = str(tmp_path / "frame.pclb")
+    pclbin.write_binary(binary, points)
+
+    for filename in (text, binary):
+        loaded = pclbin.read_points(filename)
+
+        assert loaded.dtype == POINT_DTYPE and loaded.flags.c_contiguous
+        np.testing.assert_allclose(loaded, points[:, :3], rtol=1e-6)
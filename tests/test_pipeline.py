@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+import pclbin
+import pipeline
+import simulate
+
+# One cone ahead of the sensor per frame, further away in the later frames
+FRAMES = {"frame_1": 3.0, "frame_2": 5.0, "frame_10": 7.0}
+
+
+def write_frames(directory) -> None:
+    rng = np.random.default_rng(0)
+
+    for (name, distance) in FRAMES.items():
+        point_cloud = simulate.generate_point_cloud(np.zeros(4), np.array([[distance, 0.0]]), rng)
+        rng.shuffle(point_cloud)
+
+        pclbin.write_binary(str(directory / f"{name}{pclbin.BINARY_EXTENSION}"), point_cloud)
+
+
+def test_list_frames_natural_order(tmp_path):
+    write_frames(tmp_path)
+
+    names = [os.path.basename(path) for path in pipeline.list_frames(str(tmp_path))]
+
+    assert names == [f"{name}{pclbin.BINARY_EXTENSION}" for name in FRAMES]
+
+
+def test_run_pipeline_writes_each_frame(tmp_path):
+    source, destination = tmp_path / "frames", tmp_path / "centroids"
+    source.mkdir()
+    write_frames(source)
+
+    np.random.seed(0)
+    report = pipeline.run_pipeline(str(source), str(destination), readers=2, processors=2)
+
+    assert report["frames"] == len(FRAMES)
+    assert sorted(os.listdir(destination)) == sorted(f"{name}_centroids.txt" for name in FRAMES)
+
+    for (index, (name, distance)) in enumerate(FRAMES.items()):
+        written = np.loadtxt(str(destination / f"{name}_centroids.txt"), ndmin=2)
+
+        # Results are stored by frame index, whatever thread finished first
+        np.testing.assert_allclose(written, report["centroids"][index], atol=1e-6)
+        assert len(written) == 1 and abs(written[0, 0] - distance) < 0.2
+
+
+def test_run_pipeline_reraises_after_draining(tmp_path):
+    source, destination = tmp_path / "frames", tmp_path / "centroids"
+    source.mkdir()
+    write_frames(source)
+
+    # Sorted between frame_1 and frame_2
+    (source / "frame_1b.pclb").write_bytes(b"garbage")
+
+    with pytest.raises(RuntimeError, match="frame_1b") as info:
+        pipeline.run_pipeline(str(source), str(destination))
+
+    assert isinstance(info.value.__cause__, ValueError)
+
+    # The other frames went through every stage before the error surfaced
+    assert sorted(os.listdir(destination)) == sorted(f"{name}_centroids.txt" for name in FRAMES)
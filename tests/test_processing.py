@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+
+import benchmark
+import processing
+
+from constants import CLUSTER_SIZE_TOLERANCE
+from constantspcl import CONE_RADIUS, CONE_HEIGHT, POINT_DTYPE
+
+
+def labelled_cloud() -> tuple:
+    """
+    A cone, a pole too tall, a wall too wide and some noise, with labels.
+    """
+
+    rng = np.random.default_rng(0)
+
+    cone = rng.uniform([-0.1, -0.1, 0.0], [0.1, 0.1, CONE_HEIGHT], (20, 3)) + [5, 1, -1.1]
+    pole = rng.uniform([-0.05, -0.05, 0.0], [0.05, 0.05, 1.5], (15, 3)) + [6, -2, -1.1]
+    wall = rng.uniform([-1.0, -0.05, 0.0], [1.0, 0.05, 0.3], (25, 3)) + [8, 0, -1.1]
+    noise = rng.uniform(-5, 5, (7, 3))
+
+    points = np.concatenate((cone, pole, wall, noise))
+    labels = np.repeat([0, 1, 2, -1], [len(cone), len(pole), len(wall), len(noise)])
+
+    # Clusters are not stored in label order by the detection
+    order = rng.permutation(len(points))
+
+    return points[order], labels[order]
+
+
+def reference_features(points: np.ndarray, labels: np.ndarray) -> dict:
+    """
+    One pass per cluster, like the detection computed the centroids before
+    the grouped pass.
+    """
+
+    clusters = [points[labels == label] for label in range(labels.max() + 1)]
+
+    return {
+        "count": np.array([len(cluster) for cluster in clusters]),
+        "centroid": np.array([np.mean(cluster, axis=0) for cluster in clusters]),
+        "minimum": np.array([np.min(cluster, axis=0) for cluster in clusters]),
+        "maximum": np.array([np.max(cluster, axis=0) for cluster in clusters]),
+        "height": np.array([np.ptp(cluster[:, 2]) for cluster in clusters]),
+        "radial_spread": np.array([
+            np.sqrt(np.mean(np.sum((cluster[:, :2] - cluster[:, :2].mean(axis=0))**2, axis=1)))
+            for cluster in clusters
+        ])
+    }
+
+
+def test_compute_cluster_features_matches_per_cluster_loop():
+    points, labels = labelled_cloud()
+
+    features = processing.compute_cluster_features(points, labels)
+    expected = reference_features(points, labels)
+
+    for (name, values) in expected.items():
+        np.testing.assert_allclose(features[name], values, rtol=0, atol=1e-9, err_msg=name)
+
+
+def test_compute_cluster_features_without_clusters():
+    features = processing.compute_cluster_features(np.zeros((3, 3)), np.full(3, -1))
+
+    assert len(features["count"]) == 0
+    assert features["centroid"].shape == (0, 3)
+
+
+def test_filter_clusters_rejects_oversized_clusters():
+    points, labels = labelled_cloud()
+
+    kept = processing.filter_clusters(processing.compute_cluster_features(points, labels))
+
+    # Only the cone fits CONE_HEIGHT and 2 * CONE_RADIUS (plus the tolerance)
+    np.testing.assert_array_equal(kept, [True, False, False])
+
+
+def test_filter_clusters_tolerance_bounds():
+    top = CONE_HEIGHT + CLUSTER_SIZE_TOLERANCE
+    side = 2 * CONE_RADIUS + CLUSTER_SIZE_TOLERANCE
+
+    features = {
+        "height": np.array([top - 1e-6, top + 1e-6, 0.1, 0.1]),
+        "minimum": np.zeros((4, 3)),
+        "maximum": np.array([
+            [0.1, 0.1, 0], [0.1, 0.1, 0], [side - 1e-6, 0, 0], [0, side + 1e-6, 0]
+        ])
+    }
+
+    np.testing.assert_array_equal(processing.filter_clusters(features), [True, False, True, False])
+
+
+@pytest.fixture(scope="module")
+def lap():
+    """
+    Shuffled frames of the simulated flat lap and their cones.
+    """
+
+    frames = []
+
+    for (image, cones) in benchmark.lap_frames(step=20):
+        points = image.points()
+        np.random.default_rng(len(frames)).shuffle(points)
+        frames.append((points, cones))
+
+    return frames
+
+
+def test_float32_accuracy(lap):
+    """
+    The float32 frames detect the same cones as float64 ones, with centroid
+    errors within a hundredth of a millimeter on average.
+    """
+
+    scores = {}
+
+    for dtype in (np.float32, np.float64):
+        scores[dtype] = np.zeros(4)
+
+        for (points, cones) in lap:
+            np.random.seed(0)
+            centroids = processing.processing(points, "ransac", dtype=dtype)
+
+            assert centroids.dtype == dtype
+            scores[dtype] += benchmark.score_detections(centroids, cones)
+
+    single, double = scores[np.float32], scores[np.float64]
+
+    np.testing.assert_array_equal(single[:3], double[:3])
+    assert single[1] > 0.5 * single[0]
+
+    assert abs(single[3] - double[3]) / single[1] < 1e-5
+
+
+def test_processing_dtype():
+    point_cloud = np.asfortranarray(labelled_cloud()[0].astype(np.float64))
+
+    centroids = processing.processing(point_cloud, "ransac")
+
+    assert centroids.dtype == POINT_DTYPE and centroids.flags.c_contiguous
+
+
+@pytest.mark.parametrize("batch_size", [1, 4, 64])
+def test_processing_batch_matches_processing(lap, batch_size):
+    frames = [points for (points, _) in lap]
+
+    # Nothing at all, and nothing in the crop rectangle (behind the sensor)
+    frames.insert(2, np.empty((0, 3), dtype=POINT_DTYPE))
+    frames.insert(5, frames[0] - [20.0, 0.0, 0.0])
+
+    np.random.seed(0)
+    expected = [processing.processing(frame, "ransac") for frame in frames]
+
+    np.random.seed(0)
+    batched = processing.processing_batch(frames, batch_size)
+
+    assert len(batched) == len(frames)
+    assert len(expected[2]) == len(expected[5]) == 0
+    assert sum(map(len, expected)) > 0
+
+    for (actual, centroids) in zip(batched, expected):
+        np.testing.assert_allclose(actual, centroids, atol=1e-6)
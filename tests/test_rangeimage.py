@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import simulate
+
+from rangeimage import RangeImage, locate_points
+
+
+@pytest.fixture(scope="module")
+def image():
+    rng = np.random.default_rng(0)
+    full = simulate.generate_range_image(np.zeros(4), np.array([[4.0, 1.0], [7.0, -2.0]]), rng)
+
+    # Beams without return
+    return RangeImage(full.ranges, full.valid & (rng.random(full.shape) > 0.2), full.model)
+
+
+def assert_same_image(actual: RangeImage, expected: RangeImage) -> None:
+    np.testing.assert_array_equal(actual.valid, expected.valid)
+    np.testing.assert_allclose(actual.ranges, expected.ranges, atol=1e-5)
+
+
+def test_write_read_round_trip(image, tmp_path):
+    filename = str(tmp_path / "frame.pclb")
+
+    image.write(filename)
+
+    assert_same_image(RangeImage.read(filename), image)
+
+
+def test_write_needs_binary_name(image, tmp_path):
+    with pytest.raises(ValueError):
+        image.write(str(tmp_path / "frame.txt"))
+
+
+def test_from_points_round_trip(image):
+    assert_same_image(RangeImage.from_points(image.points()), image)
+
+
+def test_locate_points_first_bin(image):
+    # Points on the first azimuth of each channel, where the angle wraps
+    channels = np.arange(image.shape[0])
+    points = image.points()[np.isin(np.flatnonzero(image.valid), channels * image.shape[1])]
+
+    pixels = locate_points(points, image.model)[0]
+
+    assert len(points) > 0
+    assert np.all(pixels % image.shape[1] == 0)
@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+
+import ransac
+
+from constants import NUM_PLANES, RANSAC_CONFIDENCE, DIST2PLANE_THRESHOLD
+
+
+# Ground of the synthetic frames: z = 0.1 x - 0.05 y - 1.1
+TRUE_PLANE = np.array([-0.1, 0.05, 1.0, 1.1]) / np.linalg.norm([-0.1, 0.05, 1.0])
+
+
+def plane_with_outliers(seed: int = 0, floor: int = 2000, outliers: int = 1300) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+
+    xy = rng.uniform([0, -5], [10, 5], (floor, 2))
+    z = 0.1 * xy[:, 0] - 0.05 * xy[:, 1] - 1.1 + rng.normal(0, 0.01, floor)
+
+    points = np.concatenate((
+        np.column_stack((xy, z)), rng.uniform([0, -5, -1.5], [10, 5, 1.0], (outliers, 3))
+    ))
+
+    return points[rng.permutation(len(points))]
+
+
+def same_plane(plane: np.ndarray, expected: np.ndarray) -> bool:
+    """
+    Normals within about a degree and offsets within the inlier band.
+    """
+
+    plane = plane * np.sign(plane[2])
+
+    return (
+        np.allclose(plane[:3], expected[:3], atol=0.02)
+        and abs(plane[3] - expected[3]) < DIST2PLANE_THRESHOLD
+    )
+
+
+def test_required_iterations_bounds():
+    assert ransac.required_iterations(1.0) == 0.0
+    assert ransac.required_iterations(0.0) == np.inf
+
+    expected = np.log(1 - RANSAC_CONFIDENCE) / np.log(1 - 0.5**3)
+
+    assert ransac.required_iterations(0.5) == pytest.approx(expected)
+    np.testing.assert_allclose(
+        ransac.required_iterations(np.array([0.0, 0.5, 1.0])), [np.inf, expected, 0.0]
+    )
+
+
+def test_required_iterations_decreases_with_inliers():
+    ratios = np.linspace(0.05, 0.95, 19)
+
+    assert np.all(np.diff(ransac.required_iterations(ratios)) < 0)
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("mode", ["fixed", "adaptive", "preemptive"])
+def test_find_best_plane_recovers_plane(mode, seed):
+    points = plane_with_outliers(seed)
+
+    np.random.seed(seed)
+    planes = ransac.compute_planes(points[np.random.randint(len(points), size=3 * NUM_PLANES)])
+
+    assert same_plane(ransac.find_best_plane(points, planes, mode), TRUE_PLANE)
+
+
+def test_find_best_plane_unknown_mode():
+    points = plane_with_outliers()
+
+    with pytest.raises(ValueError):
+        ransac.find_best_plane(points, ransac.compute_planes(points[:3 * NUM_PLANES]), "exhaustive")
+
+
+FLAT_PLANE = np.array([0.0, 0.0, 1.0, 1.1])
+
+
+def ground_with_cones(seed: int = 0, tilt: float = 0.0) -> np.ndarray:
+    """
+    Mostly floor frame (z = tilt x - 1.1) with a few blobs well above it, so
+    that any good plane estimate splits the points the same way.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    xy = rng.uniform([0.1, -4.9], [9.9, 4.9], (3000, 2))
+    floor = np.column_stack((xy, tilt * xy[:, 0] - 1.1 + rng.normal(0, 0.005, len(xy))))
+
+    centers = np.array([[3.0, -2.0], [5.0, 2.0], [8.0, 0.0]])
+    blobs = np.concatenate([
+        np.column_stack((
+            center + rng.normal(0, 0.05, (60, 2)),
+            tilt * center[0] - 1.1 + rng.uniform(0.2, 0.5, 60)
+        )) for center in centers
+    ])
+
+    points = np.concatenate((floor, blobs))
+
+    return points[rng.permutation(len(points))]
+
+
+def test_floor_estimator_warm_hit():
+    estimator = ransac.FloorEstimator()
+    points = ground_with_cones()
+
+    np.random.seed(0)
+    first = estimator.estimate(points)
+    second = estimator.estimate(points)
+
+    assert (estimator.frames, estimator.warm_hits) == (2, 1)
+    assert same_plane(first, FLAT_PLANE) and same_plane(second, FLAT_PLANE)
+
+
+def test_floor_estimator_falls_back_to_ransac():
+    estimator = ransac.FloorEstimator()
+
+    np.random.seed(0)
+    estimator.estimate(ground_with_cones())
+
+    # Tilted enough for most of the floor to leave the previous inlier band
+    tilted = ground_with_cones(1, tilt=0.1)
+    assert np.mean(np.abs(tilted @ estimator.plane[:3] + estimator.plane[3]) > DIST2PLANE_THRESHOLD) > 0.5
+
+    plane = estimator.estimate(tilted)
+
+    assert (estimator.frames, estimator.warm_hits) == (2, 0)
+    assert same_plane(plane, np.array([-0.1, 0.0, 1.0, 1.1]) / np.linalg.norm([-0.1, 0.0, 1.0]))
+
+
+def test_floor_estimator_reset():
+    estimator = ransac.FloorEstimator()
+    points = ground_with_cones()
+
+    np.random.seed(0)
+    estimator.estimate(points)
+    estimator.estimate(points)
+    estimator.reset()
+
+    assert estimator.plane is None
+    assert estimator.statistics() == {
+        "frames": 0, "warm_hits": 0, "full_runs": 0, "hit_rate": 0.0,
+        "warm_ms": 0.0, "full_ms": 0.0, "saved_ms": 0.0
+    }
+
+
+def test_floor_estimator_matches_stateless():
+    estimator = ransac.FloorEstimator()
+
+    np.random.seed(0)
+    estimator.select_off_ground(ground_with_cones(0))
+
+    for seed in range(1, 4):
+        points = ground_with_cones(seed)
+
+        np.random.seed(seed)
+        inside, expected = ransac.select_off_ground(points)
+        tracked_inside, tracked = estimator.select_off_ground(points)
+
+        np.testing.assert_array_equal(tracked_inside, inside)
+        np.testing.assert_array_equal(np.sort(tracked), np.sort(expected))
+
+    assert estimator.warm_hits == 3
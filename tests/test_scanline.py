@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import scanline
+import simulate
+
+from processing import processing
+
+
+def naive_sliding_minimum(values: np.ndarray, half_width: int) -> np.ndarray:
+    length = values.shape[-1]
+
+    return np.stack([
+        values[..., max(0, index - half_width):index + half_width + 1].min(axis=-1)
+        for index in range(length)
+    ], axis=-1)
+
+
+@pytest.mark.parametrize("length", [1, 2, 7, 30, 31])
+@pytest.mark.parametrize("half_width", [0, 1, 3, 20])
+def test_sliding_minimum_matches_naive(length, half_width):
+    values = np.random.default_rng(length * 100 + half_width).normal(size=(3, length))
+
+    np.testing.assert_array_equal(
+        scanline.sliding_minimum(values, half_width), naive_sliding_minimum(values, half_width)
+    )
+
+
+def test_sliding_minimum_keeps_inf():
+    values = np.array([np.inf, np.inf, 2.0, np.inf, np.inf, np.inf, np.inf])
+
+    np.testing.assert_array_equal(
+        scanline.sliding_minimum(values, 1), [np.inf, 2.0, 2.0, 2.0, np.inf, np.inf, np.inf]
+    )
+
+
+def test_flat_ground_one_cone():
+    cone = np.array([[5.0, 1.0]])
+    image = simulate.generate_range_image(np.zeros(4), cone, np.random.default_rng(0))
+
+    inside, off_ground = scanline.select(image)
+    labels = scanline.cluster_image(image, off_ground)
+
+    assert set(labels) - {-1} == {0}
+
+    centroids = processing(image, "scanline")
+
+    assert len(centroids) == 1
+    assert np.hypot(*(centroids[0, :2] - cone[0])) < 0.2
@@ -0,0 +1,85 @@
+import numpy as np
+
+import simulate
+
+from lidar import LidarModel
+
+from constantspcl import CONE_HEIGHT, CONE_EFFECTIVE_HEIGHT, POINT_DTYPE
+
+
+# Coarse sensor, so the per beam reference loop stays fast
+COARSE_RESOLUTION = np.deg2rad(0.5)
+
+POSE = np.array([0.3, -0.2, 1.1, 0.4])
+
+CONES = np.array([
+    [4.0, 0.5], [3.5, -2.0], [-2.0, 3.0], [6.0, 6.0], [0.9, 0.2], [-5.0, -1.0],
+    [1.5, 1.0], [2.0, -1.0], [-1.5, -1.5], [2.5, 2.5], [2.6, 2.7]
+])
+
+
+def reference_ranges(pose: np.ndarray, cones: np.ndarray, model: LidarModel) -> np.ndarray:
+    """
+    Noise free ranges of every beam with the per beam, per cone loop of
+    compute_distance, as the simulator computed them before vectorizing.
+    """
+
+    directions = model.rotated_directions(pose[3]).reshape((-1, 3))
+    ranges = np.empty(len(directions))
+
+    for (index, direction) in enumerate(directions):
+        distances = [
+            distance for distance in (
+                simulate.compute_distance(pose[:3] - cone, direction) for cone in cones
+            )
+            if distance is not None
+        ]
+
+        if distances:
+            height = pose[2] + min(distances) * direction[2]
+
+            if 0 < height < CONE_EFFECTIVE_HEIGHT:
+                ranges[index] = min(distances)
+                continue
+
+        ranges[index] = -pose[2] / direction[2]
+
+    return ranges.reshape((model.num_channels, model.num_points))
+
+
+def test_scan_ranges_matches_per_beam_loop():
+    model = LidarModel(angular_resolution=COARSE_RESOLUTION, distance_uncertainty=0.0)
+
+    cones = np.column_stack((CONES, np.full(len(CONES), CONE_HEIGHT)))
+
+    distances = simulate.scan_ranges(POSE, cones, model, np.random.default_rng(0))[0]
+    expected = reference_ranges(POSE, cones, model)
+
+    # Some beams must hit the cones, otherwise the test only covers the ground
+    ground = -POSE[2] / model.rotated_directions(POSE[3])[..., 2]
+    assert np.count_nonzero(np.abs(expected - ground) > 1e-3) > 0
+
+    np.testing.assert_allclose(distances, expected, rtol=0, atol=1e-6)
+
+
+def test_scan_ranges_noise_statistics():
+    sigma = 0.03
+    model = LidarModel(angular_resolution=COARSE_RESOLUTION / 4, distance_uncertainty=sigma)
+
+    distances = simulate.scan_ranges(POSE, np.zeros((0, 3)), model, np.random.default_rng(1))[0]
+
+    # Without cones every beam ends up on the flat ground
+    directions = model.rotated_directions(POSE[3])
+    errors = (distances + POSE[2] / directions[..., 2]).reshape(-1)
+
+    samples = len(errors)
+
+    assert abs(errors.mean()) < 5 * sigma / np.sqrt(samples)
+    assert abs(errors.std() / sigma - 1) < 5 / np.sqrt(2 * samples)
+
+
+def test_generate_point_cloud_dtype():
+    point_cloud = simulate.generate_point_cloud(POSE, CONES, np.random.default_rng(0))
+
+    assert point_cloud.dtype == POINT_DTYPE and point_cloud.flags.c_contiguous
+    assert point_cloud.shape[1] == 3
@@ -0,0 +1,120 @@
+import numpy as np
+
+import stream
+
+POINTS = np.random.default_rng(0).normal(size=(450, 3)).astype(np.float32)
+
+
+def encode_frame(frame_id: int, points: np.ndarray = POINTS) -> list:
+    """
+    Packets of a frame, in sending order.
+    """
+
+    firsts = stream.split_packets(len(points))
+
+    return [
+        stream.encode_packet(frame_id, index, len(firsts) - 1, first, points[first:end])
+        for (index, (first, end)) in enumerate(zip(firsts[:-1], firsts[1:]))
+    ]
+
+
+def add_all(assembler: stream.FrameAssembler, packets: list) -> list:
+    finished = []
+
+    for packet in packets:
+        finished.extend(assembler.add(packet, 0.0))
+
+    return finished
+
+
+def test_out_of_order_packets():
+    assembler = stream.FrameAssembler(len(POINTS), 3)
+    packets = encode_frame(0)
+
+    (frame,) = add_all(assembler, packets[::-1])
+
+    assert (frame["id"], frame["packets"], frame["lost"]) == (0, len(packets), 0)
+    np.testing.assert_array_equal(frame["points"], POINTS)
+    assert assembler.stats["complete_frames"] == 1
+
+
+def test_lost_packet_compacts_points():
+    assembler = stream.FrameAssembler(len(POINTS), 3)
+    packets = encode_frame(0)
+
+    assert add_all(assembler, packets[:1] + packets[2:]) == []
+
+    (frame,) = assembler.flush()
+
+    # The rows of the second packet are left out, the others move up
+    expected = np.concatenate((POINTS[:100], POINTS[200:]))
+
+    assert frame["lost"] == 1
+    np.testing.assert_array_equal(frame["points"], expected)
+    assert (assembler.stats["lost_packets"], assembler.stats["partial_frames"]) == (1, 1)
+
+
+def test_late_packet_is_ignored():
+    assembler = stream.FrameAssembler(len(POINTS), 3)
+    packets = encode_frame(0)
+
+    add_all(assembler, packets[1:])
+    add_all(assembler, encode_frame(1)[:1])
+    add_all(assembler, encode_frame(2)[:1])   # Pushes frame 0 out
+
+    assert assembler.add(packets[0], 0.0) == []
+    assert assembler.stats["late_packets"] == 1
+    assert 0 not in assembler.open
+
+
+def test_eviction_beyond_max_open():
+    assembler = stream.FrameAssembler(len(POINTS), 4, max_open=stream.MAX_OPEN_FRAMES)
+    firsts = [encode_frame(frame_id)[0] for frame_id in range(stream.MAX_OPEN_FRAMES + 1)]
+
+    assert add_all(assembler, firsts[:-1]) == []
+
+    (frame,) = assembler.add(firsts[-1], 0.0)
+
+    assert frame["id"] == 0 and frame["packets"] == 1
+    assert list(assembler.open) == list(range(1, stream.MAX_OPEN_FRAMES + 1))
+
+    # Only the open frames hold a buffer once the evicted one is released
+    assembler.release(frame)
+    assert len(assembler.free) == len(assembler.buffers) - stream.MAX_OPEN_FRAMES
+
+
+def test_overrun_without_free_buffer():
+    assembler = stream.FrameAssembler(len(POINTS), 1)
+
+    (frame,) = add_all(assembler, encode_frame(0))
+
+    assert add_all(assembler, encode_frame(1)) == []
+    assert assembler.stats["overruns"] == len(encode_frame(1))
+
+    assembler.release(frame)
+
+    assert len(add_all(assembler, encode_frame(2))) == 1
+
+
+def test_invalid_packets():
+    assembler = stream.FrameAssembler(len(POINTS), 2)
+    packet = encode_frame(0)[0]
+
+    add_all(assembler, [b"garbage", packet[:-4], packet, packet])
+
+    assert assembler.stats["invalid_packets"] == 3
+
+
+def test_receiver_drops_oldest_frame():
+    receiver = stream.PacketReceiver(len(POINTS), queue_size=2, max_open=1, workers=1)
+
+    for frame_id in range(4):
+        for packet in encode_frame(frame_id):
+            receiver.datagram_received(packet, ("127.0.0.1", 0))
+
+    assert [frame["id"] for frame in receiver.ready] == [2, 3]
+    assert receiver.dropped == 2
+
+    # The dropped frames gave back their buffers
+    assert len(receiver.assembler.free) == len(receiver.assembler.buffers) - 2
+    assert receiver.report()["dropped"] == 2
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import ransac
+import tune
+
+
+def result(p95_ms: float, recall: float, false_positives: float, centroid_error: float = 0.03) -> dict:
+    return {
+        "params": {}, "p95_ms": p95_ms, "recall": recall,
+        "false_positives": false_positives, "centroid_error": centroid_error
+    }
+
+
+def test_parameter_grid():
+    grid = {"RANSAC_MODE": ("fixed", "adaptive"), "NUM_PLANES": (100, 200, 300)}
+    params = tune.parameter_grid(grid)
+
+    assert len(params) == 6
+    assert params[0] == {"RANSAC_MODE": "fixed", "NUM_PLANES": 100}
+    assert params[-1] == {"RANSAC_MODE": "adaptive", "NUM_PLANES": 300}
+    assert len({tuple(param.items()) for param in params}) == 6
+
+    assert set(tune.GRID) <= set(tune.TUNED_MODULES)
+    assert set(tune.QUICK_GRID) <= set(tune.TUNED_MODULES)
+
+
+def test_overridden_restores_constants():
+    mode, planes = ransac.RANSAC_MODE, ransac.NUM_PLANES
+
+    with tune.overridden({"RANSAC_MODE": "exhaustive", "NUM_PLANES": 7}):
+        assert ransac.NUM_PLANES == 7
+
+        # The mode is read when find_best_plane is called
+        with pytest.raises(ValueError, match="exhaustive"):
+            ransac.find_best_plane(np.zeros((3, 3)), np.array([[0.0, 0.0, 1.0, 0.0]]))
+
+    assert (ransac.RANSAC_MODE, ransac.NUM_PLANES) == (mode, planes)
+
+
+def test_dominates():
+    fast = result(5.0, 0.9, 0.1)
+
+    assert tune.dominates(fast, result(6.0, 0.9, 0.1))
+    assert tune.dominates(fast, result(5.0, 0.8, 0.1))
+    assert tune.dominates(fast, result(5.0, 0.9, 0.2))
+
+    # Equal, or better on one cost and worse on another
+    assert not tune.dominates(fast, result(5.0, 0.9, 0.1))
+    assert not tune.dominates(fast, result(6.0, 0.95, 0.1))
+    assert not tune.dominates(result(6.0, 0.95, 0.1), fast)
+
+
+def test_pareto_front():
+    results = [
+        result(8.0, 0.95, 0.0),
+        result(3.0, 0.7, 0.2),
+        result(9.0, 0.9, 0.0),     # Dominated by the first
+        result(5.0, 0.9, 0.1),
+        result(5.0, 0.85, 0.1)     # Dominated by the previous
+    ]
+
+    front = tune.pareto_front(results)
+
+    assert front == [results[1], results[3], results[0]]
+
+
+def test_choose():
+    results = [
+        result(12.0, 0.99, 0.0),
+        result(8.0, 0.9, 0.2),
+        result(9.0, 0.9, 0.1, 0.05),
+        result(7.0, 0.9, 0.1, 0.04),
+        result(6.0, 0.9, 0.1, 0.04)
+    ]
+
+    # Within the budget: best recall, fewest false positives, smallest error, fastest
+    assert tune.choose(results, 10.0) is results[4]
+    assert tune.choose(results, 20.0) is results[0]
+
+    assert tune.choose(results, 5.0) is None
+    assert tune.choose([], 10.0) is None
+
+
+def test_format_constants():
+    assert tune.format_constants({"RANSAC_MODE": "fixed", "NUM_PLANES": 200}) == (
+        'RANSAC_MODE = "fixed"\nNUM_PLANES = 200'
+    )
@@ -0,0 +1,98 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+import utils
+
+from conftest import ROOT
+from lidar import LidarModel
+from constantspcl import MAX_DISTANCE_TO_SCAN, LIDAR_DISPLACEMENT
+
+MODELS = {
+    "default": None,
+    "narrow": LidarModel(
+        scan_field_width=np.deg2rad(90.0), scan_field_center_angle=np.deg2rad(20.0),
+        displacement=np.array([1.0, 0.5, 0.3]), orientation=np.deg2rad(-10.0)
+    )
+}
+
+
+@pytest.fixture(scope="module")
+def track():
+    return utils.load_track(os.path.join(ROOT, "track.json"))
+
+
+@pytest.mark.parametrize("model", MODELS.values(), ids=MODELS.keys())
+def test_query_cones_matches_brute_force(track, model):
+    queried = utils.query_cones(track, track["poses"], model)
+
+    assert len(queried) == len(track["poses"])
+
+    for (pose, cones) in zip(track["poses"], queried):
+        np.testing.assert_array_equal(cones, utils.get_closest_cones(pose, track["cones"], model))
+
+    # One pose at a time gives the same cones
+    np.testing.assert_array_equal(utils.query_cones(track, track["poses"][100], model), queried[100])
+
+
+def test_query_cones_full_field_is_distance(track):
+    # Every cone in range of a LiDAR over the vehicle origin that sees all
+    # around (the range depends on the height)
+    model = LidarModel(
+        scan_field_width=2 * np.pi, displacement=np.array([0.0, 0.0, LIDAR_DISPLACEMENT[2]])
+    )
+
+    for (pose, cones) in zip(track["poses"], utils.query_cones(track, track["poses"], model)):
+        vectors = track["cones"] - pose[:2]
+        mask = np.einsum("ij,ij->i", vectors, vectors) < MAX_DISTANCE_TO_SCAN**2
+
+        np.testing.assert_array_equal(cones, track["cones"][mask])
+
+
+def write_track(filename: str, shift: float = 0.0) -> None:
+    with open(os.path.join(ROOT, "track.json")) as file:
+        content = json.load(file)
+
+    for key in ("mark_cones", "blue_cones", "yellow_cones", "center_line"):
+        content[key] = (np.asarray(content[key]) + shift).tolist()
+
+    with open(filename, "w") as file:
+        json.dump(content, file)
+
+
+def test_load_track_cache(tmp_path):
+    filename, cache = str(tmp_path / "track.json"), str(tmp_path / "track.npz")
+    write_track(filename)
+
+    track = utils.load_track(filename, cache)
+    cached = utils.load_track(filename, cache)
+
+    for key in ("cones", "center_line", "poses"):
+        np.testing.assert_array_equal(cached[key], track[key])
+
+    for (key, value) in track["grid"].items():
+        np.testing.assert_array_equal(cached["grid"][key], value)
+
+    # A cache younger than the new track file is rebuilt
+    write_track(filename, shift=10.0)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    moved = utils.load_track(filename, cache)
+
+    np.testing.assert_allclose(moved["cones"], track["cones"] + 10.0)
+    assert utils.read_track_cache(cache, filename) is not None
+    np.testing.assert_allclose(utils.read_track_cache(cache, filename)["cones"], moved["cones"])
+
+
+def test_load_track_cache_stale_after_touch(tmp_path):
+    filename, cache = str(tmp_path / "track.json"), str(tmp_path / "track.npz")
+    write_track(filename)
+    utils.load_track(filename, cache)
+
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert utils.read_track_cache(cache, filename) is None
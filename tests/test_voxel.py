@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import voxel
+
+
+def clustered_points(seed: int = 0) -> np.ndarray:
+    """
+    Points around the centers of a few 1 m voxels, with voxel gaps between them.
+    """
+
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0.5, 0.5, 0.5], [2.5, 0.5, 0.5], [0.5, 2.5, 4.5], [4.5, 4.5, 2.5]])
+
+    return (np.repeat(centers, [5, 1, 3, 7], axis=0) + rng.uniform(-0.4, 0.4, (16, 3)))[rng.permutation(16)]
+
+
+@pytest.mark.parametrize("mode", ["first", "centroid"])
+def test_inverse_maps_points_to_their_voxel(mode):
+    points = clustered_points()
+    representatives, inverse = voxel.voxel_downsample(points, 1.0, mode)
+
+    assert len(representatives) == 4
+    assert inverse.shape == (len(points),)
+
+    # Every point shares the voxel of its representative
+    cells = np.floor(points - points.min(axis=0))
+    np.testing.assert_array_equal(np.floor(representatives - points.min(axis=0))[inverse], cells)
+
+    # and points of different voxels have different representatives
+    _, keys = np.unique(cells, axis=0, return_inverse=True)
+    assert len(np.unique(np.column_stack((keys.ravel(), inverse)), axis=0)) == 4
+
+
+def test_first_keeps_first_point():
+    points = clustered_points()
+    representatives, inverse = voxel.voxel_downsample(points, 1.0, "first")
+
+    for (row, representative) in enumerate(representatives):
+        np.testing.assert_array_equal(representative, points[np.flatnonzero(inverse == row)[0]])
+
+
+def test_centroid_is_mean_and_order_independent():
+    points = clustered_points()
+    representatives, inverse = voxel.voxel_downsample(points, 1.0, "centroid")
+
+    for (row, representative) in enumerate(representatives):
+        np.testing.assert_allclose(representative, points[inverse == row].mean(axis=0))
+
+    shuffled = points[np.random.default_rng(1).permutation(len(points))]
+
+    np.testing.assert_allclose(
+        np.sort(voxel.voxel_downsample(shuffled, 1.0, "centroid")[0], axis=0),
+        np.sort(representatives, axis=0)
+    )
+
+
+def test_centroid_keeps_dtype():
+    points = clustered_points().astype(np.float32)
+
+    assert voxel.voxel_downsample(points, 1.0, "centroid")[0].dtype == np.float32
+
+
+@pytest.mark.parametrize("mode", ["first", "centroid"])
+def test_empty_input(mode):
+    representatives, inverse = voxel.voxel_downsample(np.empty((0, 3)), 1.0, mode)
+
+    assert representatives.shape == (0, 3)
+    assert inverse.shape == (0,)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError, match="nearest"):
+        voxel.voxel_downsample(clustered_points(), 1.0, "nearest")
@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import inspect
+import argparse
+import itertools
+import contextlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import benchmark
+import constantspcl
+import lidar
+import pclbin
+import processing
+import ransac
+import rangeimage
+import simulate
+import utils
+
+from constants import *
+
+
+# Values tried for each tuned constant of constants.py (the adaptive RANSAC
+# stops early, NUM_PLANES only bounds it, the fixed one scores them all)
+GRID = {
+    "RANSAC_MODE": ("fixed", "adaptive"),
+    "NUM_PLANES": (100, 200, 300),
+    "DOWNSAMPLE_SIZE": (1000, 3000),
+    "DIST2PLANE_THRESHOLD": (0.04, 0.06, 0.08),
+    "MAX_DISTANCE": (0.2, 0.3),
+    "MIN_SAMPLES": (3, 5)
+}
+
+QUICK_GRID = {
+    "RANSAC_MODE": ("fixed", "adaptive"),
+    "NUM_PLANES": (100, 300),
+    "DOWNSAMPLE_SIZE": (1000, 3000),
+    "DIST2PLANE_THRESHOLD": (0.06,),
+    "MAX_DISTANCE": (0.3,),
+    "MIN_SAMPLES": (3, 5)
+}
+
+# Modules whose globals hold each tuned constant while the detection runs
+TUNED_MODULES = {
+    "RANSAC_MODE": (ransac,),
+    "NUM_PLANES": (ransac,),
+    "DOWNSAMPLE_SIZE": (ransac,),
+    "DIST2PLANE_THRESHOLD": (ransac,),
+    "MAX_DISTANCE": (processing,),
+    "MIN_SAMPLES": (processing,)
+}
+
+# Center line indexes between two frames of the tuning laps
+TUNE_STEP = 20
+
+# Per frame latency (p95) allowed to the chosen parameter set
+LATENCY_BUDGET_MS = 10.0
+
+# Code that shapes the simulated frames, a change of it invalidates them
+SIMULATION_MODULES = (constantspcl, lidar, rangeimage, simulate, utils)
+
+TRACK_FILE = "track.json"
+
+FRAMES_DIRECTORY = "tune_frames"
+OUTPUT_FILE = "tune.json"
+
+# Frames of the sweep, loaded once per worker process
+FRAMES = None
+
+
+def parameter_grid(grid: dict = GRID) -> list:
+    """
+    Every combination of the values of a grid.
+
+    Args:
+        grid (dict): values of each constant. Defaults to GRID.
+
+    Returns:
+        list: parameter sets {constant: value}.
+    """
+
+    names = list(grid)
+
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+@contextlib.contextmanager
+def overridden(params: dict):
+    """
+    Run a with block with other values of the tuned constants.
+
+    Args:
+        params (dict): value of some constants of TUNED_MODULES.
+    """
+
+    previous = []
+
+    try:
+        for (name, value) in params.items():
+            for module in TUNED_MODULES[name]:
+                previous.append((module, name, getattr(module, name)))
+                setattr(module, name, value)
+
+        yield
+    finally:
+        for (module, name, value) in reversed(previous):
+            setattr(module, name, value)
+
+
+def frames_key(surfaces: dict, step: int, seed: int) -> str:
+    """
+    Digest of everything the tuning frames depend on: the ground planes,
+    the lap sampling, the seed, the track and the simulator code (with the
+    sensor constants of constantspcl).
+
+    Args:
+        surfaces (dict): ground of each lap.
+        step (int): center line indexes between two frames.
+        seed (int): base seed of the noise and of the shuffles.
+
+    Returns:
+        str: hexadecimal SHA-256 digest.
+    """
+
+    digest = hashlib.sha256()
+
+    digest.update(json.dumps({
+        "surfaces": {
+            name: None if surface is None else np.asarray(surface, dtype=float).tolist()
+            for (name, surface) in sorted(surfaces.items())
+        },
+        "step": step,
+        "seed": seed
+    }).encode())
+
+    with open(TRACK_FILE, "rb") as file:
+        digest.update(file.read())
+
+    for module in SIMULATION_MODULES:
+        digest.update(inspect.getsource(module).encode())
+
+    digest.update(inspect.getsource(benchmark.lap_frames).encode())
+
+    return digest.hexdigest()
+
+
+def prepare_frames(
+    directory: str = FRAMES_DIRECTORY, surfaces: dict = benchmark.SURFACES,
+    step: int = TUNE_STEP, seed: int = 0
+) -> int:
+    """
+    Simulate the tuning laps once and store them, so every worker maps the
+    same frames instead of simulating them again. Stored frames are reused
+    while frames_key does not change.
+
+    Args:
+        directory (str, optional): where the frames are stored. Defaults to FRAMES_DIRECTORY.
+        surfaces (dict, optional): ground of each lap. Defaults to benchmark.SURFACES.
+        step (int, optional): center line indexes between two frames. Defaults to TUNE_STEP.
+        seed (int, optional): base seed of the noise and of the shuffles. Defaults to 0.
+
+    Returns:
+        int: number of frames.
+    """
+
+    key = frames_key(surfaces, step, seed)
+    settings_file = os.path.join(directory, "settings.json")
+
+    if os.path.exists(settings_file):
+        with open(settings_file) as file:
+            stored = json.load(file)
+
+        if stored.get("key") == key:
+            return stored["frames"]
+
+    os.makedirs(directory, exist_ok=True)
+
+    cones = []
+
+    for (name, surface) in surfaces.items():
+        rng = np.random.default_rng(seed)
+
+        for (image, frame_cones) in benchmark.lap_frames(surface, step, seed):
+            # Sensor captures are not ordered like the simulator output
+            points = image.points()
+            rng.shuffle(points)
+
+            pclbin.write_binary(os.path.join(directory, f"frame_{len(cones)}{pclbin.BINARY_EXTENSION}"), points)
+            cones.append(frame_cones)
+
+    np.savez(os.path.join(directory, "cones.npz"), *cones)
+
+    with open(settings_file, "w") as file:
+        json.dump({"key": key, "frames": len(cones)}, file)
+
+    return len(cones)
+
+
+def load_frames(directory: str = FRAMES_DIRECTORY) -> list:
+    """
+    Map the frames stored by prepare_frames.
+
+    Args:
+        directory (str, optional): where the frames are stored. Defaults to FRAMES_DIRECTORY.
+
+    Returns:
+        list: point cloud and cones in LiDAR frame of each frame.
+    """
+
+    with np.load(os.path.join(directory, "cones.npz")) as content:
+        cones = [content[f"arr_{index}"] for index in range(len(content.files))]
+
+    return [
+        (pclbin.read_binary(os.path.join(directory, f"frame_{index}{pclbin.BINARY_EXTENSION}")), frame_cones)
+        for (index, frame_cones) in enumerate(cones)
+    ]
+
+
+def evaluate(params: dict, frames: list) -> dict:
+    """
+    Detect the cones of every frame with a parameter set (RANSAC mode).
+
+    Args:
+        params (dict): value of some tuned constants.
+        frames (list): returned by load_frames.
+
+    Returns:
+        dict: {"params", "frames", "median_ms", "p95_ms", "recall",
+            "false_positives", "centroid_error"} with the false positives
+            per frame and the mean horizontal error in meters.
+    """
+
+    times = []
+    scores = np.zeros(4)
+
+    with overridden(params):
+        np.random.seed(0)
+
+        # Warm up the caches of this parameter set
+        processing.processing(frames[0][0], "ransac")
+
+        for (points, cones) in frames:
+            start = time.perf_counter()
+            centroids = processing.processing(points, "ransac")
+            times.append(time.perf_counter() - start)
+
+            scores += benchmark.score_detections(centroids, cones)
+
+    return {
+        "params": params,
+        "frames": len(frames),
+        "median_ms": 1e3 * float(np.median(times)),
+        "p95_ms": 1e3 * float(np.percentile(times, 95)),
+        "recall": scores[1] / max(1, scores[0]),
+        "false_positives": scores[2] / len(frames),
+        "centroid_error": scores[3] / max(1, scores[1])
+    }
+
+
+def init_worker(directory: str) -> None:
+    global FRAMES
+    FRAMES = load_frames(directory)
+
+
+def evaluate_loaded(params: dict) -> dict:
+    return evaluate(params, FRAMES)
+
+
+def sweep(
+    grid: dict = GRID, directory: str = FRAMES_DIRECTORY,
+    surfaces: dict = benchmark.SURFACES, step: int = TUNE_STEP,
+    seed: int = 0, workers: int = 1
+) -> list:
+    """
+    Evaluate every parameter set of a grid over the tuning laps. Worker
+    processes share the latency of the machine, so the timings are only
+    comparable between runs with the same number of workers.
+
+    Args:
+        grid (dict, optional): values of each constant. Defaults to GRID.
+        directory (str, optional): where the frames are stored. Defaults to FRAMES_DIRECTORY.
+        surfaces (dict, optional): ground of each lap. Defaults to benchmark.SURFACES.
+        step (int, optional): center line indexes between two frames. Defaults to TUNE_STEP.
+        seed (int, optional): base seed of the simulated laps. Defaults to 0.
+        workers (int, optional): processes evaluating the parameter sets. Defaults to 1.
+
+    Returns:
+        list: results of evaluate, in the order of parameter_grid.
+    """
+
+    prepare_frames(directory, surfaces, step, seed)
+    params = parameter_grid(grid)
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(directory,)) as executor:
+            return list(executor.map(evaluate_loaded, params))
+
+    frames = load_frames(directory)
+
+    return [evaluate(param, frames) for param in params]
+
+
+def dominates(first: dict, second: dict) -> bool:
+    """
+    Check whether a result is at least as good as another one on latency
+    (p95), recall and false positives, and better on one of them.
+
+    Args:
+        first (dict): returned by evaluate.
+        second (dict): returned by evaluate.
+
+    Returns:
+        bool: True if first dominates second.
+    """
+
+    def costs(result: dict) -> tuple:
+        return result["p95_ms"], -result["recall"], result["false_positives"]
+
+    pairs = list(zip(costs(first), costs(second)))
+
+    return all(a <= b for (a, b) in pairs) and any(a < b for (a, b) in pairs)
+
+
+def pareto_front(results: list) -> list:
+    """
+    Results that no other result dominates, fastest first.
+
+    Args:
+        results (list): returned by sweep.
+
+    Returns:
+        list: the Pareto optimal results.
+    """
+
+    front = [
+        result for result in results
+        if not any(dominates(other, result) for other in results)
+    ]
+
+    return sorted(front, key=lambda result: result["p95_ms"])
+
+
+def choose(results: list, budget_ms: float = LATENCY_BUDGET_MS) -> dict:
+    """
+    Best detection quality within a latency budget: highest recall, then
+    fewest false positives, then smallest centroid error, then fastest.
+
+    Args:
+        results (list): returned by sweep.
+        budget_ms (float, optional): largest p95 latency per frame.
+            Defaults to LATENCY_BUDGET_MS.
+
+    Returns:
+        dict: the chosen result, None when nothing fits the budget.
+    """
+
+    fitting = [result for result in results if result["p95_ms"] <= budget_ms]
+
+    if not fitting:
+        return None
+
+    return min(fitting, key=lambda result: (
+        -result["recall"], result["false_positives"], result["centroid_error"], result["p95_ms"]
+    ))
+
+
+def format_constants(params: dict) -> str:
+    """
+    Write a parameter set as constants.py lines.
+
+    Args:
+        params (dict): value of some tuned constants.
+
+    Returns:
+        str: one "NAME = value" line per constant.
+    """
+
+    # Strings in double quotes, like in constants.py
+    return "\n".join(
+        f"{name} = {json.dumps(value) if isinstance(value, str) else repr(value)}"
+        for (name, value) in params.items()
+    )
+
+
+def print_front(front: list) -> None:
+    """
+    Print the Pareto optimal parameter sets.
+
+    Args:
+        front (list): returned by pareto_front.
+    """
+
+    for result in front:
+        print(
+            "  p95 %7.2f ms  median %7.2f ms  recall %5.1f%%  %5.2f false positives/frame"
+            "  error %5.2f cm  %s"
+            % (result["p95_ms"], result["median_ms"], 100 * result["recall"],
+               result["false_positives"], 100 * result["centroid_error"],
+               " ".join(f"{name}={value}" for (name, value) in result["params"].items()))
+        )
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Sweep the RANSAC and DBSCAN constants over simulated laps."
+    )
+    parser.add_argument("--budget", type=float, default=LATENCY_BUDGET_MS, help="p95 ms per frame")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--step", type=int, default=TUNE_STEP)
+    parser.add_argument("--seed", type=int, default=0, help="base seed of the simulated laps")
+    parser.add_argument("--frames", default=FRAMES_DIRECTORY, help="directory of the simulated frames")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--quick", action="store_true", help="sweep QUICK_GRID")
+    args = parser.parse_args(argv)
+
+    results = sweep(
+        QUICK_GRID if args.quick else GRID, args.frames,
+        step=args.step, seed=args.seed, workers=args.workers
+    )
+
+    front = pareto_front(results)
+    chosen = choose(results, args.budget)
+
+    print("%d parameter sets over %d frames, Pareto front:" % (len(results), results[0]["frames"]))
+    print_front(front)
+
+    if chosen is None:
+        print("Nothing fits a p95 budget of %g ms." % args.budget)
+    else:
+        print("Best within a p95 budget of %g ms:" % args.budget)
+        print_front([chosen])
+        print(format_constants(chosen["params"]))
+
+    with open(args.output, "w") as file:
+        json.dump({"budget_ms": args.budget, "results": results, "front": front, "chosen": chosen}, file, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,36 @@
+import os
 import json
 
 import numpy as np
 
-from constants import MAX_DISTANCE_TO_SCAN
+from lidar import LidarModel, get_default_model
 
+from constantspcl import CONE_RADIUS, TRACK_CELL_SIZE
 
-def load_track(filename: str = "track.json") -> dict:
+
+def load_track(filename: str = "track.json", cache: str = None) -> dict:
     """
-    Load track from JSON file.
+    Load track from JSON file, with the pose of every center line index
+    and a grid index of the cones precomputed.
 
     Args:
         filename (str, optional): name of the JSON file
             that will be read. Defaults to "track.json".
 
+        cache (str, optional): name of a .npz file that keeps the loaded
+            track. It is read instead of the JSON file while it is newer,
+            otherwise it is rebuilt. Defaults to None (no cache).
+
     Returns:
-        dict: that represents the track {"cones", "center_line"}.
+        dict: that represents the track {"cones", "center_line", "poses", "grid"}.
     """
 
+    if cache is not None:
+        track = read_track_cache(cache, filename)
+
+        if track is not None:
+            return track
+
     track = {"cones": None, "center_line": None}
 
     with open(filename) as file:
@@ -30,9 +44,95 @@ def load_track(filename: str = "track.json") -> dict:
 
         track["center_line"] = np.asarray(content["center_line"])
 
+    track["poses"] = get_vehicle_poses(track["center_line"])
+    track["grid"] = build_cone_grid(track["cones"])
+
+    if cache is not None:
+        write_track_cache(cache, filename, track)
+
+    return track
+
+
+def write_track_cache(cache: str, filename: str, track: dict) -> None:
+    """
+    Store a loaded track with its pose table and cone grid.
+
+    Args:
+        cache (str): name of the .npz file that will be created.
+        filename (str): name of the JSON file of the track.
+        track (dict): returned by load_track.
+    """
+
+    grid = {f"grid_{key}": value for (key, value) in track["grid"].items()}
+
+    np.savez(
+        cache,
+        source_mtime=os.stat(filename).st_mtime_ns,
+        cones=track["cones"],
+        center_line=track["center_line"],
+        poses=track["poses"],
+        **grid
+    )
+
+
+def read_track_cache(cache: str, filename: str) -> dict:
+    """
+    Load a track stored by write_track_cache.
+
+    Args:
+        cache (str): name of the .npz file.
+        filename (str): name of the JSON file of the track.
+
+    Returns:
+        dict: the track, or None when the cache is missing, stale
+            or built with another cell size.
+    """
+
+    if not os.path.exists(cache):
+        return None
+
+    with np.load(cache) as content:
+        if content["source_mtime"] != os.stat(filename).st_mtime_ns:
+            return None
+
+        if content["grid_cell_size"] != TRACK_CELL_SIZE:
+            return None
+
+        track = {key: content[key] for key in ("cones", "center_line", "poses")}
+        track["grid"] = {
+            key[len("grid_"):]: content[key]
+            for key in content.files if key.startswith("grid_")
+        }
+
     return track
 
 
+def get_vehicle_poses(center_line: np.ndarray) -> np.ndarray:
+    """
+    Pose of the vehicle at every index of the center line, heading
+    to the next point (the last one keeps the previous heading).
+
+    Args:
+        center_line (np.ndarray): 2D coordinates of the center line in rows.
+
+    Returns:
+        np.ndarray: vehicle poses in global frame [x, y, z, yaw] in rows.
+    """
+
+    poses = np.zeros((len(center_line), 4))
+    poses[:, :2] = center_line
+
+    if len(center_line) < 2:
+        return poses
+
+    directions = np.diff(center_line, axis=0)
+
+    poses[:-1, 3] = np.arctan2(directions[:, 1], directions[:, 0])
+    poses[-1, 3] = poses[-2, 3]
+
+    return poses
+
+
 def get_vehicle_pose(track: dict, index: int) -> np.ndarray:
     """
     Get vehicle pose from some position in the track.
@@ -45,6 +145,9 @@ def get_vehicle_pose(track: dict, index: int) -> np.ndarray:
         np.ndarray: vehicle pose in global frame [x, y, z, yaw].
     """
 
+    if "poses" in track:
+        return track["poses"][index].copy()
+
     pose = np.zeros(4)
 
     direction = (
@@ -57,20 +160,185 @@ def get_vehicle_pose(track: dict, index: int) -> np.ndarray:
     return pose
 
 
-def get_closest_cones(pose: np.ndarray, cones: np.ndarray) -> np.ndarray:
+def build_cone_grid(cones: np.ndarray, cell_size: float = TRACK_CELL_SIZE) -> dict:
+    """
+    Bucket the cones in a uniform 2D grid, so a range query only
+    visits the cells around the LiDAR instead of the whole track.
+
+    Args:
+        cones (np.ndarray): all cones with 2D coordinates in rows.
+        cell_size (float, optional): side of the cells. Defaults to TRACK_CELL_SIZE.
+
+    Returns:
+        dict: grid {"origin", "cell_size", "dims", "order", "starts"} where
+            the cones of cell c are order[starts[c]:starts[c+1]] and the cell
+            of (i, j) is i * dims[1] + j.
+    """
+
+    if len(cones) == 0:
+        origin = np.zeros(2)
+        cells = np.zeros((0, 2), dtype=np.int64)
+    else:
+        origin = cones[:, :2].min(axis=0)
+        cells = ((cones[:, :2] - origin) / cell_size).astype(np.int64)
+
+    dims = cells.max(axis=0, initial=0) + 1
+    keys = cells[:, 0] * dims[1] + cells[:, 1]
+
+    order = np.argsort(keys, kind="stable")
+    starts = np.searchsorted(keys[order], np.arange(dims[0] * dims[1] + 1))
+
+    return {
+        "origin": origin,
+        "cell_size": np.float64(cell_size),
+        "dims": dims,
+        "order": order,
+        "starts": starts
+    }
+
+
+def get_lidar_poses(poses: np.ndarray, model: LidarModel) -> np.ndarray:
+    """
+    LiDAR position and yaw of some vehicle poses.
+
+    Args:
+        poses (np.ndarray): vehicle poses in global frame [x, y, z, yaw] in rows.
+        model (LidarModel): sensor profile.
+
+    Returns:
+        np.ndarray: LiDAR poses in global frame [x, y, z, yaw] in rows.
+    """
+
+    cos = np.cos(poses[:, 3])
+    sin = np.sin(poses[:, 3])
+
+    lidar = poses.copy()
+    lidar[:, 0] += cos * model.displacement[0] - sin * model.displacement[1]
+    lidar[:, 1] += sin * model.displacement[0] + cos * model.displacement[1]
+    lidar[:, 2] += model.displacement[2]
+    lidar[:, 3] += model.orientation
+
+    return lidar
+
+
+def visible_mask(lidar: np.ndarray, cones: np.ndarray, model: LidarModel) -> np.ndarray:
+    """
+    Cones close enough to be detected and whose silhouette reaches the
+    field of view of the LiDAR.
+
+    Args:
+        lidar (np.ndarray): LiDAR poses in global frame [x, y, z, yaw] in
+            rows, one for each cone.
+        cones (np.ndarray): cones with 2D coordinates in rows.
+        model (LidarModel): sensor profile.
+
+    Returns:
+        np.ndarray: mask of the visible cones.
+    """
+
+    vectors = cones[:, :2] - lidar[:, :2]
+    squared = np.einsum("ij,ij->i", vectors, vectors)
+
+    visible = squared < model.max_distance_to_scan**2
+
+    if model.scan_field_width >= 2 * np.pi:
+        return visible
+
+    # Azimuth of the cone from the center of the field of view, in [-pi, pi)
+    azimuths = np.mod(
+        np.arctan2(vectors[:, 1], vectors[:, 0])
+        - lidar[:, 3] - model.scan_field_center_angle + np.pi,
+        2 * np.pi
+    ) - np.pi
+
+    # A cone is seen while its silhouette overlaps the field of view
+    ranges = np.sqrt(squared)
+    margins = np.arcsin(np.minimum(1.0, CONE_RADIUS / np.maximum(ranges, CONE_RADIUS)))
+
+    return visible & (np.abs(azimuths) <= 0.5 * model.scan_field_width + margins)
+
+
+def get_closest_cones(
+    pose: np.ndarray, cones: np.ndarray, model: LidarModel = None
+) -> np.ndarray:
     """
-    Get only the cones that are close enough to be detected.
+    Get only the cones that are close enough to be detected
+    and inside of the field of view.
 
     Args:
         pose (np.ndarray): vehicle pose in global frame [x, y, z, yaw].
-        cones (np.ndarray): all cones with 3D coordinates in rows.
+        cones (np.ndarray): all cones with 2D coordinates in rows.
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
+
+    Returns:
+        np.ndarray: only visible cones with 2D coordinates in rows.
+    """
+
+    model = get_default_model() if model is None else model
+
+    lidar = get_lidar_poses(np.asarray(pose, dtype=float)[np.newaxis], model)
+
+    return cones[visible_mask(lidar, cones, model)]
+
+
+def query_cones(track: dict, poses: np.ndarray, model: LidarModel = None):
+    """
+    Visible cones of one or several vehicle poses, looked up in the
+    cone grid of the track.
+
+    Args:
+        track (dict): returned by load_track.
+        poses (np.ndarray): vehicle pose [x, y, z, yaw] or poses in rows.
+        model (LidarModel, optional): sensor profile. Defaults to constantspcl.
 
     Returns:
-        np.ndarray: only visible cones with 3D coordinates in rows.
+        visible cones with 2D coordinates in rows (np.ndarray) for a single
+            pose, a list of them for several poses.
     """
 
-    vectors = cones - pose[:2]
+    model = get_default_model() if model is None else model
+
+    poses = np.asarray(poses, dtype=float)
+    single = poses.ndim == 1
+
+    lidar = get_lidar_poses(np.atleast_2d(poses), model)
+
+    grid = track["grid"]
+    dims = grid["dims"]
+
+    # Cells around each LiDAR that can hold a cone in range
+    reach = int(np.ceil(model.max_distance_to_scan / grid["cell_size"]))
+    offsets = np.arange(-reach, reach + 1)
+
+    centers = np.floor((lidar[:, :2] - grid["origin"]) / grid["cell_size"]).astype(np.int64)
+
+    rows = centers[:, 0, np.newaxis, np.newaxis] + offsets[:, np.newaxis]
+    columns = centers[:, 1, np.newaxis, np.newaxis] + offsets
+
+    inside = (rows >= 0) & (rows < dims[0]) & (columns >= 0) & (columns < dims[1])
+    cells = np.where(inside, rows * dims[1] + columns, 0).reshape(len(lidar), -1)
+
+    firsts = grid["starts"][cells]
+    counts = np.where(inside.reshape(len(lidar), -1), grid["starts"][cells + 1] - firsts, 0)
+
+    # Candidate (pose, cone) pairs, cell after cell
+    counts = counts.ravel()
+    total = counts.sum()
+
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    candidates = grid["order"][np.repeat(firsts.ravel(), counts) + offsets]
+    owners = np.repeat(np.arange(len(lidar)), counts.reshape(len(lidar), -1).sum(axis=1))
+
+    visible = visible_mask(lidar[owners], track["cones"][candidates], model)
+
+    # Keep the track order of the cones of each pose
+    owners = owners[visible]
+    candidates = candidates[visible]
+
+    order = np.lexsort((candidates, owners))
+    candidates = candidates[order]
 
-    mask = np.einsum("ij,ij->i", vectors, vectors) < MAX_DISTANCE_TO_SCAN**2
+    bounds = np.cumsum(np.bincount(owners, minlength=len(lidar)))[:-1]
+    cones = np.split(track["cones"][candidates], bounds)
 
-    return cones[mask]
+    return cones[0] if single else cones
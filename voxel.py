@@ -0,0 +1,81 @@
+import numpy as np
+
+from constants import VOXEL_MODE
+
+
+def voxel_grid(points: np.ndarray, leaf_size: float) -> dict:
+    """
+    Group the points by the cubic voxel that holds them.
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+        leaf_size (float): side of the voxels.
+
+    Returns:
+        dict: grid {"order", "starts", "counts", "inverse"} where the points
+            sorted by "order" are stored voxel after voxel and "inverse"
+            is the voxel of each point.
+    """
+
+    if len(points) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return {"order": empty, "starts": empty, "counts": empty, "inverse": empty}
+
+    # Offset to the corner so the truncation is a floor
+    cells = ((points - points.min(axis=0)) / leaf_size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    order = np.argsort(keys)
+    ordered = keys[order]
+
+    starts = np.flatnonzero(
+        np.concatenate(([True], ordered[1:] != ordered[:-1]))
+    )
+    counts = np.diff(np.append(starts, len(points)))
+
+    inverse = np.empty(len(points), dtype=np.int64)
+    inverse[order] = np.repeat(np.arange(len(starts)), counts)
+
+    return {"order": order, "starts": starts, "counts": counts, "inverse": inverse}
+
+
+def voxel_downsample(
+    points: np.ndarray, leaf_size: float, mode: str = VOXEL_MODE
+) -> tuple:
+    """
+    Keep one representative point per voxel, so the size of the result is
+    bounded by the volume instead of the density. The voxels are always the
+    same, but only the "centroid" representatives (up to rounding) do not
+    depend on the order of the points.
+
+    Args:
+        points (np.ndarray): 3D coordinates in rows.
+        leaf_size (float): side of the voxels.
+
+        mode (str, optional): "first" keeps the first point (in the input
+            order) of each voxel, "centroid" the mean of its points.
+            Defaults to VOXEL_MODE.
+
+    Returns:
+        tuple: representatives in rows and the index of the representative
+            of each original point (original point i is represented by
+            row inverse[i]).
+    """
+
+    grid = voxel_grid(points, leaf_size)
+
+    if len(points) == 0:
+        return points[:0], grid["inverse"]
+
+    if mode == "first":
+        first = np.minimum.reduceat(grid["order"], grid["starts"])
+        return points[first], grid["inverse"]
+
+    if mode != "centroid":
+        raise ValueError(f"unknown voxel mode {mode!r}")
+
+    sums = np.add.reduceat(points[grid["order"]], grid["starts"])
+
+    return sums / grid["counts"][:, np.newaxis].astype(sums.dtype), grid["inverse"]